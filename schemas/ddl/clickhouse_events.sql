@@ -13,23 +13,101 @@ CREATE TABLE IF NOT EXISTS analytics.events
     properties String DEFAULT '{}',
     lib LowCardinality(Nullable(String)) DEFAULT NULL,
     lib_version Nullable(String) DEFAULT NULL,
-    device_id Nullable(String) DEFAULT NULL
+    device_id Nullable(String) DEFAULT NULL,
+    -- Extracted property columns, filled by the consumer per CONSUMER_PROPERTY_COLUMNS
+    utm_source LowCardinality(Nullable(String)) DEFAULT NULL,
+    utm_medium LowCardinality(Nullable(String)) DEFAULT NULL,
+    utm_campaign LowCardinality(Nullable(String)) DEFAULT NULL,
+    current_url Nullable(String) DEFAULT NULL,
+    -- All properties as a map (numeric ones also in properties_num), filled with CONSUMER_PROPERTIES_MAP
+    properties_map Map(LowCardinality(String), String),
+    properties_num Map(LowCardinality(String), Float64),
+    -- Skips granules without the event for queries the projection can't serve (e.g. property filters)
+    INDEX event_idx event TYPE bloom_filter(0.01) GRANULARITY 4,
+    -- Same rows sorted by event, for event-filtered trends and funnels. Only the columns
+    -- those queries read, so it costs a fraction of the properties-heavy table.
+    PROJECTION events_by_event
+    (
+        SELECT project_id, event, timestamp, distinct_id
+        ORDER BY project_id, event, timestamp
+    )
 )
 ENGINE = MergeTree()
 PARTITION BY toYYYYMM(timestamp)
 ORDER BY (project_id, toDate(timestamp), distinct_id, timestamp)
 TTL toDateTime(timestamp) + INTERVAL 90 DAY
-SETTINGS index_granularity = 8192;
-
--- Optional: materialized view for daily event counts per project (for fast dashboards)
--- CREATE MATERIALIZED VIEW analytics.events_daily
--- ENGINE = SummingMergeTree()
--- PARTITION BY toYYYYMM(date)
--- ORDER BY (project_id, date, event)
--- AS SELECT
---     toDate(timestamp) AS date,
---     project_id,
---     event,
---     count() AS cnt
--- FROM analytics.events
--- GROUP BY date, project_id, event;
+-- non_replicated_deduplication_window: keep recent insert tokens so a repeated consumer
+-- insert (same insert_deduplication_token) is dropped. Replicated tables use
+-- replicated_deduplication_window instead.
+SETTINGS index_granularity = 8192, non_replicated_deduplication_window = 1000;
+
+-- Trend rollups per (project_id, event), kept up to date by materialized views on every insert.
+-- Counts are summed (SummingMergeTree), unique users are uniq states (AggregatingMergeTree).
+-- Query API answers trends without property filters from these (services/query-api/app/rollups.py).
+CREATE TABLE IF NOT EXISTS analytics.events_hourly
+(
+    project_id String,
+    event String,
+    hour DateTime,
+    count UInt64
+)
+ENGINE = SummingMergeTree(count)
+PARTITION BY toYYYYMM(hour)
+ORDER BY (project_id, event, hour)
+TTL hour + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_hourly_mv TO analytics.events_hourly AS
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+CREATE TABLE IF NOT EXISTS analytics.events_daily
+(
+    project_id String,
+    event String,
+    day Date,
+    count UInt64
+)
+ENGINE = SummingMergeTree(count)
+PARTITION BY toYYYYMM(day)
+ORDER BY (project_id, event, day)
+TTL day + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_daily_mv TO analytics.events_daily AS
+SELECT project_id, event, toDate(timestamp) AS day, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, day;
+
+CREATE TABLE IF NOT EXISTS analytics.events_hourly_users
+(
+    project_id String,
+    event String,
+    hour DateTime,
+    users AggregateFunction(uniq, String)
+)
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(hour)
+ORDER BY (project_id, event, hour)
+TTL hour + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_hourly_users_mv TO analytics.events_hourly_users AS
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+CREATE TABLE IF NOT EXISTS analytics.events_daily_users
+(
+    project_id String,
+    event String,
+    day Date,
+    users AggregateFunction(uniq, String)
+)
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(day)
+ORDER BY (project_id, event, day)
+TTL day + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_daily_users_mv TO analytics.events_daily_users AS
+SELECT project_id, event, toDate(timestamp) AS day, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, day;
@@ -0,0 +1,13 @@
+-- Migration: event skip index and event-ordered projection on an existing analytics.events (run once)
+-- MATERIALIZE rewrites existing parts in the background (mutations); watch system.mutations.
+-- Run: clickhouse-client --multiquery < schemas/ddl/clickhouse_events_migrate_event_projection.sql
+
+ALTER TABLE analytics.events ADD INDEX IF NOT EXISTS event_idx event TYPE bloom_filter(0.01) GRANULARITY 4;
+ALTER TABLE analytics.events MATERIALIZE INDEX event_idx;
+
+ALTER TABLE analytics.events ADD PROJECTION IF NOT EXISTS events_by_event
+(
+    SELECT project_id, event, timestamp, distinct_id
+    ORDER BY project_id, event, timestamp
+);
+ALTER TABLE analytics.events MATERIALIZE PROJECTION events_by_event;
@@ -0,0 +1,5 @@
+-- Migration: enable insert deduplication on a non-replicated analytics.events (run once on existing tables)
+-- The consumer sends an insert_deduplication_token per batch; MergeTree ignores it unless this window is set.
+-- Run after init: clickhouse-client < schemas/ddl/clickhouse_events_migrate_insert_dedup.sql
+
+ALTER TABLE analytics.events MODIFY SETTING non_replicated_deduplication_window = 1000;
@@ -0,0 +1,9 @@
+-- Migration: optional Map storage for event properties (run once, then backfill)
+-- properties_map holds every property as text (strings as-is, other values as JSON), properties_num the
+-- numeric ones. Enable writes with CONSUMER_PROPERTIES_MAP=true, fill older rows with
+--   python -m app.backfill_property_columns --column properties_map --column properties_num   (services/consumer)
+-- then set QUERY_PROPERTIES_MAP=true so property filters and breakdowns read the maps.
+-- Run: clickhouse-client --multiquery < schemas/ddl/clickhouse_events_migrate_properties_map.sql
+
+ALTER TABLE analytics.events ADD COLUMN IF NOT EXISTS properties_map Map(LowCardinality(String), String);
+ALTER TABLE analytics.events ADD COLUMN IF NOT EXISTS properties_num Map(LowCardinality(String), Float64);
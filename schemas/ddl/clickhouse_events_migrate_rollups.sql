@@ -0,0 +1,94 @@
+-- Migration: add trend rollup tables to an existing analytics.events (run once)
+-- Stop the consumers first and start them again after the backfill below: events inserted
+-- between creating the views and the backfill would otherwise be counted twice.
+-- Run: clickhouse-client --multiquery < schemas/ddl/clickhouse_events_migrate_rollups.sql
+-- Deploy query-api with rollups (QUERY_ROLLUPS_ENABLED, default true) only after this has run.
+
+CREATE TABLE IF NOT EXISTS analytics.events_hourly
+(
+    project_id String,
+    event String,
+    hour DateTime,
+    count UInt64
+)
+ENGINE = SummingMergeTree(count)
+PARTITION BY toYYYYMM(hour)
+ORDER BY (project_id, event, hour)
+TTL hour + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_hourly_mv TO analytics.events_hourly AS
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+CREATE TABLE IF NOT EXISTS analytics.events_daily
+(
+    project_id String,
+    event String,
+    day Date,
+    count UInt64
+)
+ENGINE = SummingMergeTree(count)
+PARTITION BY toYYYYMM(day)
+ORDER BY (project_id, event, day)
+TTL day + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_daily_mv TO analytics.events_daily AS
+SELECT project_id, event, toDate(timestamp) AS day, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, day;
+
+CREATE TABLE IF NOT EXISTS analytics.events_hourly_users
+(
+    project_id String,
+    event String,
+    hour DateTime,
+    users AggregateFunction(uniq, String)
+)
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(hour)
+ORDER BY (project_id, event, hour)
+TTL hour + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_hourly_users_mv TO analytics.events_hourly_users AS
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+CREATE TABLE IF NOT EXISTS analytics.events_daily_users
+(
+    project_id String,
+    event String,
+    day Date,
+    users AggregateFunction(uniq, String)
+)
+ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(day)
+ORDER BY (project_id, event, day)
+TTL day + INTERVAL 90 DAY;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics.events_daily_users_mv TO analytics.events_daily_users AS
+SELECT project_id, event, toDate(timestamp) AS day, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, day;
+
+-- Backfill from existing events.
+INSERT INTO analytics.events_hourly
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+INSERT INTO analytics.events_daily
+SELECT project_id, event, toDate(timestamp) AS day, count() AS count
+FROM analytics.events
+GROUP BY project_id, event, day;
+
+INSERT INTO analytics.events_hourly_users
+SELECT project_id, event, toStartOfHour(timestamp) AS hour, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, hour;
+
+INSERT INTO analytics.events_daily_users
+SELECT project_id, event, toDate(timestamp) AS day, uniqState(distinct_id) AS users
+FROM analytics.events
+GROUP BY project_id, event, day;
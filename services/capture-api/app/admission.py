@@ -0,0 +1,82 @@
+"""Admission control and load shedding for capture endpoints.
+
+A bounded semaphore caps requests that are producing at once; up to
+``admission_max_queue`` more may wait for a slot for ``admission_queue_timeout_seconds``.
+Requests are shed early (503 + Retry-After) before their body is read when the queue
+is full, the producer has too many undelivered records, or recent produce latency is
+above ``admission_latency_threshold_seconds``. Projects listed in
+``admission_priority_projects`` only get shed when the queue itself is full; other
+projects are shed at ``admission_low_priority_queue_fraction`` of the queue and on
+latency pressure.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.config import settings
+from app.kafka_producer import inflight_records, recent_produce_latency
+from app.metrics import ADMISSION_DECISIONS, ADMISSION_INFLIGHT, ADMISSION_QUEUE_DEPTH
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self) -> None:
+        self._slots = asyncio.Semaphore(settings.admission_max_inflight_requests)
+        self._waiting = 0
+        self._inflight = 0
+        self._priority = {
+            p.strip() for p in settings.admission_priority_projects.split(",") if p.strip()
+        }
+
+    def _shed_reason(self, high_priority: bool) -> Optional[str]:
+        if settings.admission_max_producer_inflight > 0 and inflight_records() > settings.admission_max_producer_inflight:
+            return "producer_backlog"
+        queue_limit = settings.admission_max_queue
+        if not high_priority:
+            if recent_produce_latency() > settings.admission_latency_threshold_seconds:
+                return "produce_latency"
+            queue_limit = int(queue_limit * settings.admission_low_priority_queue_fraction)
+        if self._slots.locked() and self._waiting >= queue_limit:
+            return "queue_full"
+        return None
+
+    def _reject(self, reason: str, priority: str) -> AdmissionRejected:
+        ADMISSION_DECISIONS.labels(outcome="shed", priority=priority).inc()
+        return AdmissionRejected(reason, settings.admission_retry_after_seconds)
+
+    @asynccontextmanager
+    async def slot(self, project_id: Optional[str]) -> AsyncIterator[None]:
+        """Hold an in-flight slot for the duration of the block or raise AdmissionRejected."""
+        high = project_id is not None and project_id in self._priority
+        priority = "high" if high else "normal"
+        reason = self._shed_reason(high)
+        if reason is not None:
+            raise self._reject(reason, priority)
+        if self._slots.locked():
+            ADMISSION_DECISIONS.labels(outcome="queued", priority=priority).inc()
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=settings.admission_queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", priority) from None
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting)
+        else:
+            await self._slots.acquire()
+        ADMISSION_DECISIONS.labels(outcome="accepted", priority=priority).inc()
+        self._inflight += 1
+        ADMISSION_INFLIGHT.set(self._inflight)
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            ADMISSION_INFLIGHT.set(self._inflight)
+            self._slots.release()
@@ -1,20 +1,120 @@
-"""Client for validating API keys via Auth API."""
+"""Client for validating API keys via Auth API.
+
+Keeps one pooled httpx client per process, caches key hash -> project_id
+(bounded LRU with TTL, plus a short negative cache for rejected keys) and
+coalesces concurrent lookups for the same key into a single Auth API call.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
 from typing import Optional
 
 import httpx
 
 from app.config import settings
+from app.metrics import AUTH_CACHE_LOOKUPS, AUTH_VALIDATE_LATENCY
 
+_client: httpx.AsyncClient | None = None
+# key hash -> (project_id or None for rejected keys, expires_at monotonic)
+_cache: "OrderedDict[str, tuple[Optional[str], float]]" = OrderedDict()
+_inflight: dict[str, "asyncio.Future[Optional[str]]"] = {}
 
-async def validate_api_key(api_key: str) -> Optional[str]:
-    """Validate API key with Auth API. Returns project_id if valid, None otherwise."""
+_MISSING = object()
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=settings.auth_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=settings.auth_pool_max_connections,
+                max_keepalive_connections=settings.auth_pool_max_connections,
+            ),
+        )
+    return _client
+
+
+async def close_auth_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _cache.clear()
+
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _cache_get(h: str) -> object:
+    entry = _cache.get(h)
+    if entry is None:
+        return _MISSING
+    project_id, expires_at = entry
+    if expires_at <= time.monotonic():
+        del _cache[h]
+        return _MISSING
+    _cache.move_to_end(h)
+    return project_id
+
+
+def _cache_put(h: str, project_id: Optional[str], ttl: float) -> None:
+    if ttl <= 0:
+        return
+    _cache[h] = (project_id, time.monotonic() + ttl)
+    _cache.move_to_end(h)
+    while len(_cache) > settings.auth_cache_max_entries:
+        _cache.popitem(last=False)
+
+
+async def _fetch(h: str, api_key: str) -> Optional[str]:
     url = f"{settings.auth_api_url.rstrip('/')}/api/internal/validate-key"
+    start = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            r = await client.get(url, headers={"X-API-Key": api_key})
-            if r.status_code == 200:
-                data = r.json()
-                return data.get("project_id")
-            return None
+        r = await _get_client().get(url, headers={"X-API-Key": api_key})
     except Exception:
+        # Auth API unreachable: do not cache, the next request retries.
         return None
+    finally:
+        AUTH_VALIDATE_LATENCY.observe(time.perf_counter() - start)
+    if r.status_code == 200:
+        try:
+            project_id = r.json().get("project_id")
+        except ValueError:
+            # Not JSON (e.g. a proxy error page): do not cache, like an unreachable Auth API.
+            return None
+        _cache_put(h, project_id, settings.auth_cache_ttl_seconds)
+        return project_id
+    if r.status_code in (401, 403, 404):
+        _cache_put(h, None, settings.auth_negative_cache_ttl_seconds)
+    return None
+
+
+async def validate_api_key(api_key: str) -> Optional[str]:
+    """Validate API key with Auth API. Returns project_id if valid, None otherwise."""
+    h = _key_hash(api_key)
+    cached = _cache_get(h)
+    if cached is not _MISSING:
+        AUTH_CACHE_LOOKUPS.labels(result="hit" if cached else "negative_hit").inc()
+        return cached  # type: ignore[return-value]
+    pending = _inflight.get(h)
+    if pending is not None:
+        AUTH_CACHE_LOOKUPS.labels(result="coalesced").inc()
+        return await asyncio.shield(pending)
+    AUTH_CACHE_LOOKUPS.labels(result="miss").inc()
+    fut: "asyncio.Future[Optional[str]]" = asyncio.get_running_loop().create_future()
+    _inflight[h] = fut
+    try:
+        project_id = await _fetch(h, api_key)
+        fut.set_result(project_id)
+        return project_id
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved; coalesced waiters still see it
+        raise
+    finally:
+        _inflight.pop(h, None)
+        if not fut.done():
+            fut.cancel()
@@ -0,0 +1,268 @@
+"""Streaming NDJSON bulk ingestion (POST /capture/bulk).
+
+The body is read chunk by chunk, decompressed incrementally (gzip or zstd;
+concatenated members or frames are decoded in turn, a truncated body is
+rejected), split into lines, validated one line at a time and produced to
+Kafka in chunks of ``bulk_chunk_size`` events. Memory is bounded by the chunk size and
+``bulk_max_line_bytes`` regardless of upload size.
+"""
+import asyncio
+import json
+import zlib
+from typing import Any, AsyncIterator, Callable, Generator, Iterator, Optional
+
+from aiokafka import AIOKafkaProducer
+from pydantic import ValidationError
+
+from app.config import settings
+from app.dedup import DedupWindow
+from app.envelope import encode_payloads
+from app.metrics import BULK_LINES
+from app.models import CaptureEvent
+from app.spool import DiskSpool, SpoolFull, produce_or_spool
+
+# Cap on decompressed output per piece, so one small compressed network chunk
+# cannot expand into an unbounded buffer.
+_DECOMPRESS_STEP = 256 * 1024
+# zstd's decompressobj has no output limit, but a zstd block decompresses to at
+# most 128 KiB and takes at least 4 bytes, so feeding it this much input at a
+# time bounds each call's output to about 2 MiB.
+_ZSTD_INPUT_STEP = 64
+
+
+class BulkDecodeError(Exception):
+    """Body cannot be decoded (unsupported or corrupt Content-Encoding).
+
+    ``accepted`` lines were produced before the error; lines from ``next_line`` on were not.
+    """
+
+    def __init__(self, message: str, accepted: int = 0, next_line: int = 0):
+        super().__init__(message)
+        self.accepted = accepted
+        self.next_line = next_line
+
+
+class BulkProduceTimeout(Exception):
+    def __init__(self, accepted: int, next_line: int):
+        super().__init__("kafka send timeout")
+        self.accepted = accepted
+        self.next_line = next_line
+
+
+class _Decoder:
+    """Incremental decoder for a body of concatenated gzip members or zstd frames."""
+
+    def __init__(self, enc: str, new: Callable[[], Any], error: type[Exception]):
+        self._enc = enc
+        self._new = new
+        self._error = error
+        self._member = self._zstd_member if enc == "zstd" else self._gzip_member
+        self._d: Any = None  # decompressor of the current member; None between members
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Yield the output for ``data`` in pieces of at most about _DECOMPRESS_STEP bytes."""
+        try:
+            while data:
+                if self._d is None:
+                    self._d = self._new()
+                data = yield from self._member(data)
+        except self._error as e:
+            raise BulkDecodeError(f"invalid {self._enc} stream: {e}") from e
+
+    def close(self) -> None:
+        """Raise BulkDecodeError if the body ended inside a member."""
+        if self._d is not None:
+            raise BulkDecodeError(f"truncated {self._enc} stream")
+
+    def _gzip_member(self, data: bytes) -> Generator[bytes, None, bytes]:
+        """Decompress ``data`` into the current member; return input left after its end."""
+        d = self._d
+        while True:
+            piece = d.decompress(data, _DECOMPRESS_STEP)
+            if piece:
+                yield piece
+            if d.eof:
+                self._d = None
+                return d.unused_data
+            data = d.unconsumed_tail
+            # A full piece may leave output buffered in the decompressor.
+            if not data and len(piece) < _DECOMPRESS_STEP:
+                return b""
+
+    def _zstd_member(self, data: bytes) -> Generator[bytes, None, bytes]:
+        d = self._d
+        view = memoryview(data)
+        out = bytearray()
+        for i in range(0, len(view), _ZSTD_INPUT_STEP):
+            out += d.decompress(view[i:i + _ZSTD_INPUT_STEP])
+            if d.eof:
+                self._d = None
+                if out:
+                    yield bytes(out)
+                return d.unused_data + view[i + _ZSTD_INPUT_STEP:]
+            if len(out) >= _DECOMPRESS_STEP:
+                yield bytes(out)
+                out.clear()
+        if out:
+            yield bytes(out)
+        return b""
+
+
+def _decoder(content_encoding: str) -> Optional[_Decoder]:
+    """Decoder for a Content-Encoding; None for identity."""
+    enc = (content_encoding or "identity").strip().lower()
+    if enc in ("", "identity"):
+        return None
+    if enc in ("gzip", "x-gzip", "deflate"):
+        # auto-detect gzip/zlib header
+        return _Decoder(enc, lambda: zlib.decompressobj(zlib.MAX_WBITS | 32), zlib.error)
+    if enc == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise BulkDecodeError("zstd encoding not supported on this server") from e
+        return _Decoder(enc, zstandard.ZstdDecompressor().decompressobj, zstandard.ZstdError)
+    raise BulkDecodeError(f"unsupported Content-Encoding: {content_encoding}")
+
+
+async def iter_ndjson_lines(
+    stream: AsyncIterator[bytes],
+    content_encoding: str,
+) -> AsyncIterator[Optional[bytes]]:
+    """Yield one item per NDJSON line; None for a line longer than bulk_max_line_bytes."""
+    decoder = _decoder(content_encoding)
+    max_line = settings.bulk_max_line_bytes
+    pending = bytearray()
+    oversized = False
+    async for chunk in stream:
+        for piece in decoder.feed(chunk) if decoder is not None else (chunk,):
+            start = 0
+            while True:
+                nl = piece.find(b"\n", start)
+                if nl < 0:
+                    if not oversized:
+                        pending += piece[start:]
+                        if len(pending) > max_line:
+                            oversized = True
+                            pending.clear()
+                    break
+                if oversized:
+                    yield None
+                    oversized = False
+                else:
+                    pending += piece[start:nl]
+                    if len(pending) > max_line:
+                        yield None
+                    else:
+                        yield bytes(pending)
+                pending.clear()
+                start = nl + 1
+    if decoder is not None:
+        decoder.close()
+    if oversized:
+        yield None
+    elif pending.strip():
+        yield bytes(pending)
+
+
+def _parse_line(line: bytes, project_id_override: Optional[str]) -> CaptureEvent:
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("line must be a JSON object")
+    ev = CaptureEvent.model_validate(obj)
+    if project_id_override is not None:
+        ev.project_id = project_id_override
+    return ev
+
+
+async def ingest_ndjson(
+    producer: AIOKafkaProducer,
+    stream: AsyncIterator[bytes],
+    content_encoding: str,
+    project_id_override: Optional[str] = None,
+    spool: Optional[DiskSpool] = None,
+    dedup: Optional[DedupWindow] = None,
+) -> dict[str, Any]:
+    """Validate and produce every line of an NDJSON stream.
+
+    Returns counts plus the (0-based) line indices that were rejected by validation
+    or failed to produce. Index lists are capped at bulk_max_reported_errors.
+    """
+    cap = settings.bulk_max_reported_errors
+    rejected: list[int] = []
+    failed: list[int] = []
+    n_rejected = n_failed = accepted = spooled = duplicates = 0
+    chunk: list[CaptureEvent] = []
+    chunk_lines: list[int] = []
+
+    async def _flush() -> None:
+        nonlocal accepted, n_failed, spooled, duplicates
+        if dedup is not None:
+            keep, dropped = await dedup.filter(chunk)
+            duplicates += dropped
+            chunk[:] = [chunk[i] for i in keep]
+            chunk_lines[:] = [chunk_lines[i] for i in keep]
+            if not chunk:
+                return
+        payloads, carried = encode_payloads(chunk)
+        try:
+            bad_records, spooled_records = await produce_or_spool(producer, spool, payloads)
+        except (asyncio.TimeoutError, SpoolFull):
+            if dedup is not None:
+                await dedup.release(chunk)
+            raise BulkProduceTimeout(accepted, chunk_lines[0]) from None
+        spooled += sum(len(carried[r]) for r in spooled_records)
+        bad = sorted(i for r in bad_records for i in carried[r])
+        for i in bad:
+            if len(failed) < cap:
+                failed.append(chunk_lines[i])
+        n_failed += len(bad)
+        if dedup is not None:
+            bad_set = set(bad)
+            await dedup.remember([ev for i, ev in enumerate(chunk) if i not in bad_set])
+            await dedup.release([chunk[i] for i in bad])
+        accepted += len(chunk) - len(bad)
+        BULK_LINES.labels(outcome="accepted").inc(len(chunk) - len(bad))
+        BULK_LINES.labels(outcome="failed").inc(len(bad))
+        chunk.clear()
+        chunk_lines.clear()
+
+    line_no = -1
+    try:
+        async for line in iter_ndjson_lines(stream, content_encoding):
+            line_no += 1
+            if line is not None and not line.strip():
+                continue
+            try:
+                if line is None:
+                    raise ValueError("line too long")
+                ev = _parse_line(line, project_id_override)
+            except (ValueError, TypeError, ValidationError):
+                # json.JSONDecodeError is a ValueError
+                n_rejected += 1
+                BULK_LINES.labels(outcome="rejected").inc()
+                if len(rejected) < cap:
+                    rejected.append(line_no)
+                continue
+            chunk.append(ev)
+            chunk_lines.append(line_no)
+            if len(chunk) >= settings.bulk_chunk_size:
+                await _flush()
+    except BulkDecodeError as e:
+        # Earlier chunks are already in Kafka: tell the client where to resume.
+        e.accepted = accepted
+        e.next_line = chunk_lines[0] if chunk else line_no + 1
+        raise
+    if chunk:
+        await _flush()
+    return {
+        "status": "accepted",
+        "lines": line_no + 1,
+        "accepted": accepted,
+        "rejected_count": n_rejected,
+        "rejected": rejected,
+        "failed_count": n_failed,
+        "failed": failed,
+        "spooled": spooled,
+        "duplicates": duplicates,
+    }
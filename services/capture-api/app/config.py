@@ -6,13 +6,60 @@ class Settings(BaseSettings):
     kafka_topic: str = "events"
     require_api_key: bool = False
     auth_api_url: str = "http://localhost:8002"
+    auth_timeout_seconds: float = 5.0
+    auth_pool_max_connections: int = 20
+    auth_cache_ttl_seconds: float = 60.0
+    auth_negative_cache_ttl_seconds: float = 5.0
+    auth_cache_max_entries: int = 10000
+    fast_path_enabled: bool = False  # serve /capture and /capture/bulk as raw ASGI (no FastAPI stack)
     max_request_body_bytes: int = 512 * 1024  # 512 KB
     properties_max_keys: int = 50
     properties_max_depth: int = 3
     properties_max_size_bytes: int = 32 * 1024  # 32 KB
     kafka_send_timeout_seconds: float = 5.0
+    kafka_pipelined_produce: bool = True  # queue all records with send(), await deliveries together
+    kafka_linger_ms: int = 5
+    kafka_message_format: str = "json"  # json (one message per event) | envelope (msgpack, per distinct_id)
+    kafka_envelope_max_bytes: int = 900 * 1024
+    dedup_enabled: bool = False  # drop events whose uuid was already produced within the window
+    dedup_window_seconds: float = 600.0
+    dedup_max_entries: int = 1_000_000  # local uuids kept across both generations
+    dedup_backend: str = "memory"  # memory | redis (shared across replicas, uses redis_url)
+    dedup_redis_timeout_seconds: float = 0.1
+    dedup_reservation_seconds: float = 60.0  # how long a uuid being produced blocks duplicates if never resolved
+    admission_enabled: bool = False  # shed load early when the producer backs up
+    admission_max_inflight_requests: int = 256
+    admission_max_queue: int = 512  # requests allowed to wait for an in-flight slot
+    admission_queue_timeout_seconds: float = 1.0
+    admission_max_producer_inflight: int = 50000  # undelivered records before shedding (0 = off)
+    admission_latency_threshold_seconds: float = 1.0  # produce latency EWMA that sheds normal priority
+    admission_low_priority_queue_fraction: float = 0.5
+    admission_priority_projects: str = ""  # comma-separated project ids (from API key) shed last
+    admission_retry_after_seconds: int = 1
+    spool_enabled: bool = False  # divert events to local disk when Kafka is slow or down
+    spool_dir: str = "./spool"
+    spool_max_bytes: int = 1024 * 1024 * 1024  # 1 GiB
+    spool_segment_bytes: int = 16 * 1024 * 1024
+    spool_fsync: bool = False
+    spool_backlog_records: int = 10000  # spool when this many records await delivery (0 = off)
+    spool_drain_batch: int = 500
+    spool_drain_idle_seconds: float = 0.5
+    spool_retry_backoff_seconds: float = 0.5
+    spool_retry_backoff_max_seconds: float = 10.0
+    spool_max_attempts: int = 10  # tries before a record that fails on its own is dead-lettered (0 = never)
+    bulk_chunk_size: int = 500  # events produced per Kafka chunk on /capture/bulk
+    bulk_max_line_bytes: int = 64 * 1024
+    bulk_max_reported_errors: int = 1000  # cap on rejected/failed line indices in the response
     rate_limit_requests_per_minute: int = 0  # 0 = disabled
     rate_limit_key_header: str = "X-API-Key"  # or X-Forwarded-For for IP
+    rate_limit_backend: str = "memory"  # memory (per process) | redis (shared across replicas)
+    rate_limit_lease_size: int = 10  # tokens leased locally per Redis round-trip
+    rate_limit_lease_ttl_seconds: float = 1.0
+    rate_limit_idle_seconds: float = 120.0  # evict local state for keys idle this long
+    rate_limit_max_local_keys: int = 100000
+    rate_limit_redis_timeout_seconds: float = 0.1
+    rate_limit_redis_backoff_seconds: float = 5.0  # fail open without calling Redis this long after an error
+    redis_url: str = "redis://localhost:6379/0"
 
     class Config:
         env_prefix = "CAPTURE_"
@@ -0,0 +1,151 @@
+"""Capture-side deduplication on event ``uuid``.
+
+Keeps a time-windowed set of recently produced uuids in two generations
+(current and previous); the previous generation is dropped when the current one
+is older than ``dedup_window_seconds / 2`` or holds ``dedup_max_entries / 2``
+uuids, so memory stays bounded and a uuid is remembered for between half and one
+full window. With ``dedup_backend=redis`` uuids are also recorded in Redis
+(``SET ... EX window``) so replicas see each other's events; Redis errors fail open.
+
+``filter`` reserves the uuids it keeps (locally and, with Redis, ``SET NX``
+with a ``dedup_reservation_seconds`` TTL), so a concurrent request carrying the
+same uuid is dropped while the first is still producing. ``remember`` turns
+the reservations of produced or spooled events into window entries and
+``release`` drops those of events that failed, so a failed request can be
+retried without its events being dropped. Reservations left by a cancelled
+request expire after ``dedup_reservation_seconds``.
+"""
+import time
+from typing import Any, Optional
+from uuid import UUID
+
+from app.config import settings
+from app.logging_config import get_logger
+from app.metrics import DEDUP_DROPPED, DEDUP_ENTRIES
+from app.models import CaptureEvent
+
+
+class DedupWindow:
+    def __init__(self, window_seconds: float, max_entries: int):
+        self.window_seconds = window_seconds
+        self.generation_cap = max(1, max_entries // 2)
+        self._current: set[UUID] = set()
+        self._previous: set[UUID] = set()
+        # uuid -> (reserved in Redis, monotonic expiry) for events being produced
+        self._pending: dict[UUID, tuple[bool, float]] = {}
+        self._rotated_at = time.monotonic()
+        self._redis: Any = None
+        if settings.dedup_backend == "redis":
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.Redis.from_url(
+                settings.redis_url,
+                socket_timeout=settings.dedup_redis_timeout_seconds,
+                socket_connect_timeout=settings.dedup_redis_timeout_seconds,
+            )
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _rotate_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self._rotated_at >= self.window_seconds / 2 or len(self._current) >= self.generation_cap:
+            self._previous = self._current
+            self._current = set()
+            self._rotated_at = now
+        expired = [u for u, (_, expires_at) in self._pending.items() if expires_at <= now]
+        for u in expired:
+            del self._pending[u]
+        DEDUP_ENTRIES.set(len(self._current) + len(self._previous))
+
+    def _seen_locally(self, u: UUID) -> bool:
+        return u in self._current or u in self._previous or u in self._pending
+
+    async def _reserve_remotely(self, uuids: list[UUID]) -> list[Optional[bool]]:
+        """Per uuid: True if reserved in Redis, False if already there, None without Redis."""
+        if self._redis is None or not uuids:
+            return [None] * len(uuids)
+        ttl = max(1, int(settings.dedup_reservation_seconds))
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for u in uuids:
+                    pipe.set(f"dedup:{u.hex}", 1, ex=ttl, nx=True)
+                return [bool(ok) for ok in await pipe.execute()]
+        except Exception as e:
+            get_logger().warning("dedup_redis_error", error=str(e))
+            return [None] * len(uuids)
+
+    async def filter(self, events: list[CaptureEvent]) -> tuple[list[int], int]:
+        """Return (indices of events to keep, number dropped as duplicates).
+
+        The uuids of the kept events are reserved until ``remember`` or ``release``.
+        """
+        self._rotate_if_due()
+        kept: list[int] = []
+        pending: list[int] = []
+        expires_at = time.monotonic() + settings.dedup_reservation_seconds
+        for i, ev in enumerate(events):
+            u = ev.uuid
+            if u is None:
+                kept.append(i)
+            elif not self._seen_locally(u):
+                # Reserved before the Redis round trip, so concurrent requests see it.
+                self._pending[u] = (False, expires_at)
+                pending.append(i)
+        remote = await self._reserve_remotely([events[i].uuid for i in pending])  # type: ignore[misc]
+        for i, reserved in zip(pending, remote):
+            u = events[i].uuid
+            if reserved is False:
+                self._pending.pop(u, None)  # type: ignore[arg-type]
+            else:
+                self._pending[u] = (bool(reserved), expires_at)  # type: ignore[index]
+                kept.append(i)
+        kept.sort()
+        dropped = len(events) - len(kept)
+        if dropped:
+            DEDUP_DROPPED.inc(dropped)
+        return kept, dropped
+
+    async def remember(self, events: list[CaptureEvent]) -> None:
+        """Record the uuids of produced (or spooled) events for the window."""
+        uuids = [ev.uuid for ev in events if ev.uuid is not None]
+        if not uuids:
+            return
+        for u in uuids:
+            self._pending.pop(u, None)
+        self._current.update(uuids)
+        self._rotate_if_due()
+        if self._redis is None:
+            return
+        ttl = max(1, int(self.window_seconds))
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for u in uuids:
+                    pipe.set(f"dedup:{u.hex}", 1, ex=ttl)
+                await pipe.execute()
+        except Exception as e:
+            get_logger().warning("dedup_redis_error", error=str(e))
+
+    async def release(self, events: list[CaptureEvent]) -> None:
+        """Drop the reservations of events that were not produced, so a retry is accepted."""
+        remote = []
+        for ev in events:
+            if ev.uuid is None:
+                continue
+            reserved = self._pending.pop(ev.uuid, None)
+            if reserved is not None and reserved[0]:
+                remote.append(ev.uuid)
+        if self._redis is None or not remote:
+            return
+        try:
+            await self._redis.delete(*(f"dedup:{u.hex}" for u in remote))
+        except Exception as e:
+            get_logger().warning("dedup_redis_error", error=str(e))
+
+
+def new_dedup_window() -> Optional[DedupWindow]:
+    if not settings.dedup_enabled:
+        return None
+    return DedupWindow(settings.dedup_window_seconds, settings.dedup_max_entries)
@@ -0,0 +1,70 @@
+"""Kafka record encoding for capture events.
+
+``json`` (default): one Kafka message per event, value = the event as JSON.
+
+``envelope``: one Kafka message per distinct_id per request, value =
+``ENVELOPE_MAGIC`` + version byte + a msgpack array of event maps. Events for
+the same distinct_id keep the same key, so per-user partitioning and ordering
+are unchanged. Envelopes are split so none exceeds ``kafka_envelope_max_bytes``.
+The consumer accepts both formats on the same topic.
+"""
+import struct
+from typing import Any
+
+import msgpack
+
+from app.config import settings
+from app.models import CaptureEvent
+
+ENVELOPE_MAGIC = b"AEV"
+ENVELOPE_VERSION = 1
+_HEADER = ENVELOPE_MAGIC + bytes([ENVELOPE_VERSION])
+
+
+def _array_header(n: int) -> bytes:
+    if n < 16:
+        return bytes([0x90 | n])
+    if n < 0x10000:
+        return b"\xdc" + struct.pack(">H", n)
+    return b"\xdd" + struct.pack(">I", n)
+
+
+def _pack_event(ev: CaptureEvent) -> bytes:
+    doc: dict[str, Any] = ev.model_dump(mode="json", by_alias=True, exclude_none=False)
+    return msgpack.packb(doc, use_bin_type=True)
+
+
+def encode_payloads(events: list[CaptureEvent]) -> tuple[list[tuple[bytes, bytes]], list[list[int]]]:
+    """Build Kafka (key, value) records for events.
+
+    Returns the records and, for each record, the indices of the events it carries,
+    so per-record delivery failures can be reported per event.
+    """
+    if settings.kafka_message_format != "envelope":
+        return (
+            [(ev.kafka_key().encode("utf-8"), ev.serialized()) for ev in events],
+            [[i] for i in range(len(events))],
+        )
+    groups: dict[str, list[int]] = {}
+    for i, ev in enumerate(events):
+        groups.setdefault(ev.kafka_key(), []).append(i)
+    records: list[tuple[bytes, bytes]] = []
+    carried: list[list[int]] = []
+    limit = settings.kafka_envelope_max_bytes
+    for key, indices in groups.items():
+        key_b = key.encode("utf-8")
+        parts: list[bytes] = []
+        part_idx: list[int] = []
+        size = len(_HEADER) + 5
+        for i in indices:
+            packed = _pack_event(events[i])
+            if parts and size + len(packed) > limit:
+                records.append((key_b, _HEADER + _array_header(len(parts)) + b"".join(parts)))
+                carried.append(part_idx)
+                parts, part_idx, size = [], [], len(_HEADER) + 5
+            parts.append(packed)
+            part_idx.append(i)
+            size += len(packed)
+        records.append((key_b, _HEADER + _array_header(len(parts)) + b"".join(parts)))
+        carried.append(part_idx)
+    return records, carried
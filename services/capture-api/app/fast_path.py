@@ -0,0 +1,62 @@
+"""Raw ASGI entry point for the capture endpoints.
+
+Wraps the FastAPI app and serves ``POST /capture`` and ``POST /capture/bulk``
+(plus their CORS preflight) directly: the handlers get a plain Starlette
+``Request`` and their response is sent as-is, skipping ``BaseHTTPMiddleware``,
+``CORSMiddleware``, routing and dependency resolution. Request metrics and CORS
+headers match what the middleware stack would produce. Everything else is
+passed through to the wrapped app.
+"""
+import time
+from typing import Awaitable, Callable
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.logging_config import get_logger
+from app.metrics import REQUESTS_LATENCY, REQUESTS_TOTAL, status_class
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+_ALLOW_METHODS = "GET, POST, OPTIONS"
+
+
+class CaptureFastPath:
+    def __init__(self, app: ASGIApp, routes: dict[str, Handler]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        if method not in ("POST", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        origin = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+        if method == "OPTIONS":
+            response: Response = Response(status_code=200, content="OK", media_type="text/plain")
+            response.headers["Access-Control-Allow-Methods"] = _ALLOW_METHODS
+            response.headers["Access-Control-Max-Age"] = "600"
+            if request_headers is not None:
+                response.headers["Access-Control-Allow-Headers"] = request_headers.decode("latin-1")
+        else:
+            try:
+                response = await self.routes[scope["path"]](Request(scope, receive))
+            except Exception as e:
+                get_logger().error("capture_unhandled_error", error=str(e), path=scope["path"], exc_info=True)
+                response = JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
+        if origin is not None:
+            response.headers["Access-Control-Allow-Origin"] = "*"
+        await response(scope, receive, send)
+        REQUESTS_TOTAL.labels(method=method, path=scope["path"], status_class=status_class(response.status_code)).inc()
+        REQUESTS_LATENCY.labels(method=method, path=scope["path"]).observe(time.perf_counter() - start)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import time
 from contextlib import asynccontextmanager
@@ -12,12 +13,32 @@ from app.metrics import (
     KAFKA_PRODUCE_TOTAL,
 )
 
+# Records handed to the producer whose delivery has not completed yet (backlog signal).
+_inflight = 0
+# Exponentially weighted moving average of per-request produce latency (seconds).
+_latency_ewma = 0.0
+_latency_updated = 0.0
+_LATENCY_ALPHA = 0.2
+# With no produce in this long (e.g. everything is being shed) the average is stale.
+_LATENCY_STALE_SECONDS = 5.0
+
+
+def inflight_records() -> int:
+    return _inflight
+
+
+def recent_produce_latency() -> float:
+    if time.monotonic() - _latency_updated > _LATENCY_STALE_SECONDS:
+        return 0.0
+    return _latency_ewma
+
 
 @asynccontextmanager
 async def get_producer() -> AsyncGenerator[AIOKafkaProducer, None]:
     producer = AIOKafkaProducer(
         bootstrap_servers=settings.kafka_bootstrap_servers.split(","),
         value_serializer=lambda v: v if isinstance(v, bytes) else json.dumps(v).encode("utf-8"),
+        linger_ms=settings.kafka_linger_ms,
     )
     await producer.start()
     try:
@@ -26,15 +47,86 @@ async def get_producer() -> AsyncGenerator[AIOKafkaProducer, None]:
         await producer.stop()
 
 
-async def produce_events(producer: AIOKafkaProducer, events: list[tuple[bytes, bytes]]) -> None:
-    """Send (key, value) pairs to the events topic. Key = distinct_id."""
-    start = time.perf_counter()
+async def producer_healthy(producer: AIOKafkaProducer) -> bool:
+    """Metadata probe: brokers answer and every partition of the events topic has a leader."""
     try:
-        for key_b, value_b in events:
+        updated = await asyncio.wait_for(
+            producer.client.force_metadata_update(), timeout=settings.kafka_send_timeout_seconds
+        )
+    except Exception:
+        return False
+    cluster = producer.client.cluster
+    partitions = cluster.partitions_for_topic(settings.kafka_topic)
+    return bool(updated and partitions) and cluster.available_partitions_for_topic(settings.kafka_topic) == partitions
+
+
+def _observe_record(start: float):
+    """Return a delivery-future callback that records per-record latency and outcome."""
+    def _done(fut: asyncio.Future) -> None:
+        global _inflight
+        _inflight -= 1
+        KAFKA_PRODUCE_LATENCY.labels(scope="record").observe(time.perf_counter() - start)
+        if fut.cancelled() or fut.exception() is not None:
+            KAFKA_PRODUCE_ERRORS.inc()
+        else:
+            KAFKA_PRODUCE_TOTAL.inc()
+    return _done
+
+
+async def _produce_serial(producer: AIOKafkaProducer, events: list[tuple[bytes, bytes]]) -> list[int]:
+    global _inflight
+    failed: list[int] = []
+    for i, (key_b, value_b) in enumerate(events):
+        start = time.perf_counter()
+        _inflight += 1
+        try:
             await producer.send_and_wait(settings.kafka_topic, value=value_b, key=key_b)
             KAFKA_PRODUCE_TOTAL.inc()
-    except Exception:
-        KAFKA_PRODUCE_ERRORS.inc()
-        raise
+        except Exception:
+            KAFKA_PRODUCE_ERRORS.inc()
+            failed.append(i)
+        finally:
+            _inflight -= 1
+            KAFKA_PRODUCE_LATENCY.labels(scope="record").observe(time.perf_counter() - start)
+    return failed
+
+
+async def _produce_pipelined(producer: AIOKafkaProducer, events: list[tuple[bytes, bytes]]) -> list[int]:
+    # send() only appends to the accumulator; all records of the request share the
+    # same broker round-trips and we wait on the delivery futures together.
+    global _inflight
+    futures: list[tuple[int, asyncio.Future]] = []
+    failed: list[int] = []
+    for i, (key_b, value_b) in enumerate(events):
+        start = time.perf_counter()
+        try:
+            fut = await producer.send(settings.kafka_topic, value=value_b, key=key_b)
+        except Exception:
+            KAFKA_PRODUCE_ERRORS.inc()
+            failed.append(i)
+            continue
+        _inflight += 1
+        fut.add_done_callback(_observe_record(start))
+        futures.append((i, fut))
+    if futures:
+        results = await asyncio.gather(*(f for _, f in futures), return_exceptions=True)
+        failed.extend(i for (i, _), res in zip(futures, results) if isinstance(res, BaseException))
+    return sorted(failed)
+
+
+async def produce_events(producer: AIOKafkaProducer, events: list[tuple[bytes, bytes]]) -> list[int]:
+    """Send (key, value) pairs to the events topic. Key = distinct_id.
+
+    Returns the indices of records that could not be delivered (empty on full success).
+    """
+    global _latency_ewma, _latency_updated
+    start = time.perf_counter()
+    try:
+        if settings.kafka_pipelined_produce:
+            return await _produce_pipelined(producer, events)
+        return await _produce_serial(producer, events)
     finally:
-        KAFKA_PRODUCE_LATENCY.observe(time.perf_counter() - start)
+        elapsed = time.perf_counter() - start
+        _latency_ewma += _LATENCY_ALPHA * (elapsed - _latency_ewma)
+        _latency_updated = time.monotonic()
+        KAFKA_PRODUCE_LATENCY.labels(scope="request").observe(elapsed)
@@ -9,11 +9,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
-from app.auth_client import validate_api_key as validate_capture_api_key
+from app.admission import AdmissionController, AdmissionRejected
+from app.auth_client import close_auth_client, validate_api_key as validate_capture_api_key
+from app.bulk import BulkDecodeError, BulkProduceTimeout, ingest_ndjson
 from app.config import settings
-from app.kafka_producer import get_producer, produce_events
+from app.dedup import new_dedup_window
+from app.envelope import encode_payloads
+from app.fast_path import CaptureFastPath
+from app.kafka_producer import get_producer
 from app.logging_config import configure_logging, get_logger
-from app.rate_limit import check_rate_limit
+from app.rate_limit import check_rate_limit, close_rate_limiter
 from app.metrics import (
     REQUESTS_LATENCY,
     REQUESTS_TOTAL,
@@ -21,6 +26,7 @@ from app.metrics import (
     status_class,
 )
 from app.models import normalize_body
+from app.spool import DiskSpool, SpoolFull, drain_spool, produce_or_spool
 
 producer_holder: dict[str, Any] = {}
 
@@ -41,9 +47,37 @@ class MetricsMiddleware(BaseHTTPMiddleware):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     configure_logging()
+    producer_holder["dedup"] = new_dedup_window()
+    if settings.admission_enabled:
+        producer_holder["admission"] = AdmissionController()
+    stop_drain = asyncio.Event()
+    drain_task: asyncio.Task | None = None
+    if settings.spool_enabled:
+        spool = DiskSpool(
+            settings.spool_dir,
+            max_bytes=settings.spool_max_bytes,
+            segment_bytes=settings.spool_segment_bytes,
+            fsync=settings.spool_fsync,
+        )
+        spool.open()
+        producer_holder["spool"] = spool
+        drain_task = asyncio.create_task(
+            drain_spool(spool, lambda: producer_holder.get("producer"), stop_drain)
+        )
     async with get_producer() as producer:
         producer_holder["producer"] = producer
-        yield
+        try:
+            yield
+        finally:
+            stop_drain.set()
+            if drain_task is not None:
+                await drain_task
+            await close_auth_client()
+            await close_rate_limiter()
+            if producer_holder.get("dedup") is not None:
+                await producer_holder["dedup"].close()
+    if "spool" in producer_holder:
+        producer_holder["spool"].close()
     producer_holder.clear()
 
 
@@ -76,18 +110,21 @@ async def ready():
     return {"status": "ready", "kafka": "connected"}
 
 
-@app.post("/capture")
-async def capture(request: Request):
+async def _admit(request: Request) -> tuple[JSONResponse | None, str | None]:
+    """Rate limit and API key checks shared by capture endpoints.
+
+    Returns (error_response, project_id_override); error_response is None when admitted.
+    """
     log = get_logger()
     if settings.rate_limit_requests_per_minute > 0:
         rate_key = request.headers.get(settings.rate_limit_key_header) or (request.client.host if request.client else "unknown")
-        allowed, retry_after = check_rate_limit(rate_key, settings.rate_limit_requests_per_minute)
+        allowed, retry_after = await check_rate_limit(rate_key, settings.rate_limit_requests_per_minute)
         if not allowed:
             return JSONResponse(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 content={"detail": "Rate limit exceeded"},
                 headers={"Retry-After": str(retry_after)},
-            )
+            ), None
     project_id_override: str | None = None
     if settings.require_api_key:
         api_key = request.headers.get("X-API-Key") or request.headers.get("Authorization", "").replace("Bearer ", "")
@@ -96,14 +133,50 @@ async def capture(request: Request):
             return JSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 content={"detail": "Missing API key"},
-            )
+            ), None
         project_id_override = await validate_capture_api_key(api_key.strip())
         if not project_id_override:
             log.warning("capture_invalid_api_key")
             return JSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 content={"detail": "Invalid API key"},
-            )
+            ), None
+    return None, project_id_override
+
+
+@asynccontextmanager
+async def _admission_slot(project_id: str | None):
+    controller = producer_holder.get("admission")
+    if controller is None:
+        yield
+        return
+    async with controller.slot(project_id):
+        yield
+
+
+def _shed_response(e: AdmissionRejected) -> JSONResponse:
+    get_logger().warning("capture_shed", reason=e.reason)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server overloaded, retry later"},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+@app.post("/capture")
+async def capture(request: Request):
+    rejection, project_id_override = await _admit(request)
+    if rejection is not None:
+        return rejection
+    try:
+        async with _admission_slot(project_id_override):
+            return await _capture(request, project_id_override)
+    except AdmissionRejected as e:
+        return _shed_response(e)
+
+
+async def _capture(request: Request, project_id_override: str | None) -> JSONResponse:
+    log = get_logger()
     body_bytes = await request.body()
     if len(body_bytes) > settings.max_request_body_bytes:
         log.warning("request_body_too_large", size=len(body_bytes), limit=settings.max_request_body_bytes)
@@ -125,18 +198,13 @@ async def capture(request: Request):
             content={"detail": "Body must be a JSON object"},
         )
     try:
-        events_with_keys = normalize_body(body)
+        events_with_keys = normalize_body(body, project_id_override)
     except Exception as e:
         log.warning("normalize_error", error=str(e), errors=getattr(e, "errors", None))
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"detail": str(e), "errors": getattr(e, "errors", None)},
         )
-    if project_id_override is not None:
-        events_with_keys = [
-            (ev.model_copy(update={"project_id": project_id_override}), key)
-            for ev, key in events_with_keys
-        ]
     producer = producer_holder.get("producer")
     if not producer:
         log.error("producer_unavailable")
@@ -144,19 +212,109 @@ async def capture(request: Request):
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             content={"detail": "Producer not available"},
         )
-    payloads = [
-        (ev.kafka_key().encode("utf-8"), ev.serialized())
-        for ev, _ in events_with_keys
-    ]
+    events = [ev for ev, _ in events_with_keys]
+    # Positions of the produced events in the request, for reporting failures.
+    positions = list(range(len(events)))
+    duplicates = 0
+    dedup = producer_holder.get("dedup")
+    if dedup is not None:
+        positions, duplicates = await dedup.filter(events)
+        events = [events[i] for i in positions]
+        if not events:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "accepted", "duplicates": duplicates},
+            )
+    payloads, carried = encode_payloads(events)
+    try:
+        failed_records, spooled_records = await produce_or_spool(producer, producer_holder.get("spool"), payloads)
+    except (asyncio.TimeoutError, SpoolFull) as e:
+        if dedup is not None:
+            await dedup.release(events)
+        log.error("kafka_send_timeout", spool_full=isinstance(e, SpoolFull))
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Event ingestion temporarily unavailable"},
+        )
+    failed = sorted(i for r in failed_records for i in carried[r])
+    if dedup is not None:
+        failed_set = set(failed)
+        await dedup.remember([ev for i, ev in enumerate(events) if i not in failed_set])
+        await dedup.release([events[i] for i in failed])
+    content: dict[str, Any] = {"status": "accepted"}
+    if duplicates:
+        content["duplicates"] = duplicates
+    if failed:
+        log.error("kafka_produce_failed", failed=len(failed), total=len(events))
+        if len(failed) == len(events):
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": "Event ingestion temporarily unavailable"},
+            )
+        content.update(status="partial", accepted=len(events) - len(failed), failed=[positions[i] for i in failed])
+    if spooled_records:
+        content["spooled"] = sum(len(carried[r]) for r in spooled_records)
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=content)
+
+
+@app.post("/capture/bulk")
+async def capture_bulk(request: Request):
+    """NDJSON (one event per line), optionally gzip/zstd Content-Encoding, streamed to Kafka."""
+    rejection, project_id_override = await _admit(request)
+    if rejection is not None:
+        return rejection
+    try:
+        async with _admission_slot(project_id_override):
+            return await _capture_bulk(request, project_id_override)
+    except AdmissionRejected as e:
+        return _shed_response(e)
+
+
+async def _capture_bulk(request: Request, project_id_override: str | None) -> JSONResponse:
+    log = get_logger()
+    producer = producer_holder.get("producer")
+    if not producer:
+        log.error("producer_unavailable")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Producer not available"},
+        )
     try:
-        await asyncio.wait_for(
-            produce_events(producer, payloads),
-            timeout=settings.kafka_send_timeout_seconds,
+        result = await ingest_ndjson(
+            producer,
+            request.stream(),
+            request.headers.get("Content-Encoding", ""),
+            project_id_override,
+            spool=producer_holder.get("spool"),
+            dedup=producer_holder.get("dedup"),
         )
-    except asyncio.TimeoutError:
-        log.error("kafka_send_timeout")
+    except BulkDecodeError as e:
+        log.warning("bulk_decode_error", error=str(e), accepted=e.accepted, next_line=e.next_line)
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": str(e), "accepted": e.accepted, "resume_from_line": e.next_line},
+        )
+    except BulkProduceTimeout as e:
+        log.error("kafka_send_timeout", accepted=e.accepted, next_line=e.next_line)
         return JSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            content={"detail": "Event ingestion temporarily unavailable"},
+            content={
+                "detail": "Event ingestion temporarily unavailable",
+                "accepted": e.accepted,
+                "resume_from_line": e.next_line,
+            },
         )
-    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "accepted"})
+    log.info(
+        "bulk_ingested",
+        lines=result["lines"],
+        accepted=result["accepted"],
+        rejected=result["rejected_count"],
+        failed=result["failed_count"],
+        duplicates=result["duplicates"],
+    )
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=result)
+
+
+if settings.fast_path_enabled:
+    # Serve the capture endpoints as raw ASGI; everything else goes through FastAPI.
+    app = CaptureFastPath(app, {"/capture": capture, "/capture/bulk": capture_bulk})  # type: ignore[assignment]
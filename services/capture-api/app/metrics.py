@@ -1,5 +1,5 @@
 """Prometheus metrics for Capture API."""
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from starlette.requests import Request
 from starlette.responses import Response
 
@@ -26,9 +26,90 @@ KAFKA_PRODUCE_ERRORS = Counter(
 )
 KAFKA_PRODUCE_LATENCY = Histogram(
     "capture_kafka_produce_duration_seconds",
-    "Kafka produce latency in seconds",
+    "Kafka produce latency in seconds (scope=request: whole request, scope=record: per record)",
+    ["scope"],
     buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
 )
+# Deduplication
+DEDUP_DROPPED = Counter(
+    "capture_dedup_dropped_total",
+    "Events dropped as duplicates (uuid seen within the dedup window)",
+)
+DEDUP_ENTRIES = Gauge(
+    "capture_dedup_entries",
+    "Event uuids held in the local dedup window",
+)
+# Admission control
+ADMISSION_DECISIONS = Counter(
+    "capture_admission_decisions_total",
+    "Admission decisions by outcome (accepted, queued, shed) and priority",
+    ["outcome", "priority"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "capture_admission_queue_depth",
+    "Requests waiting for an in-flight slot",
+)
+ADMISSION_INFLIGHT = Gauge(
+    "capture_admission_inflight_requests",
+    "Requests holding an in-flight slot",
+)
+# Disk spool
+SPOOL_RECORDS = Gauge(
+    "capture_spool_records",
+    "Records waiting in the local disk spool",
+)
+SPOOL_BYTES = Gauge(
+    "capture_spool_bytes",
+    "Bytes used by local disk spool segments",
+)
+SPOOL_OLDEST_AGE = Gauge(
+    "capture_spool_oldest_age_seconds",
+    "Age of the oldest spool segment that still holds records",
+)
+SPOOL_APPENDED = Counter(
+    "capture_spool_appended_total",
+    "Records written to the local disk spool",
+)
+SPOOL_DRAINED = Counter(
+    "capture_spool_drained_total",
+    "Records replayed from the local disk spool into Kafka",
+)
+SPOOL_DEAD_LETTERED = Counter(
+    "capture_spool_dead_lettered_total",
+    "Spooled records moved to dead-letter.seg after spool_max_attempts failed deliveries",
+)
+SPOOL_REJECTED = Counter(
+    "capture_spool_rejected_total",
+    "Records refused because the spool reached spool_max_bytes",
+)
+# Bulk NDJSON ingestion
+BULK_LINES = Counter(
+    "capture_bulk_lines_total",
+    "Lines processed on /capture/bulk by outcome (accepted, rejected, failed)",
+    ["outcome"],
+)
+# API key validation (Auth API)
+AUTH_CACHE_LOOKUPS = Counter(
+    "capture_auth_cache_lookups_total",
+    "API key validation lookups by cache result (hit, negative_hit, coalesced, miss)",
+    ["result"],
+)
+AUTH_VALIDATE_LATENCY = Histogram(
+    "capture_auth_validate_duration_seconds",
+    "Auth API validate-key call latency in seconds (cache misses only)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+# Rate limiting
+RATE_LIMIT_DECISIONS = Counter(
+    "capture_rate_limit_decisions_total",
+    "Rate limiter decisions other than a plain allow (limited, fail_open)",
+    ["decision"],
+)
+RATE_LIMIT_REDIS_LATENCY = Histogram(
+    "capture_rate_limit_redis_duration_seconds",
+    "Redis token-bucket lease call latency in seconds",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
 
 
 def status_class(status_code: int) -> str:
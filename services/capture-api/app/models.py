@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import Any, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator, model_validator
 
 from app.config import settings
 
@@ -30,6 +30,9 @@ class CaptureEvent(BaseModel):
 
     model_config = {"populate_by_name": True, "extra": "allow"}
 
+    # json.dumps(properties) from validation, reused verbatim in the Kafka payload.
+    _properties_json: Optional[str] = PrivateAttr(default=None)
+
     @field_validator("timestamp", mode="before")
     @classmethod
     def optional_iso(cls, v: Any) -> Optional[str]:
@@ -53,18 +56,28 @@ class CaptureEvent(BaseModel):
             raise ValueError(
                 f"properties depth {depth} exceeds maximum {settings.properties_max_depth}"
             )
+        # Default json.dumps output is pure ASCII, so len() is the UTF-8 byte size.
         serialized = json.dumps(p)
-        if len(serialized.encode("utf-8")) > settings.properties_max_size_bytes:
+        if len(serialized) > settings.properties_max_size_bytes:
             raise ValueError(
                 f"properties serialized size exceeds maximum {settings.properties_max_size_bytes} bytes"
             )
+        self._properties_json = serialized
         return self
 
     def kafka_key(self) -> str:
         return self.distinct_id
 
     def serialized(self) -> bytes:
-        return self.model_dump_json(by_alias=True, exclude_none=False).encode("utf-8")
+        # Read the private dict directly: attribute access to private attrs goes through
+        # BaseModel.__getattr__ and costs more than re-serializing small properties.
+        private = self.__pydantic_private__
+        props_json = private.get("_properties_json") if private else None
+        if props_json is None:
+            return self.model_dump_json(by_alias=True, exclude_none=False).encode("utf-8")
+        # Splice the properties JSON produced during validation instead of dumping them again.
+        head = self.model_dump_json(by_alias=True, exclude_none=False, exclude={"properties"})
+        return f'{head[:-1]},"properties":{props_json}}}'.encode("utf-8")
 
 
 class CaptureBatch(BaseModel):
@@ -72,16 +85,26 @@ class CaptureBatch(BaseModel):
     project_id: Optional[str] = Field(None, max_length=256)
 
 
-def normalize_body(body: dict[str, Any]) -> list[tuple[CaptureEvent, str]]:
-    """Return list of (event, kafka_key). Single event or batch."""
+def normalize_body(
+    body: dict[str, Any],
+    project_id_override: Optional[str] = None,
+) -> list[tuple[CaptureEvent, str]]:
+    """Return list of (event, kafka_key). Single event or batch.
+
+    project_id_override (from the API key) wins over any project_id in the body.
+    Project ids are assigned in place rather than with model_copy, so each event is
+    validated once and serialized once.
+    """
     if "batch" in body:
-        batch = CaptureBatch(**body)
-        default_project = batch.project_id
+        batch = CaptureBatch.model_validate(body)
+        default_project = project_id_override or batch.project_id
         out = []
         for ev in batch.batch:
-            if default_project and not ev.project_id:
-                ev = ev.model_copy(update={"project_id": default_project})
+            if project_id_override or (default_project and not ev.project_id):
+                ev.project_id = default_project
             out.append((ev, ev.kafka_key()))
         return out
-    ev = CaptureEvent(**body)
+    ev = CaptureEvent.model_validate(body)
+    if project_id_override:
+        ev.project_id = project_id_override
     return [(ev, ev.kafka_key())]
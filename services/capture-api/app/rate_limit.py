@@ -1,27 +1,87 @@
-"""In-memory rate limiter (fixed window per minute)."""
+"""Rate limiting for /capture.
+
+Two backends (CAPTURE_RATE_LIMIT_BACKEND):
+
+- ``memory``: per-process fixed window per minute. Only meaningful with a single replica.
+- ``redis``: token bucket shared by all replicas, refilled and debited atomically by a
+  Lua script. Each process leases small blocks of tokens so most requests are decided
+  locally without a Redis round-trip; concurrent requests for a key share one refill.
+  Fails open if Redis is unreachable, and then leaves Redis alone for
+  ``rate_limit_redis_backoff_seconds``.
+
+Local state is bounded (LRU with idle-key eviction) in both backends.
+"""
+import asyncio
+import threading
 import time
-from typing import Any
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.config import settings
+from app.logging_config import get_logger
+from app.metrics import RATE_LIMIT_DECISIONS, RATE_LIMIT_REDIS_LATENCY
 
 # key -> (count_this_minute, minute_ts)
-_limits: dict[str, tuple[int, int]] = {}
-_limit_lock: Any = None
+_limits: "OrderedDict[str, tuple[int, int]]" = OrderedDict()
+_limit_lock = threading.Lock()
 
+# KEYS[1] bucket; ARGV: capacity, refill rate (tokens/ms), tokens requested.
+# Returns {granted, retry_after_ms}. Uses server TIME so replicas need no clock sync.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+local retry_ms = 0
+if granted == 0 then
+  retry_ms = math.ceil((1 - tokens) / rate)
+end
+return {granted, retry_ms}
+"""
 
-def _get_lock() -> Any:
-    global _limit_lock
-    if _limit_lock is None:
-        import threading
-        _limit_lock = threading.Lock()
-    return _limit_lock
 
+class _Lease:
+    __slots__ = ("tokens", "expires_at", "last_used", "refill")
 
-def check_rate_limit(key: str, limit_per_minute: int) -> tuple[bool, int]:
-    """Returns (allowed, retry_after_seconds). retry_after_seconds is 0 if allowed."""
-    if limit_per_minute <= 0:
-        return True, 0
+    def __init__(self) -> None:
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.last_used = 0.0
+        # In-flight Redis refill shared by the requests waiting for tokens.
+        self.refill: Optional[asyncio.Task] = None
+
+
+_leases: "OrderedDict[str, _Lease]" = OrderedDict()
+_redis: Any = None
+_script: Any = None
+# monotonic time before which Redis is not called after an error
+_redis_retry_at = 0.0
+
+
+def _evict_idle(store: "OrderedDict[str, Any]", is_idle) -> None:
+    """Drop least-recently-used keys that are idle or over the size cap."""
+    while store:
+        key, value = next(iter(store.items()))
+        if len(store) > settings.rate_limit_max_local_keys or is_idle(value):
+            del store[key]
+        else:
+            break
+
+
+def _check_memory(key: str, limit_per_minute: int) -> tuple[bool, int]:
     now = time.time()
     minute_ts = int(now // 60)
-    with _get_lock():
+    with _limit_lock:
+        _evict_idle(_limits, lambda v: v[1] < minute_ts)
         if key not in _limits:
             _limits[key] = (1, minute_ts)
             return True, 0
@@ -30,8 +90,101 @@ def check_rate_limit(key: str, limit_per_minute: int) -> tuple[bool, int]:
             count, window_min = 0, minute_ts
         count += 1
         _limits[key] = (count, window_min)
+        _limits.move_to_end(key)
         if count > limit_per_minute:
             # Retry after the current minute ends
             retry_after = int(60 - (now % 60)) + 1
             return False, min(retry_after, 60)
     return True, 0
+
+
+def _get_script() -> Any:
+    global _redis, _script
+    if _script is None:
+        import redis.asyncio as aioredis
+
+        _redis = aioredis.Redis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.rate_limit_redis_timeout_seconds,
+            socket_connect_timeout=settings.rate_limit_redis_timeout_seconds,
+        )
+        _script = _redis.register_script(_TOKEN_BUCKET_LUA)
+    return _script
+
+
+async def close_rate_limiter() -> None:
+    global _redis, _script, _redis_retry_at
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+    _script = None
+    _redis_retry_at = 0.0
+    _leases.clear()
+
+
+async def _refill(key: str, lease: _Lease, limit_per_minute: int) -> Optional[tuple[bool, int]]:
+    """Lease tokens from Redis; the decision for every waiter, or None once tokens were added."""
+    global _redis_retry_at
+    # Lease at most ~1s of the allowed rate so one replica cannot hoard the bucket.
+    block = max(1, min(settings.rate_limit_lease_size, limit_per_minute // 60))
+    start = time.perf_counter()
+    try:
+        granted, retry_ms = await _get_script()(
+            keys=[f"ratelimit:{key}"],
+            args=[limit_per_minute, limit_per_minute / 60000.0, block],
+        )
+    except Exception as e:
+        _redis_retry_at = time.monotonic() + settings.rate_limit_redis_backoff_seconds
+        get_logger().warning(
+            "rate_limit_redis_error", error=str(e), backoff_seconds=settings.rate_limit_redis_backoff_seconds
+        )
+        return True, 0
+    finally:
+        RATE_LIMIT_REDIS_LATENCY.observe(time.perf_counter() - start)
+        lease.refill = None
+    granted = int(granted)
+    if granted <= 0:
+        lease.tokens = 0
+        return False, max(1, min(60, -(-int(retry_ms) // 1000)))
+    lease.tokens = granted
+    lease.expires_at = time.monotonic() + settings.rate_limit_lease_ttl_seconds
+    return None
+
+
+async def _check_redis(key: str, limit_per_minute: int) -> tuple[bool, int]:
+    now = time.monotonic()
+    idle = settings.rate_limit_idle_seconds
+    _evict_idle(_leases, lambda lease: now - lease.last_used > idle and lease.refill is None)
+    lease = _leases.get(key)
+    if lease is None:
+        lease = _leases[key] = _Lease()
+    _leases.move_to_end(key)
+    lease.last_used = now
+    while True:
+        if lease.tokens > 0 and lease.expires_at > time.monotonic():
+            lease.tokens -= 1
+            return True, 0
+        if time.monotonic() < _redis_retry_at:
+            RATE_LIMIT_DECISIONS.labels(decision="fail_open").inc()
+            return True, 0
+        if lease.refill is None:
+            lease.refill = asyncio.create_task(_refill(key, lease, limit_per_minute))
+        # Shielded: a cancelled request must not cancel the refill other requests wait on.
+        decision = await asyncio.shield(lease.refill)
+        if decision is not None:
+            if decision[0]:
+                RATE_LIMIT_DECISIONS.labels(decision="fail_open").inc()
+            return decision
+
+
+async def check_rate_limit(key: str, limit_per_minute: int) -> tuple[bool, int]:
+    """Returns (allowed, retry_after_seconds). retry_after_seconds is 0 if allowed."""
+    if limit_per_minute <= 0:
+        return True, 0
+    if settings.rate_limit_backend == "redis":
+        allowed, retry_after = await _check_redis(key, limit_per_minute)
+    else:
+        allowed, retry_after = _check_memory(key, limit_per_minute)
+    if not allowed:
+        RATE_LIMIT_DECISIONS.labels(decision="limited").inc()
+    return allowed, retry_after
@@ -0,0 +1,346 @@
+"""Append-only local disk spool used when Kafka is slow or down.
+
+Records are ``(key, value)`` pairs framed as ``>II`` (key length, value length)
+followed by the bytes, appended to numbered segment files. While the spool is
+non-empty every new event is appended too, so the drainer can replay the spool
+into Kafka in arrival order. A ``.pos`` sidecar stores how far the oldest segment
+has been drained so a restart does not replay it from the start. A record that
+keeps failing while Kafka is otherwise healthy is moved to ``dead-letter.dlq``
+(same framing) after ``spool_max_attempts`` tries; ``python -m app.spool_replay``
+produces dead-lettered records again.
+
+Disk I/O runs in worker threads (``asyncio.to_thread``); a lock serialises the
+spool's methods.
+
+Each process locks its own slot directory under ``spool_dir`` (``0/``, ``1/``,
+...), so several uvicorn workers can share one volume and a restarted worker
+picks up the segments left behind by its predecessor.
+"""
+import asyncio
+import fcntl
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from app.config import settings
+from app.kafka_producer import inflight_records, produce_events, producer_healthy
+from app.logging_config import get_logger
+from app.metrics import (
+    SPOOL_APPENDED,
+    SPOOL_BYTES,
+    SPOOL_DEAD_LETTERED,
+    SPOOL_DRAINED,
+    SPOOL_OLDEST_AGE,
+    SPOOL_RECORDS,
+    SPOOL_REJECTED,
+)
+
+_HEADER = struct.Struct(">II")
+_MAX_SLOTS = 64
+# Not *.seg: open() treats every .seg file in the slot as a segment.
+DEAD_LETTER_FILE = "dead-letter.dlq"
+
+
+class SpoolFull(Exception):
+    """Appending would exceed spool_max_bytes."""
+
+
+def encode_frames(records: list[tuple[bytes, bytes]]) -> bytes:
+    return b"".join(_HEADER.pack(len(k), len(v)) + k + v for k, v in records)
+
+
+def iter_frames(path: Path, start: int = 0) -> Iterator[tuple[bytes, bytes]]:
+    """Yield the (key, value) records of a segment or dead-letter file, stopping at a torn tail."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            klen, vlen = _HEADER.unpack(header)
+            body = f.read(klen + vlen)
+            if len(body) < klen + vlen:
+                return
+            yield body[:klen], body[klen:]
+
+
+def _segment_created(path: Path) -> float:
+    # Segment name: <seq>-<created_ms>.seg
+    return int(path.stem.split("-")[1]) / 1000.0
+
+
+class DiskSpool:
+    def __init__(self, directory: str, max_bytes: int, segment_bytes: int, fsync: bool = False):
+        self.root = Path(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.dir: Optional[Path] = None
+        self._lock_fd: Optional[int] = None
+        self._segments: list[Path] = []
+        self._writer: Any = None
+        self._writer_size = 0
+        self._read_pos = 0
+        self._records = 0
+        self._bytes = 0
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def open(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        for slot in range(_MAX_SLOTS):
+            d = self.root / str(slot)
+            d.mkdir(exist_ok=True)
+            fd = os.open(d / ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            self.dir, self._lock_fd = d, fd
+            break
+        else:
+            raise RuntimeError(f"no free spool slot under {self.root}")
+        self._segments = sorted(self.dir.glob("*.seg"))
+        if self._segments:
+            self._next_seq = int(self._segments[-1].stem.split("-")[0]) + 1
+        pos_file = self._pos_file()
+        self._read_pos = int(pos_file.read_text() or 0) if pos_file.exists() else 0
+        for i, seg in enumerate(self._segments):
+            self._bytes += seg.stat().st_size
+            self._records += self._count_records(seg, self._read_pos if i == 0 else 0)
+        self._update_gauges()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # -- state -------------------------------------------------------------
+
+    @property
+    def empty(self) -> bool:
+        return self._records == 0
+
+    def _pos_file(self) -> Path:
+        return self.dir / "read.pos"  # type: ignore[operator]
+
+    def _update_gauges(self) -> None:
+        SPOOL_RECORDS.set(self._records)
+        SPOOL_BYTES.set(self._bytes)
+        SPOOL_OLDEST_AGE.set(time.time() - _segment_created(self._segments[0]) if self._records else 0)
+
+    @staticmethod
+    def _count_records(seg: Path, start: int) -> int:
+        return sum(1 for _ in iter_frames(seg, start))
+
+    # -- write side --------------------------------------------------------
+
+    def append(self, records: list[tuple[bytes, bytes]]) -> None:
+        frames = encode_frames(records)
+        with self._lock:
+            if self._bytes + len(frames) > self.max_bytes:
+                SPOOL_REJECTED.inc(len(records))
+                raise SpoolFull(f"spool at {self._bytes} bytes (max {self.max_bytes})")
+            if self._writer is None or self._writer_size >= self.segment_bytes:
+                self._roll()
+            self._writer.write(frames)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._writer_size += len(frames)
+            self._bytes += len(frames)
+            self._records += len(records)
+            SPOOL_APPENDED.inc(len(records))
+            self._update_gauges()
+
+    def _roll(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        seg = self.dir / f"{self._next_seq:012d}-{int(time.time() * 1000)}.seg"  # type: ignore[operator]
+        self._next_seq += 1
+        self._writer = open(seg, "ab")
+        self._writer_size = 0
+        self._segments.append(seg)
+
+    # -- read side ---------------------------------------------------------
+
+    def read_batch(self, max_records: int) -> tuple[list[tuple[bytes, bytes]], list[int]]:
+        """Read up to max_records from the oldest segment. Returns (records, end position of each)."""
+        with self._lock:
+            if not self._segments:
+                return [], []
+            out: list[tuple[bytes, bytes]] = []
+            ends: list[int] = []
+            with open(self._segments[0], "rb") as f:
+                f.seek(self._read_pos)
+                pos = self._read_pos
+                while len(out) < max_records:
+                    header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+                    klen, vlen = _HEADER.unpack(header)
+                    body = f.read(klen + vlen)
+                    if len(body) < klen + vlen:
+                        break
+                    out.append((body[:klen], body[klen:]))
+                    pos += _HEADER.size + klen + vlen
+                    ends.append(pos)
+            return out, ends
+
+    def commit(self, n_records: int, end_pos: int) -> None:
+        """Mark records up to end_pos of the oldest segment as delivered."""
+        with self._lock:
+            self._advance(n_records, end_pos)
+        SPOOL_DRAINED.inc(n_records)
+
+    def dead_letter(self, record: tuple[bytes, bytes], end_pos: int) -> None:
+        """Move the first unread record (ending at end_pos) to the slot's dead-letter file."""
+        with self._lock:
+            with open(self.dir / DEAD_LETTER_FILE, "ab") as f:  # type: ignore[operator]
+                f.write(encode_frames([record]))
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._advance(1, end_pos)
+        SPOOL_DEAD_LETTERED.inc()
+
+    def _advance(self, n_records: int, end_pos: int) -> None:
+        self._read_pos = end_pos
+        self._records -= n_records
+        self._pos_file().write_text(str(end_pos))
+        self._update_gauges()
+
+    def finish_segment(self) -> None:
+        """Oldest segment fully drained: delete it (rolling the writer first if it is active)."""
+        with self._lock:
+            self._finish_segment()
+
+    def _finish_segment(self) -> None:
+        if not self._segments:
+            return
+        seg = self._segments[0]
+        if self._writer is not None and len(self._segments) == 1:
+            self._writer.close()
+            self._writer = None
+        size = seg.stat().st_size
+        if self._read_pos < size:
+            # Unreadable tail (torn write after a crash): drop it.
+            get_logger().warning("spool_segment_tail_dropped", segment=seg.name, bytes=size - self._read_pos)
+        seg.unlink()
+        self._segments.pop(0)
+        self._bytes -= size
+        self._read_pos = 0
+        self._pos_file().write_text("0")
+        if not self._segments:
+            self._records = 0
+        self._update_gauges()
+
+    def release_drained(self) -> None:
+        """Delete segments left behind once every record has been delivered."""
+        with self._lock:
+            while self.empty and self._segments:
+                self._finish_segment()
+
+
+async def produce_or_spool(
+    producer: Any,
+    spool: Optional[DiskSpool],
+    payloads: list[tuple[bytes, bytes]],
+) -> tuple[list[int], list[int]]:
+    """Produce payloads, diverting them to the spool when Kafka is unhealthy or backlogged.
+
+    Returns (failed indices, spooled indices). Without a spool this behaves like
+    produce_events under kafka_send_timeout_seconds and raises asyncio.TimeoutError.
+    Raises SpoolFull when the spool cannot take the records.
+    """
+    everything = list(range(len(payloads)))
+    if spool is not None and (
+        not spool.empty
+        or (settings.spool_backlog_records > 0 and inflight_records() > settings.spool_backlog_records)
+    ):
+        # Keep arrival order: once anything is spooled, new events queue behind it.
+        await asyncio.to_thread(spool.append, payloads)
+        return [], everything
+    try:
+        failed = await asyncio.wait_for(
+            produce_events(producer, payloads),
+            timeout=settings.kafka_send_timeout_seconds,
+        )
+    except asyncio.TimeoutError:
+        if spool is None:
+            raise
+        # Some records may already have been delivered; replay is at-least-once.
+        await asyncio.to_thread(spool.append, payloads)
+        return [], everything
+    if failed and spool is not None:
+        await asyncio.to_thread(spool.append, [payloads[i] for i in failed])
+        return [], failed
+    return failed, []
+
+
+async def drain_spool(spool: DiskSpool, get_producer: Callable[[], Any], stop: asyncio.Event) -> None:
+    """Replay spooled records into Kafka in order.
+
+    After a partial failure the delivered prefix is committed and the rest is
+    retried. A failure of the first record counts as an attempt only when
+    another record of the batch was delivered or a metadata probe finds Kafka
+    healthy; after ``spool_max_attempts`` attempts it is dead-lettered. A single
+    bad record cannot block the spool, while a Kafka outage dead-letters nothing.
+    """
+    log = get_logger()
+    backoff = settings.spool_retry_backoff_seconds
+    head_pos, head_attempts = -1, 0
+    while not stop.is_set():
+        producer = get_producer()
+        if spool.empty or producer is None:
+            if spool.empty:
+                await asyncio.to_thread(spool.release_drained)
+            await _sleep(stop, settings.spool_drain_idle_seconds)
+            continue
+        records, ends = await asyncio.to_thread(spool.read_batch, settings.spool_drain_batch)
+        if not records:
+            await asyncio.to_thread(spool.finish_segment)
+            continue
+        try:
+            failed = await asyncio.wait_for(
+                produce_events(producer, records),
+                timeout=settings.kafka_send_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            failed = list(range(len(records)))
+        if not failed:
+            backoff = settings.spool_retry_backoff_seconds
+            await asyncio.to_thread(spool.commit, len(records), ends[-1])
+            continue
+        delivered = failed[0]
+        if delivered:
+            await asyncio.to_thread(spool.commit, delivered, ends[delivered - 1])
+        elif len(failed) < len(records) or await producer_healthy(producer):
+            if head_pos != ends[0]:
+                head_pos, head_attempts = ends[0], 0
+            head_attempts += 1
+            if head_attempts >= settings.spool_max_attempts > 0:
+                log.error("spool_record_dead_lettered", attempts=head_attempts, key=records[0][0].decode(errors="replace"))
+                await asyncio.to_thread(spool.dead_letter, records[0], ends[0])
+                continue
+        log.warning(
+            "spool_drain_failed", failed=len(failed), batch=len(records), delivered=delivered, backoff_seconds=backoff
+        )
+        await _sleep(stop, backoff)
+        backoff = min(backoff * 2, settings.spool_retry_backoff_max_seconds)
+
+
+async def _sleep(stop: asyncio.Event, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,90 @@
+"""Produce records that the disk spool dead-lettered back into Kafka.
+
+    python -m app.spool_replay
+    python -m app.spool_replay --dir /var/lib/capture/spool --dry-run
+
+Every ``<slot>/dead-letter.dlq`` under ``--dir`` (default ``CAPTURE_SPOOL_DIR``) is
+first renamed to ``dead-letter-<ms>.replay``, so a running instance starts a new
+dead-letter file, and its records are then produced to ``CAPTURE_KAFKA_TOPIC``.
+A file is deleted once every record was delivered; records that fail again are
+written back to it and retried by the next run. Replay is at-least-once.
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.kafka_producer import get_producer, produce_events
+from app.logging_config import configure_logging, get_logger
+from app.spool import DEAD_LETTER_FILE, encode_frames, iter_frames
+
+def claim_dead_letters(root: Path) -> list[Path]:
+    """Rename each slot's dead-letter file for replay; return every file awaiting replay."""
+    for dlq in sorted(root.glob(f"*/{DEAD_LETTER_FILE}")):
+        dlq.rename(dlq.with_name(f"dead-letter-{int(time.time() * 1000)}.replay"))
+    return sorted(root.glob("*/dead-letter-*.replay"))
+
+
+async def replay_file(producer, path: Path) -> tuple[int, int]:
+    """Produce the records of one claimed file. Returns (delivered, failed)."""
+    records = list(iter_frames(path))
+    retry: list[tuple[bytes, bytes]] = []
+    step = settings.spool_drain_batch
+    for i in range(0, len(records), step):
+        chunk = records[i:i + step]
+        failed = await asyncio.wait_for(
+            produce_events(producer, chunk), timeout=settings.kafka_send_timeout_seconds
+        )
+        retry.extend(chunk[j] for j in failed)
+    if retry:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(encode_frames(retry))
+        os.replace(tmp, path)
+    else:
+        path.unlink()
+    return len(records) - len(retry), len(retry)
+
+
+async def replay(root: Path, dry_run: bool) -> dict[str, int]:
+    log = get_logger()
+    counts = {"files": 0, "replayed": 0, "failed": 0}
+    if dry_run:
+        files = sorted(root.glob(f"*/{DEAD_LETTER_FILE}")) + sorted(root.glob("*/dead-letter-*.replay"))
+        for path in files:
+            counts["files"] += 1
+            counts["replayed"] += sum(1 for _ in iter_frames(path))
+        return counts
+    files = claim_dead_letters(root)
+    if not files:
+        return counts
+    async with get_producer() as producer:
+        for path in files:
+            try:
+                delivered, failed = await replay_file(producer, path)
+            except asyncio.TimeoutError:
+                log.error("spool_replay_timeout", file=str(path))
+                counts["failed"] += sum(1 for _ in iter_frames(path))
+                continue
+            counts["files"] += 1
+            counts["replayed"] += delivered
+            counts["failed"] += failed
+            log.info("spool_replay_file", file=str(path), replayed=delivered, failed=failed)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.spool_replay", description="Produce dead-lettered spool records to Kafka again."
+    )
+    parser.add_argument("--dir", default=settings.spool_dir, help="spool directory (default CAPTURE_SPOOL_DIR)")
+    parser.add_argument("--dry-run", action="store_true", help="count dead-lettered records without producing")
+    args = parser.parse_args()
+    configure_logging()
+    counts = asyncio.run(replay(Path(args.dir), args.dry_run))
+    get_logger().info("spool_replay_done", dry_run=args.dry_run, **counts)
+
+
+if __name__ == "__main__":
+    main()
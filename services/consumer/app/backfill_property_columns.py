@@ -0,0 +1,107 @@
+"""Backfill extracted property columns for rows already in ClickHouse.
+
+    python -m app.backfill_property_columns --partition 202601 --partition 202602
+    python -m app.backfill_property_columns --project proj_1 --dry-run
+
+Fills the columns of ``CONSUMER_PROPERTY_COLUMNS`` (and ``properties_map`` /
+``properties_num`` with ``CONSUMER_PROPERTIES_MAP`` or ``--column``) from
+``properties`` with the same per-project mapping and value rules the consumer
+uses at insert time (``app.property_columns``). Runs one ``ALTER TABLE ... UPDATE`` mutation per
+partition, oldest first, and waits for it to finish before starting the next,
+so only one partition is rewritten at a time. Rerunning is safe: the columns
+are recomputed from ``properties``.
+"""
+import argparse
+import time
+
+from app.clickhouse_client import get_client
+from app.config import settings
+from app.logging_config import configure_logging, get_logger
+from app.property_columns import MAP_COLUMNS, PROPERTIES_MAP_SQL, PROPERTIES_NUM_SQL, extract_sql, property_columns
+
+_POLL_SECONDS = 5.0
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _column_expr(column: str) -> str:
+    """Value of ``column`` for a row, following each project's mapping."""
+    if column == "properties_map":
+        return PROPERTIES_MAP_SQL
+    if column == "properties_num":
+        return PROPERTIES_NUM_SQL
+    branches = []
+    for project, mapping in settings.property_columns.items():
+        if project == "*":
+            continue
+        key = mapping.get(column)
+        branches.append(f"project_id = {_quote(project)}, {extract_sql(key) if key else 'NULL'}")
+    default_key = settings.property_columns.get("*", {}).get(column)
+    default = extract_sql(default_key) if default_key else "NULL"
+    if not branches:
+        return default
+    return f"multiIf({', '.join(branches)}, {default})"
+
+
+def _wait_for_mutations(client, log, partition: str) -> None:
+    while True:
+        row = client.query(
+            "SELECT count(), any(latest_fail_reason) FROM system.mutations"
+            " WHERE database = {db:String} AND table = {table:String} AND NOT is_done",
+            parameters={"db": settings.clickhouse_database, "table": settings.clickhouse_table},
+        ).result_rows[0]
+        if not row[0]:
+            return
+        if row[1]:
+            log.warning("backfill_mutation_failing", partition=partition, reason=row[1])
+        time.sleep(_POLL_SECONDS)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.backfill_property_columns",
+        description="Fill extracted property columns of existing rows.",
+    )
+    parser.add_argument("--partition", action="append", help="partition id, e.g. 202601 (repeatable; default all)")
+    parser.add_argument("--project", action="append", help="only rows of this project (repeatable)")
+    parser.add_argument("--column", action="append", help="only this column (repeatable; default all mapped)")
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without running them")
+    args = parser.parse_args()
+    configure_logging()
+    log = get_logger()
+
+    candidates = property_columns.columns + tuple(c for c in MAP_COLUMNS if c not in property_columns.columns)
+    columns = [c for c in candidates if c in (args.column or property_columns.columns)]
+    if not columns:
+        log.error("backfill_no_columns", configured=list(property_columns.columns))
+        raise SystemExit(1)
+    client = get_client()
+    partitions = [
+        row[0]
+        for row in client.query(
+            "SELECT DISTINCT partition_id FROM system.parts"
+            " WHERE database = {db:String} AND table = {table:String} AND active ORDER BY partition_id",
+            parameters={"db": settings.clickhouse_database, "table": settings.clickhouse_table},
+        ).result_rows
+    ]
+    if args.partition:
+        partitions = [p for p in partitions if p in args.partition]
+    assignments = ", ".join(f"{c} = {_column_expr(c)}" for c in columns)
+    where = f"project_id IN ({', '.join(_quote(p) for p in args.project)})" if args.project else "1"
+    table = f"{settings.clickhouse_database}.{settings.clickhouse_table}"
+    for partition in partitions:
+        statement = f"ALTER TABLE {table} UPDATE {assignments} IN PARTITION ID {_quote(partition)} WHERE {where}"
+        if args.dry_run:
+            print(statement + ";")
+            continue
+        start = time.monotonic()
+        client.command(statement)
+        _wait_for_mutations(client, log, partition)
+        log.info("backfill_partition_done", partition=partition, columns=columns, seconds=round(time.monotonic() - start, 1))
+    log.info("backfill_done", partitions=len(partitions), columns=columns, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Batch size and flush interval for the consumer, optionally adaptive.
+
+With ``CONSUMER_ADAPTIVE_BATCHING=false`` (default) the values are the static
+``CONSUMER_BATCH_SIZE`` / ``CONSUMER_BATCH_INTERVAL_SECONDS``. When enabled, the
+controller re-tunes every few seconds, aiming for
+``CONSUMER_TARGET_INSERTS_PER_SECOND`` inserts per process. A flush writes
+one insert per partition with buffered events, so ``batch_size`` (the flush
+trigger, rows across partitions) is the per-insert size times the average
+number of partitions per flush:
+
+- per-insert size = incoming events/s / target rate, scaled up when observed
+  insert latency is too high to sustain the target with
+  ``max_inflight_batches`` in flight, and set to the maximum while lag
+  exceeds it (catching up);
+- interval = time to fill that size at the current rate, but at least one
+  target period per partition, so low traffic makes fewer, larger inserts.
+
+The per-insert size stays within ``batch_size_min``/``_max``, the interval
+within its bounds; both move halfway towards the new target per step to
+avoid oscillation.
+"""
+import time
+
+from app.config import settings
+from app.metrics import BATCH_INTERVAL_CURRENT, BATCH_SIZE_CURRENT
+
+_UPDATE_SECONDS = 5.0
+_EWMA_ALPHA = 0.5
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return max(low, min(high, value))
+
+
+class BatchController:
+    def __init__(self) -> None:
+        self.adaptive = settings.adaptive_batching
+        self.batch_size = settings.batch_size
+        self.interval_seconds = settings.batch_interval_seconds
+        if self.adaptive:
+            self.batch_size = int(_clamp(self.batch_size, settings.batch_size_min, settings.batch_size_max))
+            self.interval_seconds = _clamp(
+                self.interval_seconds, settings.batch_interval_min_seconds, settings.batch_interval_max_seconds
+            )
+        self._consumed = 0
+        self._last_update = time.monotonic()
+        self._rate: float | None = None
+        self._insert_latency: float | None = None
+        self._partitions: float | None = None
+        self._publish()
+
+    def observe_consumed(self, events: int) -> None:
+        self._consumed += events
+
+    def observe_insert(self, rows: int, seconds: float) -> None:
+        if self._insert_latency is None:
+            self._insert_latency = seconds
+        else:
+            self._insert_latency += _EWMA_ALPHA * (seconds - self._insert_latency)
+
+    def observe_flush(self, partitions: int) -> None:
+        """Record a flush that started ``partitions`` inserts."""
+        if self._partitions is None:
+            self._partitions = float(partitions)
+        else:
+            self._partitions += _EWMA_ALPHA * (partitions - self._partitions)
+
+    def update(self, lag: int) -> None:
+        """Re-tune from the rate since the last step, insert latency and ``lag`` (messages)."""
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        if elapsed < _UPDATE_SECONDS:
+            return
+        rate = self._consumed / elapsed
+        self._consumed = 0
+        self._last_update = now
+        self._rate = rate if self._rate is None else self._rate + _EWMA_ALPHA * (rate - self._rate)
+
+        target = settings.target_inserts_per_second
+        partitions = max(1.0, self._partitions or 1.0)
+        size = self._rate / target
+        if self._insert_latency is not None:
+            # Inserts that take longer than the in-flight slots allow can't keep the target rate.
+            saturation = self._insert_latency * target / max(1, settings.max_inflight_batches)
+            if saturation > 1:
+                size *= saturation
+        if lag > settings.batch_size_max:
+            size = settings.batch_size_max
+        # Each flush makes one insert per partition: scale the flush size to keep the insert rate.
+        size = _clamp(size, settings.batch_size_min, settings.batch_size_max) * partitions
+        interval = max(partitions / target, size / self._rate) if self._rate > 0 else settings.batch_interval_max_seconds
+        interval = _clamp(interval, settings.batch_interval_min_seconds, settings.batch_interval_max_seconds)
+
+        self.batch_size = int(self.batch_size + (size - self.batch_size) / 2) or 1
+        self.interval_seconds += (interval - self.interval_seconds) / 2
+        self._publish()
+
+    def _publish(self) -> None:
+        BATCH_SIZE_CURRENT.set(self.batch_size)
+        BATCH_INTERVAL_CURRENT.set(self.interval_seconds)
@@ -0,0 +1,102 @@
+"""Circuit breaker for ClickHouse writes.
+
+Closed: inserts run normally; consecutive failed attempts are counted. At
+``CONSUMER_CLICKHOUSE_BREAKER_FAILURE_THRESHOLD`` the breaker opens: writers stop
+retrying and wait, and the consumer pauses its partitions. While open, a probe
+(``SELECT 1``) runs every ``CONSUMER_CLICKHOUSE_BREAKER_PROBE_INTERVAL_SECONDS``,
+doubling up to ``..._PROBE_MAX_INTERVAL_SECONDS``; the first successful probe
+closes the breaker and the waiting batches are retried.
+
+Only failures that mean ClickHouse is unreachable or overloaded count
+(``is_unavailable``); a batch the server rejects (bad data, schema or settings
+error) does not open the breaker and is dead-lettered by the writer.
+"""
+import asyncio
+import re
+from typing import Any, Awaitable, Callable
+
+from clickhouse_connect.driver.exceptions import OperationalError
+
+from app.config import settings
+from app.metrics import CLICKHOUSE_CIRCUIT_OPEN, CLICKHOUSE_CIRCUIT_OPENED
+
+# ClickHouse error codes for an overloaded or degraded server rather than a bad batch:
+# TIMEOUT_EXCEEDED, TOO_MANY_SIMULTANEOUS_QUERIES, SOCKET_TIMEOUT, NETWORK_ERROR,
+# MEMORY_LIMIT_EXCEEDED, TABLE_IS_READ_ONLY, TOO_MANY_PARTS, KEEPER_EXCEPTION
+_UNAVAILABLE_CODES = {159, 202, 209, 210, 241, 242, 252, 999}
+_HTTP_5XX = re.compile(r"HTTP status 5\d\d")
+_ERROR_CODE = re.compile(r"\b[Cc]ode:\s*(\d+)")
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """True if ``exc`` means ClickHouse is unavailable (connection, timeout, 5xx, overload)."""
+    if isinstance(exc, (OSError, TimeoutError)):
+        return True
+    code = getattr(exc, "code", None)
+    if code is None:
+        match = _ERROR_CODE.search(str(exc))
+        code = int(match.group(1)) if match else None
+    if code is not None:
+        return code in _UNAVAILABLE_CODES
+    if isinstance(exc, OperationalError):
+        return True
+    return bool(_HTTP_5XX.search(str(exc)))
+
+
+class CircuitBreaker:
+    def __init__(self, probe: Callable[[], Awaitable[bool]], log: Any):
+        self._probe = probe
+        self._log = log
+        self._closed = asyncio.Event()
+        self._closed.set()
+        self._failures = 0
+        self._probe_task: asyncio.Task | None = None
+        CLICKHOUSE_CIRCUIT_OPEN.set(0)
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed.is_set()
+
+    async def wait_closed(self) -> None:
+        await self._closed.wait()
+
+    async def probe(self) -> bool:
+        return await self._probe()
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if settings.clickhouse_breaker_enabled and self._failures >= settings.clickhouse_breaker_failure_threshold:
+            self.open()
+
+    def open(self) -> None:
+        if self.is_open or not settings.clickhouse_breaker_enabled:
+            return
+        self._closed.clear()
+        CLICKHOUSE_CIRCUIT_OPEN.set(1)
+        CLICKHOUSE_CIRCUIT_OPENED.inc()
+        self._log.error("clickhouse_circuit_open", failures=self._failures)
+        self._probe_task = asyncio.create_task(self._probe_until_healthy())
+
+    async def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _probe_until_healthy(self) -> None:
+        delay = settings.clickhouse_breaker_probe_interval_seconds
+        while True:
+            await asyncio.sleep(delay)
+            if await self._probe():
+                break
+            delay = min(delay * 2, settings.clickhouse_breaker_probe_max_interval_seconds)
+            self._log.warning("clickhouse_probe_failed", next_probe_seconds=delay)
+        self._failures = 0
+        self._closed.set()
+        CLICKHOUSE_CIRCUIT_OPEN.set(0)
+        self._log.info("clickhouse_circuit_closed")
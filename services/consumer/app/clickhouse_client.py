@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from typing import Any, Optional
 from uuid import UUID
@@ -6,6 +7,21 @@ import clickhouse_connect
 from clickhouse_connect.driver import Client
 
 from app.config import settings
+from app.envelope import RawJSON
+from app.property_columns import property_columns
+
+# Columns of analytics.events written by the consumer, in EventColumns order.
+EVENT_COLUMNS = (
+    "timestamp",
+    "uuid",
+    "event",
+    "distinct_id",
+    "project_id",
+    "properties",
+    "lib",
+    "lib_version",
+    "device_id",
+)
 
 
 def get_client() -> Client:
@@ -29,43 +45,98 @@ def _parse_ts(ts: Any) -> Optional[datetime]:
     return None
 
 
-def row_from_event(raw: dict[str, Any]) -> tuple:
-    """Build a row tuple for analytics.events (timestamp, uuid, event, distinct_id, project_id, properties, lib, lib_version, device_id)."""
-    ts = _parse_ts(raw.get("timestamp")) or datetime.utcnow()
-    uuid_val = raw.get("uuid")
-    if uuid_val is not None and uuid_val != "":
-        try:
-            uuid_val = UUID(str(uuid_val))
-        except (ValueError, TypeError):
+class EventColumns:
+    """Batch buffer for analytics.events, one list per column.
+
+    Events are converted straight into column values; the decoded dicts and
+    per-row tuples are not kept. DLQ payloads are rebuilt from the columns
+    only if the insert fails (``to_events``). Configured property columns and
+    property maps (``app.property_columns``) are kept in ``extracted``.
+    """
+
+    __slots__ = EVENT_COLUMNS + ("extracted",)
+
+    def __init__(self) -> None:
+        for name in EVENT_COLUMNS:
+            setattr(self, name, [])
+        self.extracted: dict[str, list[Any]] = {name: [] for name in property_columns.columns}
+
+    def __len__(self) -> int:
+        return len(self.event)
+
+    def append(self, raw: dict[str, Any]) -> None:
+        """Convert one event and append it. Raises before touching any column if a field is invalid."""
+        ts = _parse_ts(raw.get("timestamp")) or datetime.utcnow()
+        uuid_val = raw.get("uuid")
+        if uuid_val is not None and uuid_val != "":
+            try:
+                uuid_val = UUID(str(uuid_val))
+            except (ValueError, TypeError):
+                uuid_val = None
+        else:
             uuid_val = None
-    else:
-        uuid_val = None
-    event = str(raw.get("event", ""))[:4096]
-    distinct_id = str(raw.get("distinct_id", ""))[:4096]
-    project_id = str(raw.get("project_id") or "default")[:256]
-    import json
-    properties = json.dumps(raw.get("properties") or {})
-    lib = (raw.get("$lib") or raw.get("lib")) and str((raw.get("$lib") or raw.get("lib")))[:128]
-    lib_version = (raw.get("$lib_version") or raw.get("lib_version")) and str((raw.get("$lib_version") or raw.get("lib_version")))[:64]
-    device_id = (raw.get("$device_id") or raw.get("device_id")) and str((raw.get("$device_id") or raw.get("device_id")))[:256]
-    return (ts, uuid_val, event, distinct_id, project_id, properties, lib, lib_version, device_id)
-
-
-def insert_batch(client: Client, rows: list[tuple]) -> None:
-    if not rows:
+        event = str(raw.get("event", ""))[:4096]
+        distinct_id = str(raw.get("distinct_id", ""))[:4096]
+        project_id = str(raw.get("project_id") or "default")[:256]
+        properties = raw.get("properties")
+        extracted = property_columns.extract(project_id, properties) if self.extracted else ()
+        if isinstance(properties, RawJSON):
+            # Plain str copy: str subclass instances use a larger non-compact layout.
+            properties = str(properties)
+        else:
+            properties = json.dumps(properties or {})
+        lib = raw.get("$lib") or raw.get("lib")
+        lib_version = raw.get("$lib_version") or raw.get("lib_version")
+        device_id = raw.get("$device_id") or raw.get("device_id")
+        self.timestamp.append(ts)
+        self.uuid.append(uuid_val)
+        self.event.append(event)
+        self.distinct_id.append(distinct_id)
+        self.project_id.append(project_id)
+        self.properties.append(properties)
+        self.lib.append(lib and str(lib)[:128])
+        self.lib_version.append(lib_version and str(lib_version)[:64])
+        self.device_id.append(device_id and str(device_id)[:256])
+        for values, value in zip(self.extracted.values(), extracted):
+            values.append(value)
+
+    def column_names(self) -> list[str]:
+        return list(EVENT_COLUMNS) + list(self.extracted)
+
+    def columns(self) -> list[list[Any]]:
+        return [getattr(self, name) for name in EVENT_COLUMNS] + list(self.extracted.values())
+
+    def to_events(self) -> list[dict[str, Any]]:
+        """Rebuild event payloads (capture format) from the column values, for the DLQ."""
+        events = []
+        for i in range(len(self)):
+            raw: dict[str, Any] = {
+                "event": self.event[i],
+                "distinct_id": self.distinct_id[i],
+                "project_id": self.project_id[i],
+                "timestamp": self.timestamp[i].isoformat(),
+            }
+            try:
+                raw["properties"] = json.loads(self.properties[i])
+            except ValueError:
+                raw["properties"] = self.properties[i]
+            if self.uuid[i] is not None:
+                raw["uuid"] = str(self.uuid[i])
+            for key, value in (("$lib", self.lib[i]), ("$lib_version", self.lib_version[i]), ("$device_id", self.device_id[i])):
+                if value:
+                    raw[key] = value
+            events.append(raw)
+        return events
+
+
+def insert_batch(client: Client, batch: EventColumns, dedup_token: Optional[str] = None) -> None:
+    """Insert the batch. With ``dedup_token``, ClickHouse drops a repeat insert of the same token."""
+    if not len(batch):
         return
     client.insert(
         settings.clickhouse_table,
-        rows,
-        column_names=[
-            "timestamp",
-            "uuid",
-            "event",
-            "distinct_id",
-            "project_id",
-            "properties",
-            "lib",
-            "lib_version",
-            "device_id",
-        ],
+        batch.columns(),
+        column_names=batch.column_names(),
+        column_oriented=True,
+        settings={"insert_deduplication_token": dedup_token} if dedup_token else None,
     )
@@ -11,11 +11,42 @@ class Settings(BaseSettings):
     clickhouse_table: str = "events"
     batch_size: int = 1000
     batch_interval_seconds: float = 5.0
+    # Adaptive batching: tune size/interval within these bounds for the target insert rate
+    adaptive_batching: bool = False
+    batch_size_min: int = 100
+    batch_size_max: int = 20000
+    batch_interval_min_seconds: float = 0.5
+    batch_interval_max_seconds: float = 10.0
+    target_inserts_per_second: float = 1.0
+    fetch_max_records: int = 2000
+    fetch_timeout_ms: int = 1000
+    lazy_decode: bool = True
+    # {project_id or "*": {column: property key}}; see app/property_columns.py
+    property_columns: dict[str, dict[str, str]] = {}
+    # Also write properties_map / properties_num Map columns (needs the properties map migration)
+    properties_map: bool = False
     metrics_port: int = 9090
+    # /ready on the metrics port fails above this total partition lag (0 = ignore lag)
+    ready_max_lag: int = 100000
     insert_retry_count: int = 3
     insert_retry_backoff_seconds: float = 1.0
+    # Send an insert_deduplication_token derived from the batch's Kafka offsets
+    insert_deduplication: bool = True
+    max_inflight_batches: int = 2
+    # Circuit breaker around ClickHouse writes (app/circuit.py)
+    clickhouse_breaker_enabled: bool = True
+    clickhouse_breaker_failure_threshold: int = 3
+    clickhouse_breaker_probe_interval_seconds: float = 5.0
+    clickhouse_breaker_probe_max_interval_seconds: float = 60.0
+    # Times one batch is retried after the breaker closes again before it is dead-lettered
+    clickhouse_breaker_batch_max_reopens: int = 5
     dlq_topic: str = "events-dlq"
+    dlq_replay_group_id: str = "events-dlq-replay"
     shutdown_wait_seconds: float = 30.0
+    # Supervisor (python -m app.supervisor); workers=0 means one per CPU
+    workers: int = 0
+    worker_restart_backoff_seconds: float = 1.0
+    metrics_multiproc_dir: str = ""
 
     class Config:
         env_prefix = "CONSUMER_"
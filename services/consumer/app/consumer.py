@@ -1,179 +1,127 @@
 import asyncio
-import json
 import signal
 import time
 from typing import Any
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
-from clickhouse_connect.driver import Client
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRecord, TopicPartition
 
-from app.clickhouse_client import get_client, insert_batch, row_from_event
+from app.batch_control import BatchController
+from app.clickhouse_client import EventColumns
 from app.config import settings
 from app.dlq import send_to_dlq
+from app.envelope import MessageDecodeError, decode_message, full_event
 from app.logging_config import configure_logging, get_logger
-from app.metrics import (
-    BATCH_SIZE,
-    BATCHES_WRITTEN,
-    INSERT_ERRORS,
-    INSERT_LATENCY,
-    MESSAGES_CONSUMED,
-    PARSE_ERRORS,
-    start_metrics_server,
-)
+from app.metrics import MESSAGES_CONSUMED, PARSE_ERRORS, start_metrics_server
+from app.writer import BatchWriter, WriterRebalanceListener
 
 shutdown_event = asyncio.Event()
 
 
-async def _insert_with_retries(
-    client: Client,
-    rows: list[tuple],
+async def _process_message(
+    msg: ConsumerRecord,
+    producer: AIOKafkaProducer,
+    buffer: EventColumns,
     log: Any,
-) -> bool:
-    """Insert batch with retries. Returns True on success, False on final failure."""
-    last_error = None
-    for attempt in range(settings.insert_retry_count):
+) -> int:
+    """Decode one Kafka message and append its events to the buffer. Returns the number buffered."""
+    try:
+        events = decode_message(msg.value)
+    except MessageDecodeError as e:
+        PARSE_ERRORS.inc()
+        log.warning("decode_error", error=str(e), partition=msg.partition, offset=msg.offset)
+        await send_to_dlq(
+            producer,
+            [{"undecodable": msg.value.decode("utf-8", "replace")}],
+            error_kind="decode_error",
+            error_message=str(e),
+        )
+        return 0
+    buffered = 0
+    for raw in events:
         try:
-            insert_batch(client, rows)
-            return True
+            if not raw.get("event") or not raw.get("distinct_id"):
+                continue
+            buffer.append(raw)
+            buffered += 1
         except Exception as e:
-            last_error = e
-            if attempt < settings.insert_retry_count - 1:
-                backoff = settings.insert_retry_backoff_seconds * (2**attempt)
-                log.warning(
-                    "insert_retry",
-                    attempt=attempt + 1,
-                    error=str(e),
-                    backoff_seconds=backoff,
-                )
-                await asyncio.sleep(backoff)
-            else:
-                log.error("insert_final_failure", error=str(e))
-    return False
+            PARSE_ERRORS.inc()
+            log.warning("parse_error", error=str(e), event_id=raw.get("uuid"))
+            await send_to_dlq(
+                producer,
+                [full_event(raw)],
+                error_kind="parse_error",
+                error_message=str(e),
+            )
+    return buffered
+
+
+def _lag(consumer: AIOKafkaConsumer, fetched: dict[TopicPartition, int]) -> int:
+    """Messages between what this process has fetched and the high watermarks."""
+    lag = 0
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is not None and tp in fetched:
+            lag += max(0, highwater - fetched[tp])
+    return lag
 
 
 async def run_consumer() -> None:
     log = get_logger()
     bootstrap = settings.kafka_bootstrap_servers.split(",")
     consumer = AIOKafkaConsumer(
-        settings.kafka_topic,
         bootstrap_servers=bootstrap,
         group_id=settings.kafka_group_id,
-        value_deserializer=lambda m: json.loads(m.decode("utf-8")) if m else {},
         auto_offset_reset="earliest",
         enable_auto_commit=False,
     )
-    await consumer.start()
     producer = AIOKafkaProducer(bootstrap_servers=bootstrap)
+    control = BatchController()
+    writer = BatchWriter(consumer, producer, control, log)
+    await writer.start()
     await producer.start()
-    client = get_client()
-    # Buffer (raw, row) for insert and DLQ
-    buffer: list[tuple[dict[str, Any], tuple]] = []
-    last_flush = time.monotonic()
+    consumer.subscribe([settings.kafka_topic], listener=WriterRebalanceListener(consumer, writer))
+    await consumer.start()
+    deadline = time.monotonic() + control.interval_seconds
+    # Next offset to fetch per partition, for lag
+    fetched: dict[TopicPartition, int] = {}
 
     try:
         while not shutdown_event.is_set():
-            try:
-                msg = await asyncio.wait_for(
-                    consumer.getone(), timeout=1.0
-                )
-            except asyncio.TimeoutError:
-                now = time.monotonic()
-                if len(buffer) >= settings.batch_size or (
-                    now - last_flush
-                ) >= settings.batch_interval_seconds:
-                    if buffer:
-                        start = time.perf_counter()
-                        raws = [r for r, _ in buffer]
-                        rows = [row for _, row in buffer]
-                        success = await _insert_with_retries(client, rows, log)
-                        INSERT_LATENCY.observe(time.perf_counter() - start)
-                        if success:
-                            BATCHES_WRITTEN.inc()
-                            BATCH_SIZE.observe(len(buffer))
-                            log.info("batch_inserted", count=len(buffer))
-                        else:
-                            INSERT_ERRORS.inc()
-                            await send_to_dlq(
-                                producer,
-                                raws,
-                                error_kind="insert_failed",
-                                error_message="insert retries exhausted",
-                            )
-                            log.error("batch_sent_to_dlq", count=len(buffer))
-                        await consumer.commit()
-                        buffer = []
-                    last_flush = now
-                continue
-            raw = msg.value or {}
-            try:
-                if not raw.get("event") or not raw.get("distinct_id"):
-                    continue
-                row = row_from_event(raw)
-                buffer.append((raw, row))
-                MESSAGES_CONSUMED.inc()
-            except Exception as e:
-                PARSE_ERRORS.inc()
-                log.warning("parse_error", error=str(e), event_id=raw.get("uuid"))
-                await send_to_dlq(
-                    producer,
-                    [raw],
-                    error_kind="parse_error",
-                    error_message=str(e),
-                )
-                await consumer.commit()
-
-            now = time.monotonic()
-            if len(buffer) >= settings.batch_size or (
-                now - last_flush
-            ) >= settings.batch_interval_seconds:
-                if buffer:
-                    start = time.perf_counter()
-                    raws = [r for r, _ in buffer]
-                    rows = [row for _, row in buffer]
-                    success = await _insert_with_retries(client, rows, log)
-                    INSERT_LATENCY.observe(time.perf_counter() - start)
-                    if success:
-                        BATCHES_WRITTEN.inc()
-                        BATCH_SIZE.observe(len(buffer))
-                        log.info("batch_inserted", count=len(buffer))
-                    else:
-                        INSERT_ERRORS.inc()
-                        await send_to_dlq(
-                            producer,
-                            raws,
-                            error_kind="insert_failed",
-                            error_message="insert retries exhausted",
-                        )
-                        log.error("batch_sent_to_dlq", count=len(buffer))
-                    await consumer.commit()
-                    buffer = []
-                last_flush = now
+            writer.apply_backpressure()
+            # Never wait past the flush deadline, so time-based flushes are on schedule.
+            wait = min(settings.fetch_timeout_ms / 1000, deadline - time.monotonic())
+            batches = await consumer.getmany(
+                timeout_ms=max(0, int(wait * 1000)),
+                max_records=settings.fetch_max_records,
+            )
+            for tp, messages in batches.items():
+                consumed = 0
+                for msg in messages:
+                    consumed += await _process_message(msg, producer, writer.buffer_for(tp), log)
+                    if writer.track(tp, msg):
+                        # End of a batch recorded before a crash or rebalance: cut it at the same offset.
+                        await writer.flush([tp])
+                    elif writer.buffered >= control.batch_size and not writer.paused:
+                        await writer.flush()
+                        deadline = time.monotonic() + control.interval_seconds
+                if messages:
+                    fetched[tp] = messages[-1].offset + 1
+                MESSAGES_CONSUMED.inc(consumed)
+                control.observe_consumed(consumed)
+            if time.monotonic() >= deadline and not writer.paused:
+                await writer.flush()
+                deadline = time.monotonic() + control.interval_seconds
+            await writer.commit_completed()
+            control.update(_lag(consumer, fetched))
+            writer.update_lag()
     finally:
-        if buffer:
-            start = time.perf_counter()
-            raws = [r for r, _ in buffer]
-            rows = [row for _, row in buffer]
-            success = await _insert_with_retries(client, rows, log)
-            INSERT_LATENCY.observe(time.perf_counter() - start)
-            if success:
-                BATCHES_WRITTEN.inc()
-                BATCH_SIZE.observe(len(buffer))
-                log.info("final_batch_inserted", count=len(buffer))
-            else:
-                INSERT_ERRORS.inc()
-                await send_to_dlq(
-                    producer,
-                    raws,
-                    error_kind="insert_failed",
-                    error_message="insert retries exhausted (shutdown)",
-                )
-                log.error("final_batch_sent_to_dlq", count=len(buffer))
-            await consumer.commit()
+        await writer.drain(final=True)
+        await writer.close()
         await producer.stop()
         await consumer.stop()
 
 
-def main() -> None:
+def main(serve_metrics: bool = True) -> None:
     def _on_signal() -> None:
         shutdown_event.set()
 
@@ -183,7 +131,8 @@ def main() -> None:
     except AttributeError:
         pass  # Windows may not have SIGTERM
     configure_logging()
-    start_metrics_server(settings.metrics_port)
+    if serve_metrics:
+        start_metrics_server(settings.metrics_port)
     asyncio.run(run_consumer())
 
 
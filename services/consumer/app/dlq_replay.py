@@ -0,0 +1,220 @@
+"""Replay events from the dead-letter topic.
+
+    python -m app.dlq_replay --error-kind insert_failed --since 2026-01-01T00:00:00Z --rate 2000
+    python -m app.dlq_replay --target clickhouse --dry-run
+
+Reads ``CONSUMER_DLQ_TOPIC`` up to the end offsets seen at startup, keeps records
+matching ``--error-kind`` and the ``dlq_ts`` range, and re-injects their ``raw``
+event into ``CONSUMER_KAFKA_TOPIC`` (default) or inserts it into ClickHouse
+directly, at most ``--rate`` events per second. Offsets are committed under
+``--group-id`` after each chunk is written, so an interrupted replay resumes
+where it stopped. Payloads that are not replayable events (e.g. undecodable
+messages) are counted as skipped.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener, TopicPartition
+
+from app.clickhouse_client import EventColumns, get_client, insert_batch
+from app.config import settings
+from app.logging_config import configure_logging, get_logger
+from app.metrics import DLQ_REPLAY_MESSAGES, DLQ_REPLAY_REMAINING, start_metrics_server
+
+_DLQ_TS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+_PROGRESS_INTERVAL_SECONDS = 10.0
+_ASSIGN_TIMEOUT_SECONDS = 60.0
+
+
+def _parse_time(value: str) -> datetime:
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class _SeekOnAssign(ConsumerRebalanceListener):
+    """Record end offsets for the assigned partitions and skip ahead to ``since``."""
+
+    def __init__(self, consumer: AIOKafkaConsumer, since: datetime | None):
+        self._consumer = consumer
+        self._since = since
+        self.end_offsets: dict[TopicPartition, int] = {}
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        pass
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        if not assigned:
+            return
+        self.end_offsets.update(await self._consumer.end_offsets(list(assigned)))
+        if self._since is None:
+            return
+        since_ms = int(self._since.timestamp() * 1000)
+        found = await self._consumer.offsets_for_times({tp: since_ms for tp in assigned})
+        for tp, ot in found.items():
+            committed = await self._consumer.committed(tp)
+            target = ot.offset if ot is not None else self.end_offsets[tp]
+            if committed is None or target > committed:
+                self._consumer.seek(tp, target)
+
+
+class Replayer:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.log = get_logger()
+        self.error_kinds = set(args.error_kind or [])
+        self.since = args.since.strftime(_DLQ_TS_FORMAT) if args.since else None
+        self.until = args.until.strftime(_DLQ_TS_FORMAT) if args.until else None
+        self.counts = {"replayed": 0, "filtered": 0, "skipped": 0}
+        self._producer: AIOKafkaProducer | None = None
+        self._client = None
+
+    def _matches(self, doc: dict[str, Any]) -> bool:
+        if self.error_kinds and doc.get("error_kind") not in self.error_kinds:
+            return False
+        ts = doc.get("dlq_ts") or ""
+        if self.since and ts < self.since:
+            return False
+        if self.until and ts >= self.until:
+            return False
+        return True
+
+    def _select(self, value: bytes | None) -> dict[str, Any] | None:
+        """Return the replayable raw event of a DLQ record, or None (counted)."""
+        try:
+            doc = json.loads(value or b"")
+        except ValueError:
+            doc = None
+        if not isinstance(doc, dict):
+            self._count("skipped")
+            return None
+        if not self._matches(doc):
+            self._count("filtered")
+            return None
+        raw = doc.get("raw")
+        if not isinstance(raw, dict) or not raw.get("event") or not raw.get("distinct_id"):
+            self._count("skipped")
+            return None
+        return raw
+
+    def _count(self, outcome: str, n: int = 1) -> None:
+        self.counts[outcome] += n
+        DLQ_REPLAY_MESSAGES.labels(outcome=outcome).inc(n)
+
+    async def _write(self, events: list[dict[str, Any]]) -> None:
+        if self.args.dry_run:
+            self._count("replayed", len(events))
+            return
+        if self.args.target == "kafka":
+            if self._producer is None:
+                self._producer = AIOKafkaProducer(bootstrap_servers=settings.kafka_bootstrap_servers.split(","))
+                await self._producer.start()
+            deliveries = [
+                await self._producer.send(
+                    settings.kafka_topic,
+                    value=json.dumps(raw).encode("utf-8"),
+                    key=str(raw["distinct_id"]).encode("utf-8"),
+                )
+                for raw in events
+            ]
+            await asyncio.gather(*deliveries)
+            self._count("replayed", len(events))
+            return
+        columns = EventColumns()
+        for raw in events:
+            try:
+                columns.append(raw)
+            except Exception as e:
+                self.log.warning("dlq_replay_unparseable", error=str(e), event_id=raw.get("uuid"))
+                self._count("skipped")
+        if self._client is None:
+            self._client = await asyncio.to_thread(get_client)
+        await asyncio.to_thread(insert_batch, self._client, columns)
+        self._count("replayed", len(columns))
+
+    async def run(self) -> dict[str, int]:
+        consumer = AIOKafkaConsumer(
+            bootstrap_servers=settings.kafka_bootstrap_servers.split(","),
+            group_id=self.args.group_id,
+            auto_offset_reset="earliest",
+            enable_auto_commit=False,
+        )
+        listener = _SeekOnAssign(consumer, self.args.since)
+        consumer.subscribe([settings.dlq_topic], listener=listener)
+        await consumer.start()
+        rate = self.args.rate
+        chunk_size = max(1, min(settings.batch_size, int(rate) if rate > 0 else settings.batch_size))
+        pending: list[dict[str, Any]] = []
+        offsets: dict[TopicPartition, int] = {}
+        start = last_progress = time.monotonic()
+        try:
+            while True:
+                batches = await consumer.getmany(timeout_ms=1000, max_records=chunk_size)
+                for tp, messages in batches.items():
+                    for msg in messages:
+                        raw = self._select(msg.value)
+                        if raw is not None:
+                            pending.append(raw)
+                        offsets[tp] = msg.offset + 1
+                assignment = consumer.assignment()
+                remaining = 0
+                if assignment and listener.end_offsets:
+                    for tp in assignment:
+                        remaining += max(0, listener.end_offsets.get(tp, 0) - await consumer.position(tp))
+                done = bool(assignment) and bool(listener.end_offsets) and remaining == 0
+                if pending and (len(pending) >= chunk_size or done):
+                    await self._write(pending)
+                    pending = []
+                    if rate > 0 and not self.args.dry_run:
+                        # Pace writes to the configured events/second.
+                        ahead = self.counts["replayed"] / rate - (time.monotonic() - start)
+                        if ahead > 0:
+                            await asyncio.sleep(ahead)
+                if offsets and not pending and not self.args.dry_run:
+                    await consumer.commit(offsets)
+                    offsets = {}
+                DLQ_REPLAY_REMAINING.set(remaining)
+                now = time.monotonic()
+                if done or now - last_progress >= _PROGRESS_INTERVAL_SECONDS:
+                    last_progress = now
+                    self.log.info(
+                        "dlq_replay_progress",
+                        remaining=remaining,
+                        events_per_second=round(self.counts["replayed"] / max(now - start, 1e-9), 1),
+                        **self.counts,
+                    )
+                if done:
+                    break
+                if not assignment and now - start >= _ASSIGN_TIMEOUT_SECONDS:
+                    self.log.error("dlq_replay_no_partitions", topic=settings.dlq_topic)
+                    break
+        finally:
+            await consumer.stop()
+            if self._producer is not None:
+                await self._producer.stop()
+        return self.counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.dlq_replay", description="Replay events from the DLQ topic.")
+    parser.add_argument("--error-kind", action="append", help="only replay this error_kind (repeatable)")
+    parser.add_argument("--since", type=_parse_time, help="only records with dlq_ts >= this ISO time")
+    parser.add_argument("--until", type=_parse_time, help="only records with dlq_ts < this ISO time")
+    parser.add_argument("--target", choices=("kafka", "clickhouse"), default="kafka")
+    parser.add_argument("--rate", type=float, default=1000.0, help="max events per second (0 = unlimited)")
+    parser.add_argument("--group-id", default=settings.dlq_replay_group_id, help="consumer group for resumable progress")
+    parser.add_argument("--dry-run", action="store_true", help="count matching events without writing or committing")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve progress metrics on this port")
+    args = parser.parse_args()
+    configure_logging()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    counts = asyncio.run(Replayer(args).run())
+    get_logger().info("dlq_replay_done", target=args.target, dry_run=args.dry_run, **counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Decode Kafka messages from the events topic.
+
+Two formats share the topic (see capture-api ``app/envelope.py``):
+
+- JSON: one event object per message.
+- Envelope: ``b"AEV"`` + version byte + msgpack array of event maps.
+
+Capture serializes JSON events with ``properties`` as the last member. For
+those, only the top-level fields are parsed and the properties JSON text is
+passed through unparsed as ``RawJSON``; anything else is fully parsed.
+"""
+import json
+from typing import Any
+
+import msgpack
+
+from app.config import settings
+from app.metrics import LAZY_DECODE_FALLBACKS
+
+ENVELOPE_MAGIC = b"AEV"
+SUPPORTED_VERSIONS = (1,)
+
+
+_PROPERTIES_MEMBER = b',"properties":'
+
+
+class MessageDecodeError(ValueError):
+    pass
+
+
+class RawJSON(str):
+    """Properties JSON text taken verbatim from the message, not parsed."""
+
+    __slots__ = ()
+
+
+def _decode_lazy(value: bytes) -> dict[str, Any] | None:
+    """Parse the fields before a trailing ``"properties"`` member; None if the layout doesn't match.
+
+    The properties text is validated with a strict parse (the parsed object is
+    dropped; the saving is not building and re-serializing it per event). Members
+    after ``properties`` (other producers, older capture versions), a
+    ``"properties"`` key nested in another member and invalid JSON all fail it,
+    so those messages are fully parsed instead.
+    """
+    if value[:1] != b"{" or value[-1:] != b"}":
+        return None
+    i = value.find(_PROPERTIES_MEMBER)
+    if i < 0:
+        return None
+    props = value[i + len(_PROPERTIES_MEMBER):-1]
+    if props[:1] != b"{":
+        return None
+    try:
+        json.loads(props)
+        # The head only parses if the match is a top-level member (quotes in strings are escaped).
+        head = json.loads(value[:i] + b"}")
+        head["properties"] = RawJSON(props.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return head
+
+
+def full_event(raw: dict[str, Any]) -> dict[str, Any]:
+    """Return the event with passthrough properties parsed, e.g. for the DLQ."""
+    props = raw.get("properties")
+    if isinstance(props, RawJSON):
+        try:
+            return {**raw, "properties": json.loads(props)}
+        except ValueError:
+            return {**raw, "properties": str(props)}
+    return raw
+
+
+def decode_message(value: bytes | None) -> list[dict[str, Any]]:
+    """Return the events carried by one Kafka message value."""
+    if not value:
+        return []
+    if value[:3] == ENVELOPE_MAGIC:
+        version = value[3] if len(value) > 3 else None
+        if version not in SUPPORTED_VERSIONS:
+            raise MessageDecodeError(f"unsupported envelope version {version}")
+        try:
+            events = msgpack.unpackb(value[4:], raw=False)
+        except Exception as e:
+            raise MessageDecodeError(f"invalid envelope: {e}") from e
+        if not isinstance(events, list):
+            raise MessageDecodeError("envelope payload is not an array")
+        return [ev for ev in events if isinstance(ev, dict)]
+    if settings.lazy_decode:
+        doc = _decode_lazy(value)
+        if doc is not None:
+            return [doc]
+        LAZY_DECODE_FALLBACKS.inc()
+    try:
+        doc = json.loads(value)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise MessageDecodeError(f"invalid JSON: {e}") from e
+    return [doc] if isinstance(doc, dict) else []
@@ -1,5 +1,12 @@
 """Prometheus metrics for Consumer."""
-from prometheus_client import Counter, Histogram, start_http_server
+import json
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, make_wsgi_app
+from prometheus_client.exposition import ThreadingWSGIServer
+
+from app.config import settings
 
 # Consumer metrics
 MESSAGES_CONSUMED = Counter(
@@ -27,13 +34,129 @@ DLQ_MESSAGES = Counter(
     "consumer_dlq_messages_total",
     "Messages sent to dead-letter queue",
 )
+LAZY_DECODE_FALLBACKS = Counter(
+    "consumer_lazy_decode_fallbacks_total",
+    "JSON messages fully parsed because the properties passthrough layout did not match",
+)
+DLQ_REPLAY_MESSAGES = Counter(
+    "consumer_dlq_replay_messages_total",
+    "DLQ records processed by the replay tool",
+    ["outcome"],  # replayed | filtered | skipped
+)
+DLQ_REPLAY_REMAINING = Gauge(
+    "consumer_dlq_replay_remaining_messages",
+    "DLQ records left before the replay reaches the end offsets seen at start",
+    multiprocess_mode="livemax",
+)
 INSERT_LATENCY = Histogram(
     "consumer_insert_duration_seconds",
     "ClickHouse insert latency in seconds",
     buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
 )
+BATCH_SIZE_CURRENT = Gauge(
+    "consumer_batch_size_target",
+    "Batch size the consumer flushes at (adaptive when enabled)",
+    multiprocess_mode="livemax",
+)
+BATCH_INTERVAL_CURRENT = Gauge(
+    "consumer_batch_interval_seconds",
+    "Flush interval the consumer uses (adaptive when enabled)",
+    multiprocess_mode="livemax",
+)
+INFLIGHT_BATCHES = Gauge(
+    "consumer_inflight_batches",
+    "Batches handed to ClickHouse insert threads and not yet committed",
+    multiprocess_mode="livesum",
+)
+WORKERS_ALIVE = Gauge(
+    "consumer_workers_alive",
+    "Worker processes running under the supervisor",
+    multiprocess_mode="livemax",
+)
+WORKER_RESTARTS = Counter(
+    "consumer_worker_restarts_total",
+    "Worker processes restarted by the supervisor after exiting",
+)
+CLICKHOUSE_CIRCUIT_OPEN = Gauge(
+    "consumer_clickhouse_circuit_open",
+    "1 while the ClickHouse circuit breaker is open (writes waiting, partitions paused)",
+    multiprocess_mode="livemax",
+)
+CLICKHOUSE_CIRCUIT_OPENED = Counter(
+    "consumer_clickhouse_circuit_opened_total",
+    "Times the ClickHouse circuit breaker opened",
+)
+PAUSED_PARTITIONS = Gauge(
+    "consumer_paused_partitions",
+    "Assigned partitions paused because ClickHouse is unavailable",
+    multiprocess_mode="livesum",
+)
+PARTITION_LAG = Gauge(
+    "consumer_partition_lag",
+    "High watermark minus committed offset per assigned partition",
+    ["topic", "partition"],
+    multiprocess_mode="livemax",
+)
+ASSIGNED_PARTITIONS = Gauge(
+    "consumer_assigned_partitions",
+    "Partitions currently assigned to this consumer",
+    multiprocess_mode="livesum",
+)
+END_TO_END_LATENCY = Histogram(
+    "consumer_end_to_end_latency_seconds",
+    "Kafka record timestamp to successful ClickHouse insert, per message",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0),
+)
+BUFFER_TIME = Histogram(
+    "consumer_buffer_time_seconds",
+    "Time from the first message entering a batch buffer until the batch is flushed",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+def readiness(registry: CollectorRegistry = REGISTRY) -> tuple[bool, dict]:
+    """Ready when total lag is within CONSUMER_READY_MAX_LAG (0 = any).
+
+    A consumer without partitions (more workers than partitions) is ready: it has nothing to catch up on.
+    """
+    lag: dict[str, int] = {}
+    assigned = 0
+    for metric in registry.collect():
+        if metric.name == "consumer_partition_lag":
+            for sample in metric.samples:
+                if sample.value:
+                    lag[f"{sample.labels['topic']}/{sample.labels['partition']}"] = int(sample.value)
+        elif metric.name == "consumer_assigned_partitions":
+            assigned = int(sum(sample.value for sample in metric.samples))
+    total = sum(lag.values())
+    ready = settings.ready_max_lag <= 0 or total <= settings.ready_max_lag
+    return ready, {
+        "status": "ready" if ready else "not ready",
+        "assigned_partitions": assigned,
+        "lag": total,
+        "partitions": lag,
+    }
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = 9090, registry: CollectorRegistry = REGISTRY) -> None:
+    """Start HTTP server for Prometheus scraping (/metrics), plus /health and /ready."""
+    metrics_app = make_wsgi_app(registry)
 
+    def app(environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == "/health":
+            start_response("200 OK", [("Content-Type", "application/json")])
+            return [b'{"status": "ok"}']
+        if path == "/ready":
+            ready, body = readiness(registry)
+            start_response("200 OK" if ready else "503 Service Unavailable", [("Content-Type", "application/json")])
+            return [json.dumps(body).encode("utf-8")]
+        return metrics_app(environ, start_response)
 
-def start_metrics_server(port: int = 9090) -> None:
-    """Start HTTP server for Prometheus scraping."""
-    start_http_server(port)
+    httpd = make_server("0.0.0.0", port, app, ThreadingWSGIServer, handler_class=_QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
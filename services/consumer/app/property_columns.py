@@ -0,0 +1,139 @@
+"""Property keys copied into typed columns of analytics.events at insert time.
+
+``CONSUMER_PROPERTY_COLUMNS`` is JSON mapping a project id to ``{column: property key}``;
+the ``"*"`` entry applies to every project without an entry of its own, e.g.
+
+    {"*": {"utm_source": "utm_source", "current_url": "$current_url"},
+     "proj_1": {"utm_source": "source"}}
+
+String values are stored as-is, other JSON values as their compact JSON text, a
+missing or null key as NULL (``extract_sql`` builds the same value in ClickHouse,
+for the backfill). The columns must exist in the table (see
+``schemas/ddl/clickhouse_events_migrate_extracted_props.sql``). Query API must be
+given the same mapping (``QUERY_PROPERTY_COLUMNS``) to read the columns.
+
+With ``CONSUMER_PROPERTIES_MAP=true`` every property is also written to
+``properties_map`` (``Map(LowCardinality(String), String)``, same value rules,
+null values left out) and numeric ones to ``properties_num``
+(``Map(LowCardinality(String), Float64)``); ``PROPERTIES_MAP_SQL`` /
+``PROPERTIES_NUM_SQL`` build the same maps from ``properties`` in ClickHouse.
+"""
+import json
+import re
+from typing import Any
+
+from app.config import settings
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+# Rows' (key, raw JSON value) pairs, without null values
+_KEY_VALUES_SQL = "arrayFilter(kv -> kv.2 != 'null', JSONExtractKeysAndValuesRaw(properties))"
+PROPERTIES_MAP_SQL = (
+    f"mapFromArrays(arrayMap(kv -> kv.1, {_KEY_VALUES_SQL}),"
+    f" arrayMap(kv -> if(JSONType(kv.2) = 'String', JSONExtractString(kv.2), kv.2), {_KEY_VALUES_SQL}))"
+)
+_NUMERIC_SQL = f"arrayFilter(kv -> JSONType(kv.2) IN ('Int64', 'UInt64', 'Double'), {_KEY_VALUES_SQL})"
+PROPERTIES_NUM_SQL = (
+    f"mapFromArrays(arrayMap(kv -> kv.1, {_NUMERIC_SQL}), arrayMap(kv -> JSONExtractFloat(kv.2), {_NUMERIC_SQL}))"
+)
+MAP_COLUMNS = ("properties_map", "properties_num")
+
+
+def _json_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def extract_sql(key: str) -> str:
+    """ClickHouse expression for the stored value of property ``key`` of a row."""
+    k = "'" + key.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    return (
+        f"if(JSONType(properties, {k}) = 'String', JSONExtractString(properties, {k}),"
+        f" if(JSONType(properties, {k}) = 'Null', NULL, JSONExtractRaw(properties, {k})))"
+    )
+
+
+class PropertyColumns:
+    def __init__(self, config: dict[str, dict[str, str]], maps: bool = False):
+        for mapping in config.values():
+            for column in mapping:
+                if not _IDENTIFIER.match(column) or column in MAP_COLUMNS:
+                    raise ValueError(f"invalid property column name: {column!r}")
+        # Every column any project writes; rows of other projects get NULL.
+        self._mapped: tuple[str, ...] = tuple(sorted({c for m in config.values() for c in m}))
+        self.maps = maps
+        self.columns: tuple[str, ...] = self._mapped + (MAP_COLUMNS if maps else ())
+        self._mappings = config
+        # Per project: (column index, property key)
+        self._plans = {project: self._plan(mapping) for project, mapping in config.items()}
+        self._default_plan = self._plans.get("*", ())
+        # Per project: keys to look for in properties text before parsing it, or None to always parse
+        self._needles = {project: _needles(plan) for project, plan in self._plans.items()}
+        self._default_needles = self._needles.get("*", ())
+
+    def _plan(self, mapping: dict[str, str]) -> tuple[tuple[int, str], ...]:
+        return tuple((self._mapped.index(c), key) for c, key in mapping.items() if key)
+
+    def mapping(self, project_id: str) -> dict[str, str]:
+        """``{column: property key}`` in effect for ``project_id``."""
+        return {c: k for c, k in self._mappings.get(project_id, self._mappings.get("*", {})).items() if k}
+
+    def extract(self, project_id: str, properties: Any) -> list[Any]:
+        """Column values, in ``columns`` order, for one event's properties (dict or JSON text)."""
+        values: list[Any] = [None] * len(self._mapped)
+        plan = self._plans.get(project_id, self._default_plan)
+        if self.maps:
+            if isinstance(properties, str):
+                try:
+                    properties = json.loads(properties)
+                except ValueError:
+                    properties = None
+            if not isinstance(properties, dict):
+                properties = {}
+            values.extend(property_maps(properties))
+        if not plan:
+            return values
+        if isinstance(properties, str):
+            # Lazily decoded events keep properties as text: only parse if a mapped key occurs.
+            needles = self._needles.get(project_id, self._default_needles)
+            if needles is not None and not any(key in properties for key in needles):
+                return values
+            try:
+                properties = json.loads(properties)
+            except ValueError:
+                return values
+        if not isinstance(properties, dict):
+            return values
+        for index, key in plan:
+            value = properties.get(key)
+            if value is not None:
+                values[index] = _json_text(value)
+        return values
+
+
+def _needles(plan: tuple[tuple[int, str], ...]) -> tuple[str, ...] | None:
+    """Plan keys to search for in JSON text, or None if a key may be written escaped.
+
+    Encoders escape quotes, backslashes, control characters and (by default)
+    non-ASCII, and some escape ``/``; such a key need not occur verbatim in the text.
+    """
+    keys = tuple(key for _, key in plan)
+    if all(json.dumps(key)[1:-1] == key and "/" not in key for key in keys):
+        return keys
+    return None
+
+
+def property_maps(properties: dict[str, Any]) -> tuple[dict[str, str], dict[str, float]]:
+    """``properties_map`` and ``properties_num`` values for one event's properties."""
+    strings: dict[str, str] = {}
+    numbers: dict[str, float] = {}
+    for key, value in properties.items():
+        if value is None:
+            continue
+        strings[key] = _json_text(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[key] = float(value)
+    return strings, numbers
+
+
+property_columns = PropertyColumns(settings.property_columns, maps=settings.properties_map)
@@ -0,0 +1,132 @@
+"""Run several consumer processes in one consumer group.
+
+``python -m app.supervisor`` starts ``CONSUMER_WORKERS`` worker processes, each a
+regular consumer in ``CONSUMER_KAFKA_GROUP_ID``, so Kafka spreads partitions
+across them and decoding/row building uses more than one core. Crashed workers
+are restarted with backoff. Metrics from all workers are written to a shared
+prometheus_client multiprocess directory and served, aggregated, on
+``CONSUMER_METRICS_PORT`` by the supervisor, together with ``/ready`` for the
+whole group of workers. SIGTERM/SIGINT are forwarded to the
+workers, which flush and commit; workers still running after
+``CONSUMER_SHUTDOWN_WAIT_SECONDS`` are killed.
+
+prometheus_client picks its storage backend on import, so ``app.metrics`` is
+imported only after ``PROMETHEUS_MULTIPROC_DIR`` is set.
+"""
+import glob
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from multiprocessing.process import BaseProcess
+
+import structlog
+
+from app.config import settings
+from app.logging_config import configure_logging, get_logger
+
+_MAX_RESTART_BACKOFF_SECONDS = 60.0
+# A worker that ran at least this long before exiting restarts without backoff growth.
+_STABLE_RUN_SECONDS = 60.0
+
+
+def _worker(index: int) -> None:
+    from app import consumer
+
+    structlog.contextvars.bind_contextvars(worker=index)
+    consumer.main(serve_metrics=False)
+
+
+def _prepare_metrics_dir() -> tuple[str, bool]:
+    path = settings.metrics_multiproc_dir or os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+    created = not path
+    if created:
+        path = tempfile.mkdtemp(prefix="consumer-metrics-")
+    os.makedirs(path, exist_ok=True)
+    # Files left by a previous run would be aggregated as if still live.
+    for f in glob.glob(os.path.join(path, "*.db")):
+        os.remove(f)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path, created
+
+
+def run_supervisor() -> None:
+    configure_logging()
+    log = get_logger()
+    metrics_dir, created_dir = _prepare_metrics_dir()
+
+    from prometheus_client import CollectorRegistry, multiprocess
+
+    from app.metrics import WORKER_RESTARTS, WORKERS_ALIVE, start_metrics_server
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_metrics_server(settings.metrics_port, registry=registry)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    ctx = multiprocessing.get_context("spawn")
+    workers: dict[int, BaseProcess] = {}
+    started_at: dict[int, float] = {}
+    backoff: dict[int, float] = {}
+    restart_at: dict[int, float] = {}
+    count = settings.workers or os.cpu_count() or 1
+
+    def start(index: int) -> None:
+        proc = ctx.Process(target=_worker, args=(index,), name=f"consumer-{index}")
+        proc.start()
+        workers[index] = proc
+        started_at[index] = time.monotonic()
+        log.info("worker_started", worker=index, pid=proc.pid)
+
+    log.info("supervisor_started", workers=count, metrics_dir=metrics_dir)
+    for i in range(count):
+        start(i)
+    WORKERS_ALIVE.set(count)
+
+    try:
+        while not stop.wait(0.5):
+            now = time.monotonic()
+            for index, proc in list(workers.items()):
+                if proc.is_alive() or index in restart_at:
+                    continue
+                multiprocess.mark_process_dead(proc.pid)
+                ran = now - started_at[index]
+                delay = settings.worker_restart_backoff_seconds
+                if ran < _STABLE_RUN_SECONDS:
+                    delay = min(backoff.get(index, delay / 2) * 2, _MAX_RESTART_BACKOFF_SECONDS)
+                backoff[index] = delay
+                restart_at[index] = now + delay
+                log.error("worker_exited", worker=index, pid=proc.pid, exitcode=proc.exitcode, restart_in_seconds=delay)
+            for index, when in list(restart_at.items()):
+                if now >= when:
+                    del restart_at[index]
+                    WORKER_RESTARTS.inc()
+                    start(index)
+            WORKERS_ALIVE.set(sum(1 for p in workers.values() if p.is_alive()))
+    finally:
+        log.info("supervisor_stopping", workers=len(workers))
+        for proc in workers.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + settings.shutdown_wait_seconds
+        for index, proc in workers.items():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                log.error("worker_kill", worker=index, pid=proc.pid)
+                proc.kill()
+                proc.join()
+            multiprocess.mark_process_dead(proc.pid)
+        WORKERS_ALIVE.set(0)
+        if created_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        log.info("supervisor_stopped")
+
+
+if __name__ == "__main__":
+    run_supervisor()
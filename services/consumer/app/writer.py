@@ -0,0 +1,453 @@
+"""Batch writer: ClickHouse inserts off the event loop, offsets committed in order.
+
+Each flush hands the current buffer to a task that runs the insert in a thread
+pool (one ClickHouse client per thread) while the consumer keeps fetching into
+a fresh buffer. Up to ``max_inflight_batches`` batches are written at once;
+their offsets are committed strictly in flush order, and only after the batch
+is in ClickHouse or the DLQ.
+
+Each flush writes one batch per partition, and each insert carries an
+``insert_deduplication_token`` built from the batch's offset range, so a retry
+after an ambiguous failure (timeout, connection reset after the insert landed)
+is dropped by ClickHouse instead of duplicating rows. Before inserting, the end
+offsets of a partition's uncommitted batches are committed as metadata; a
+consumer that re-reads the partition after a crash or rebalance between insert
+and commit cuts its batches at those offsets, so the re-insert has the same
+token and is dropped too.
+
+Writes go through a circuit breaker (``app.circuit``). While it is open the
+consumer's partitions are paused and batches wait instead of going to the DLQ.
+A batch ClickHouse rejects (bad data, schema or settings error) is dead-lettered
+without touching the breaker, as is one that keeps failing while ClickHouse
+answers probes or after ``clickhouse_breaker_batch_max_reopens`` outages.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener, ConsumerRecord, TopicPartition
+from aiokafka.admin import AIOKafkaAdminClient
+from aiokafka.errors import CommitFailedError, IllegalStateError
+
+from app.batch_control import BatchController
+from app.circuit import CircuitBreaker, is_unavailable
+from app.clickhouse_client import EventColumns, get_client, insert_batch
+from app.config import settings
+from app.dlq import send_to_dlq
+from app.metrics import (
+    ASSIGNED_PARTITIONS,
+    BATCH_SIZE,
+    BATCHES_WRITTEN,
+    BUFFER_TIME,
+    END_TO_END_LATENCY,
+    INFLIGHT_BATCHES,
+    INSERT_ERRORS,
+    INSERT_LATENCY,
+    PARTITION_LAG,
+    PAUSED_PARTITIONS,
+)
+
+_thread_state = threading.local()
+_CUTS_PREFIX = "cuts:"
+
+
+class _PartitionBuffer:
+    """Events buffered from one partition: the rows, their offset range and Kafka timestamps (ms)."""
+
+    __slots__ = ("columns", "first", "end", "message_ts", "started")
+
+    def __init__(self) -> None:
+        self.columns = EventColumns()
+        self.first: int | None = None
+        self.end = 0
+        self.message_ts: list[int] = []
+        self.started = time.monotonic()
+
+
+def _thread_client():
+    client = getattr(_thread_state, "client", None)
+    if client is None:
+        client = _thread_state.client = get_client()
+    return client
+
+
+def _insert_in_thread(batch: EventColumns, dedup_token: str | None) -> None:
+    insert_batch(_thread_client(), batch, dedup_token)
+
+
+def _dedup_token(tp: TopicPartition, first: int, end: int) -> str:
+    """Deterministic token for the messages ``first`` up to ``end`` (exclusive) of ``tp``."""
+    return "kafka:" + hashlib.sha256(f"{tp.topic}:{tp.partition}:{first}-{end}".encode()).hexdigest()
+
+
+def _cuts_metadata(ends: list[int]) -> str:
+    """Commit metadata recording the end offsets of a partition's uncommitted batches."""
+    return _CUTS_PREFIX + ",".join(str(end) for end in ends)
+
+
+def _parse_cuts(metadata: str | None, committed: int) -> deque[int]:
+    if not metadata or not metadata.startswith(_CUTS_PREFIX):
+        return deque()
+    try:
+        ends = [int(end) for end in metadata[len(_CUTS_PREFIX):].split(",") if end]
+    except ValueError:
+        return deque()
+    return deque(sorted(end for end in ends if end > committed))
+
+
+def _probe_in_thread() -> None:
+    _thread_client().command("SELECT 1")
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        consumer: AIOKafkaConsumer,
+        producer: AIOKafkaProducer,
+        control: BatchController,
+        log: Any,
+    ):
+        self._consumer = consumer
+        self._control = control
+        self._producer = producer
+        self._log = log
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.max_inflight_batches),
+            thread_name_prefix="clickhouse-insert",
+        )
+        # Probes get their own thread so they aren't queued behind hung inserts.
+        self._probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clickhouse-probe")
+        self.breaker = CircuitBreaker(self._probe, log)
+        self.paused = False
+        # (write task, partition, first offset, end offset), oldest first
+        self._inflight: deque[tuple[asyncio.Task, TopicPartition, int, int]] = deque()
+        self._buffers: dict[TopicPartition, _PartitionBuffer] = {}
+        # Batch end offsets recorded by a previous owner that must be replayed exactly
+        self._cuts: dict[TopicPartition, deque[int]] = {}
+        # Last committed offset per assigned partition, for lag
+        self.committed: dict[TopicPartition, int] = {}
+        # Log-start offset of assigned partitions without a commit: lag counts from there
+        self._log_start: dict[TopicPartition, int] = {}
+        self._admin: AIOKafkaAdminClient | None = None
+
+    async def start(self) -> None:
+        # Connect one client up front so a bad ClickHouse config fails at startup.
+        await asyncio.get_running_loop().run_in_executor(self._executor, _thread_client)
+        if settings.insert_deduplication:
+            # consumer.committed() doesn't return commit metadata; the admin API does.
+            self._admin = AIOKafkaAdminClient(bootstrap_servers=settings.kafka_bootstrap_servers.split(","))
+            await self._admin.start()
+
+    @property
+    def buffered(self) -> int:
+        return sum(len(buf.columns) for buf in self._buffers.values())
+
+    def buffer_for(self, tp: TopicPartition) -> EventColumns:
+        """Buffer the events of ``tp``'s next messages are appended to."""
+        buf = self._buffers.get(tp)
+        if buf is None:
+            buf = self._buffers[tp] = _PartitionBuffer()
+        return buf.columns
+
+    def track(self, tp: TopicPartition, msg: ConsumerRecord) -> bool:
+        """Record a processed message of ``tp``; its offset is committed with that partition's buffer.
+
+        Returns True when the message ends a batch recorded by a previous owner of
+        the partition: flush ``tp`` now so the batch gets the same deduplication token.
+        """
+        buf = self._buffers[tp]
+        if buf.first is None:
+            buf.first = msg.offset
+        buf.end = msg.offset + 1
+        buf.message_ts.append(msg.timestamp)
+        cuts = self._cuts.get(tp)
+        if cuts and buf.end >= cuts[0]:
+            while cuts and cuts[0] <= buf.end:
+                cuts.popleft()
+            return True
+        return False
+
+    async def load_committed(self, assigned: set[TopicPartition]) -> None:
+        """Load committed offsets and recorded batch cuts of newly assigned partitions."""
+        fetched = {}
+        if self._admin is not None:
+            try:
+                fetched = await self._admin.list_consumer_group_offsets(
+                    settings.kafka_group_id, partitions=list(assigned),
+                )
+            except Exception as e:
+                self._log.warning("committed_offsets_fetch_failed", error=str(e))
+        uncommitted = []
+        for tp in assigned:
+            meta = fetched.get(tp)
+            committed = meta.offset if meta is not None else await self._consumer.committed(tp)
+            if committed is None or committed < 0:
+                uncommitted.append(tp)
+                continue
+            self.committed[tp] = committed
+            cuts = _parse_cuts(meta.metadata if meta is not None else None, committed)
+            if cuts:
+                self._cuts[tp] = cuts
+                self._log.info("replaying_batch_cuts", partition=tp.partition, committed=committed, cuts=list(cuts))
+        if uncommitted:
+            # A new group reads from the beginning (auto_offset_reset=earliest), so that's its lag.
+            try:
+                self._log_start.update(await self._consumer.beginning_offsets(uncommitted))
+            except Exception as e:
+                self._log.warning("beginning_offsets_fetch_failed", error=str(e))
+
+    def forget(self, tp: TopicPartition) -> None:
+        """Drop lag state of a revoked partition."""
+        self.committed.pop(tp, None)
+        self._log_start.pop(tp, None)
+
+    def update_lag(self) -> None:
+        assignment = self._consumer.assignment()
+        ASSIGNED_PARTITIONS.set(len(assignment))
+        for tp in assignment:
+            highwater = self._consumer.highwater(tp)
+            committed = self.committed.get(tp, self._log_start.get(tp))
+            if highwater is not None and committed is not None:
+                PARTITION_LAG.labels(topic=tp.topic, partition=str(tp.partition)).set(max(0, highwater - committed))
+
+    def apply_backpressure(self) -> None:
+        """Pause assigned partitions while the breaker is open; resume once it closes."""
+        if self.breaker.is_open:
+            assignment = self._consumer.assignment()
+            if assignment:
+                # Re-applied every iteration so partitions assigned during an outage are paused too.
+                self._consumer.pause(*assignment)
+            if not self.paused:
+                self.paused = True
+                self._log.warning("partitions_paused", partitions=len(assignment))
+            PAUSED_PARTITIONS.set(len(assignment))
+        elif self.paused:
+            paused = self._consumer.paused()
+            if paused:
+                self._consumer.resume(*paused)
+            self.paused = False
+            PAUSED_PARTITIONS.set(0)
+            self._log.info("partitions_resumed", partitions=len(paused))
+
+    async def flush(self, partitions: list[TopicPartition] | None = None, final: bool = False) -> None:
+        """Hand the buffered partitions to background inserts, one per partition, and start new buffers.
+
+        Without ``partitions``, partitions still replaying recorded batch cuts are
+        left alone (they flush at the cut). With deduplication on, each batch's end
+        offset is first committed as metadata (``cuts:``), so a new owner re-reading
+        it after a crash or rebalance cuts the same batch and ClickHouse drops the
+        repeated insert. Blocks only while more than ``max_inflight_batches``
+        batches are in flight and ClickHouse is available.
+        """
+        batches = []
+        for tp in list(self._buffers) if partitions is None else partitions:
+            if partitions is None and self._cuts.get(tp):
+                continue
+            buf = self._buffers.pop(tp, None)
+            if buf is None or buf.first is None:
+                continue
+            BUFFER_TIME.observe(time.monotonic() - buf.started)
+            batches.append((tp, buf))
+        if batches:
+            self._control.observe_flush(len(batches))
+        if batches and settings.insert_deduplication:
+            pending = {tp: [first for _, t, first, _ in self._inflight if t == tp] + [buf.first] for tp, buf in batches}
+            ends = {tp: [end for _, t, _, end in self._inflight if t == tp] for tp, _ in batches}
+            for tp, buf in batches:
+                ends[tp].append(buf.end)
+            await self._commit({tp: self.committed.get(tp, firsts[0]) for tp, firsts in pending.items()}, ends)
+        for tp, buf in batches:
+            token = _dedup_token(tp, buf.first, buf.end) if settings.insert_deduplication else None
+            task = asyncio.create_task(self._write(buf.columns, buf.message_ts, token, final))
+            self._inflight.append((task, tp, buf.first, buf.end))
+        INFLIGHT_BATCHES.set(len(self._inflight))
+        # Stop waiting if the breaker opens: the oldest batch then waits for ClickHouse,
+        # and the consumer loop must keep polling Kafka (partitions are paused instead).
+        while len(self._inflight) > settings.max_inflight_batches and not self.breaker.is_open:
+            await asyncio.wait([self._inflight[0][0]], timeout=1.0)
+            await self.commit_completed()
+
+    async def commit_completed(self) -> None:
+        """Commit offsets of the finished batches at the head of the queue."""
+        merged: dict[TopicPartition, int] = {}
+        while self._inflight and self._inflight[0][0].done():
+            task, tp, _, end = self._inflight.popleft()
+            task.result()
+            merged[tp] = end
+        INFLIGHT_BATCHES.set(len(self._inflight))
+        if merged:
+            ends = {tp: [end for _, t, _, end in self._inflight if t == tp] for tp in merged}
+            await self._commit(merged, ends if settings.insert_deduplication else None)
+
+    async def drain(self, final: bool = False) -> None:
+        """Flush the buffer and wait until every batch is written and committed.
+
+        If ClickHouse is down (breaker open) the batches are abandoned instead, uncommitted,
+        so a rebalance or shutdown doesn't wait for the outage to end. Partitions
+        that haven't reached a recorded cut are dropped uncommitted too: inserted
+        short, their batch would get a different token than the one recorded.
+        """
+        if not self.breaker.is_open:
+            await self.flush(final=final)
+        while self._inflight and not self.breaker.is_open:
+            await asyncio.wait([self._inflight[0][0]], timeout=1.0)
+            await self.commit_completed()
+        if self.breaker.is_open:
+            self._abandon()
+        # Eager rebalances revoke every partition, so dropped events are re-read from the last commit.
+        self._buffers.clear()
+        self._cuts.clear()
+
+    async def close(self) -> None:
+        await self.breaker.stop()
+        if self._admin is not None:
+            await self._admin.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._probe_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _abandon(self) -> None:
+        for task, *_ in self._inflight:
+            task.cancel()
+        self._log.warning(
+            "batches_abandoned",
+            inflight_batches=len(self._inflight),
+            buffered_events=self.buffered,
+            reason="clickhouse unavailable; offsets not committed, events will be re-read",
+        )
+        self._inflight.clear()
+        INFLIGHT_BATCHES.set(0)
+        self._buffers.clear()
+
+    async def _probe(self) -> bool:
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._probe_executor, _probe_in_thread)
+            return True
+        except Exception:
+            return False
+
+    async def _commit(
+        self,
+        offsets: dict[TopicPartition, int],
+        cuts: dict[TopicPartition, list[int]] | None = None,
+    ) -> None:
+        """Commit ``offsets``; ``cuts`` records the end offsets of each partition's uncommitted batches."""
+        assigned = self._consumer.assignment()
+        offsets = {tp: off for tp, off in offsets.items() if tp in assigned}
+        if not offsets:
+            return
+        if cuts is None:
+            request: dict[TopicPartition, Any] = offsets
+        else:
+            request = {tp: (off, _cuts_metadata(cuts.get(tp, []))) for tp, off in offsets.items()}
+        try:
+            await self._consumer.commit(request)
+        except (CommitFailedError, IllegalStateError) as e:
+            # Partitions moved in a rebalance; the new owner re-reads from the last commit.
+            self._log.warning("commit_failed", error=str(e))
+            return
+        self.committed.update(offsets)
+
+    async def _write(self, buffer: EventColumns, message_ts: list[int], token: str | None, final: bool) -> None:
+        if not len(buffer):
+            return
+        reopens = 0
+        while True:
+            await self.breaker.wait_closed()
+            outcome, elapsed = await self._insert_with_retries(buffer, token)
+            if outcome != "unavailable" or not settings.clickhouse_breaker_enabled:
+                # Inserted, or rejected by ClickHouse itself: dead-letter it.
+                break
+            if not self.breaker.is_open:
+                if await self.breaker.probe():
+                    # ClickHouse answers but keeps failing this batch (e.g. it times out): dead-letter it.
+                    break
+                self.breaker.open()
+            # ClickHouse is unavailable: wait for the breaker to close and retry, a bounded number of times.
+            reopens += 1
+            if reopens > settings.clickhouse_breaker_batch_max_reopens:
+                self._log.error("insert_gave_up", reopens=reopens - 1)
+                break
+        if outcome == "inserted":
+            # Only the attempt that landed: breaker waits and retry backoff would skew batch sizing.
+            INSERT_LATENCY.observe(elapsed)
+            self._control.observe_insert(len(buffer), elapsed)
+            now_ms = time.time() * 1000
+            for ts in message_ts:
+                if ts > 0:
+                    END_TO_END_LATENCY.observe(max(0.0, (now_ms - ts) / 1000))
+            BATCHES_WRITTEN.inc()
+            BATCH_SIZE.observe(len(buffer))
+            self._log.info("final_batch_inserted" if final else "batch_inserted", count=len(buffer))
+        else:
+            INSERT_ERRORS.inc()
+            if outcome == "rejected":
+                message = "insert rejected by ClickHouse"
+            else:
+                message = "insert retries exhausted"
+            await send_to_dlq(
+                self._producer,
+                buffer.to_events(),
+                error_kind="insert_failed",
+                error_message=f"{message} (shutdown)" if final else message,
+            )
+            self._log.error("final_batch_sent_to_dlq" if final else "batch_sent_to_dlq", count=len(buffer))
+
+    async def _insert_with_retries(self, batch: EventColumns, token: str | None) -> tuple[str, float]:
+        """Insert batch with retries.
+
+        Returns the outcome and the duration of the successful attempt (0 otherwise).
+        The outcome is "inserted", "rejected" (the last attempt failed with an error from a
+        working ClickHouse, e.g. bad data) or "unavailable" (connection, timeout,
+        5xx, overload; see ``app.circuit.is_unavailable``). Only unavailable errors
+        count toward the breaker.
+        """
+        loop = asyncio.get_running_loop()
+        unavailable = False
+        for attempt in range(settings.insert_retry_count):
+            try:
+                start = time.perf_counter()
+                await loop.run_in_executor(self._executor, _insert_in_thread, batch, token)
+                self.breaker.record_success()
+                return "inserted", time.perf_counter() - start
+            except Exception as e:
+                unavailable = is_unavailable(e)
+                if unavailable:
+                    self.breaker.record_failure()
+                    if self.breaker.is_open:
+                        self._log.warning("insert_failed_circuit_open", error=str(e))
+                        return "unavailable", 0.0
+                if attempt < settings.insert_retry_count - 1:
+                    backoff = settings.insert_retry_backoff_seconds * (2**attempt)
+                    self._log.warning(
+                        "insert_retry",
+                        attempt=attempt + 1,
+                        error=str(e),
+                        unavailable=unavailable,
+                        backoff_seconds=backoff,
+                    )
+                    await asyncio.sleep(backoff)
+                else:
+                    self._log.error("insert_final_failure", error=str(e), unavailable=unavailable)
+        return ("unavailable" if unavailable else "rejected"), 0.0
+
+
+class WriterRebalanceListener(ConsumerRebalanceListener):
+    """Finish in-flight batches and commit before partitions move; track committed offsets for lag."""
+
+    def __init__(self, consumer: AIOKafkaConsumer, writer: BatchWriter):
+        self._consumer = consumer
+        self._writer = writer
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        await self._writer.drain()
+        for tp in revoked:
+            self._writer.forget(tp)
+            # Zero rather than remove: multiprocess gauges can't drop label sets.
+            PARTITION_LAG.labels(topic=tp.topic, partition=str(tp.partition)).set(0)
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        await self._writer.load_committed(assigned)
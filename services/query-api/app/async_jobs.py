@@ -49,6 +49,9 @@ async def _run_job(job_id: str, project_id: str, query_type: str, params: dict[s
                 date_from=params.get("date_from"),
                 date_to=params.get("date_to"),
                 interval=params.get("interval", "day"),
+                properties=params.get("properties"),
+                breakdown=params.get("breakdown"),
+                math=params.get("math", "total"),
             )
         elif query_type == "funnel":
             result = run_funnel(
@@ -9,11 +9,32 @@ class Settings(BaseSettings):
     async_job_ttl_seconds: int = 3600
     require_api_key: bool = False
     auth_api_url: str = "http://localhost:8002"
+    auth_timeout_seconds: float = 5.0
+    auth_pool_max_connections: int = 20
+    auth_cache_ttl_seconds: float = 60.0
+    auth_negative_cache_ttl_seconds: float = 5.0
+    auth_cache_max_entries: int = 10000
     clickhouse_pool_size: int = 4
     postgres_pool_min: int = 2
     postgres_pool_max: int = 10
     redis_url: str = "redis://localhost:6379/0"
     query_cache_ttl_seconds: int = 120
+    # Answer unfiltered trends from the events_hourly/events_daily rollups (app/rollups.py)
+    rollups_enabled: bool = True
+    # Record rows/bytes read per ClickHouse query (metrics + clickhouse_query log line)
+    read_stats_enabled: bool = True
+    # {project_id or "*": {column: property key}}, as the consumer's CONSUMER_PROPERTY_COLUMNS
+    property_columns: dict[str, dict[str, str]] = {}
+    # Read other properties from the properties_map / properties_num Map columns instead of JSON
+    properties_map: bool = False
+    # Record property keys used by queries and read promoted mat_* columns (app/promote_properties.py)
+    property_promotion_enabled: bool = False
+    property_usage_window_days: int = 7
+    property_usage_queue_size: int = 10000
+    property_usage_redis_timeout_seconds: float = 0.5
+    property_promotion_min_uses: int = 100
+    property_promotion_max_columns: int = 20
+    property_promotion_refresh_seconds: float = 60.0
 
     class Config:
         env_prefix = "QUERY_"
@@ -139,6 +139,9 @@ def execute_widget(project_id: str, insight_type: str, params: dict[str, Any]) -
             date_from=date_from or date.today(),
             date_to=date_to or date.today(),
             interval=params.get("interval", "day"),
+            properties=params.get("properties"),
+            breakdown=params.get("breakdown"),
+            math=params.get("math", "total"),
         )
     if insight_type == "funnel":
         date_from = params.get("date_from")
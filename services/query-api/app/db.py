@@ -1,11 +1,14 @@
 """ClickHouse client with connection reuse (single client per process)."""
-from contextlib import asynccontextmanager
+import time
 from typing import Any
 
 import clickhouse_connect
 from clickhouse_connect.driver import Client
+from clickhouse_connect.driver.query import QueryResult
 
 from app.config import settings
+from app.logging_config import get_logger
+from app.metrics import CLICKHOUSE_READ_BYTES, CLICKHOUSE_READ_ROWS
 
 _clickhouse_client: Client | None = None
 
@@ -34,3 +37,32 @@ def close_clickhouse_pool() -> None:
         except Exception:
             pass
         _clickhouse_client = None
+
+
+def run_query(client: Client, query_type: str, query: str, parameters: dict[str, Any]) -> QueryResult:
+    """Run a SELECT and record how much ClickHouse read for it (metrics and a log line).
+
+    With ``QUERY_READ_STATS_ENABLED``, ``wait_end_of_query`` makes ClickHouse send the
+    summary after the query finished, so ``read_rows`` is complete rather than the
+    progress at the time the response headers went out.
+    """
+    if not settings.read_stats_enabled:
+        return client.query(query, parameters=parameters)
+    start = time.perf_counter()
+    result = client.query(query, parameters=parameters, settings={"wait_end_of_query": 1})
+    summary = getattr(result, "summary", None) or {}
+    read_rows = int(summary.get("read_rows", 0))
+    read_bytes = int(summary.get("read_bytes", 0))
+    CLICKHOUSE_READ_ROWS.labels(query_type=query_type).observe(read_rows)
+    CLICKHOUSE_READ_BYTES.labels(query_type=query_type).observe(read_bytes)
+    get_logger().info(
+        "clickhouse_query",
+        query_type=query_type,
+        project_id=parameters.get("project_id"),
+        analytics_event=parameters.get("event"),
+        read_rows=read_rows,
+        read_bytes=read_bytes,
+        result_rows=len(result.result_rows),
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return result
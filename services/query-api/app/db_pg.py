@@ -1,5 +1,4 @@
 """PostgreSQL connection pool."""
-import psycopg2
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
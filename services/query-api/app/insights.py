@@ -3,7 +3,14 @@ from typing import Any
 
 from clickhouse_connect.driver import Client
 
+from app import rollups
 from app.config import settings
+from app.db import run_query
+from app.metrics import TREND_QUERY_ROUTE
+from app.properties import filters_sql, normalize_filters, property_expr, refresh_promoted
+from app.property_usage import record_usage
+
+BREAKDOWN_LIMIT = 25
 
 
 def _safe_project(s: str) -> str:
@@ -22,37 +29,71 @@ def run_trend(
     client: Client,
     project_id: str,
     event: str,
-    date_from: date,
-    date_to: date,
+    date_from: date | datetime,
+    date_to: date | datetime,
     interval: str = "day",
+    properties: list[dict[str, Any]] | None = None,
+    breakdown: str | None = None,
+    math: str = "total",
 ) -> dict[str, Any]:
+    """Event counts (or unique users, ``math="unique_users"``) per period.
+
+    Dates cover whole days (``date_to`` inclusive); datetimes are an exact
+    ``[date_from, date_to)`` range. Without property filters or a breakdown the
+    query is answered from the rollups where they fit (``app.rollups``).
+    With ``breakdown``, the result also has ``breakdown``: the top values of that
+    property (missing = "") with their own series, aligned to ``labels``.
+    Property keys used are counted for ``app.promote_properties``.
+    Raises ValueError on invalid property filters.
+    """
     project_id = _safe_project(project_id)
     event = _safe_event(event)
+    filters = normalize_filters(properties)
     if not event:
         return {"series": [], "labels": []}
-    interval_expr = "toStartOfDay(timestamp)" if interval == "day" else "toStartOfWeek(timestamp)" if interval == "week" else "toStartOfMonth(timestamp)"
-    q = f"""
-    SELECT {interval_expr} AS period, count() AS cnt
-    FROM {settings.clickhouse_database}.events
-    WHERE project_id = {{project_id:String}} AND event = {{event:String}}
-      AND timestamp >= {{date_from:String}} AND timestamp < {{date_to:String}}
-    GROUP BY period
-    ORDER BY period
-    """
-    # Format dates as strings for clickhouse-connect parameters
-    date_from_str = datetime.combine(date_from, datetime.min.time()).strftime('%Y-%m-%d %H:%M:%S')
-    date_to_next = date_to + timedelta(days=1)
-    date_to_str = datetime.combine(date_to_next, datetime.min.time()).strftime('%Y-%m-%d %H:%M:%S')
-    params = {
-        "project_id": project_id,
-        "event": event,
-        "date_from": date_from_str,
-        "date_to": date_to_str,
-    }
-    result = client.query(q, parameters=params)
+    if interval not in ("hour", "day", "week", "month"):
+        interval = "day"
+    if math not in ("total", "unique_users"):
+        math = "total"
+    start = date_from if isinstance(date_from, datetime) else datetime.combine(date_from, datetime.min.time())
+    end = date_to if isinstance(date_to, datetime) else datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    keys = [f["key"] for f in filters] + ([breakdown[:400]] if breakdown else [])
+    if keys:
+        record_usage(project_id, keys)
+        refresh_promoted(client)
+    where_props, prop_params = filters_sql(project_id, filters)
+    parts = rollups.plan(start, end, interval, raw_only=bool(filters or breakdown))
+    TREND_QUERY_ROUTE.labels(route="raw" if all(p[0] == "raw" for p in parts) else "rollup").inc()
+    q, range_params = rollups.trend_query(parts, interval, math, raw_where=where_props)
+    params = {"project_id": project_id, "event": event, **range_params, **prop_params}
+    result = run_query(client, "trend", q, params)
     series = [row[1] for row in result.result_rows]
     labels = [str(row[0]) for row in result.result_rows]
-    return {"series": series, "labels": labels}
+    if not breakdown:
+        return {"series": series, "labels": labels}
+    # Breakdowns always plan a single raw part, so its range parameters are from_0/to_0.
+    interval_expr = rollups.period_expr(interval, "timestamp")
+    agg = "uniq(distinct_id)" if math == "unique_users" else "count()"
+    breakdown_expr, breakdown_params = property_expr(project_id, breakdown[:400], "breakdown_key")
+    bq = f"""
+    SELECT value, sum(cnt) AS total, groupArray((period, cnt))
+    FROM (
+        SELECT {interval_expr} AS period, ifNull({breakdown_expr}, '') AS value, {agg} AS cnt
+        FROM {settings.clickhouse_database}.events
+        WHERE project_id = {{project_id:String}} AND event = {{event:String}}
+          AND timestamp >= {{from_0:String}} AND timestamp < {{to_0:String}}{where_props}
+        GROUP BY period, value
+    )
+    GROUP BY value
+    ORDER BY total DESC
+    LIMIT {BREAKDOWN_LIMIT}
+    """
+    rows = run_query(client, "trend_breakdown", bq, {**params, **breakdown_params}).result_rows
+    values = []
+    for value, _total, points in rows:
+        by_period = {str(period): cnt for period, cnt in points}
+        values.append({"value": value, "series": [by_period.get(label, 0) for label in labels]})
+    return {"series": series, "labels": labels, "breakdown": values}
 
 
 def run_funnel(
@@ -110,7 +151,7 @@ def run_funnel(
         """
         count_select = ", ".join(count_if_parts)
         full_q = f"SELECT {count_select} FROM ({inner_q})"
-        result = client.query(full_q, parameters=params)
+        result = run_query(client, "funnel", full_q, params)
         row = result.result_rows[0] if result.result_rows else tuple(0 for _ in steps)
         step_counts = [
             {"step": i + 1, "event": steps[i], "count": int(row[i])}
@@ -127,9 +168,11 @@ def run_funnel(
             WHERE project_id = {{project_id:String}} AND event = {{event:String}}
               AND timestamp >= {{date_from:String}} AND timestamp < {{date_to:String}}
             """
-            r = client.query(
+            r = run_query(
+                client,
+                "funnel",
                 q,
-                parameters={
+                {
                     "project_id": project_id,
                     "event": ev,
                     "date_from": date_from_str,
@@ -155,7 +198,7 @@ def run_recent_events(
     ORDER BY timestamp DESC
     LIMIT {limit}
     """
-    result = client.query(q, parameters={"project_id": project_id})
+    result = run_query(client, "recent_events", q, {"project_id": project_id})
     rows = []
     for row in result.result_rows:
         ts, distinct_id, event, properties = row
@@ -1,3 +1,4 @@
+import json
 import time
 from contextlib import asynccontextmanager
 from datetime import date
@@ -14,7 +15,9 @@ from app.insights import run_funnel, run_trend, run_recent_events
 from app.async_jobs import create_and_run_job, get_job
 from app import dashboards as dash
 from app.auth import get_project_id
+from app.auth_client import close_auth_client
 from app.logging_config import configure_logging
+from app.properties import normalize_filters
 from app.query_cache import get_cached, set_cached
 from app.metrics import (
     FUNNEL_QUERY_LATENCY,
@@ -48,6 +51,7 @@ async def lifespan(app: FastAPI):
     try:
         yield
     finally:
+        await close_auth_client()
         close_clickhouse_pool()
         close_pg_pool()
 
@@ -104,23 +108,41 @@ async def get_trends(
     date_from: date = Query(..., alias="date_from"),
     date_to: date = Query(..., alias="date_to"),
     interval: str = Query("day", alias="interval"),
+    properties: str | None = Query(None, alias="properties"),
+    breakdown: str | None = Query(None, alias="breakdown"),
+    math: str = Query("total", alias="math"),
 ):
     effective_project_id = project_id_from_auth if project_id_from_auth != "default" else project_id
-    if interval not in ("day", "week", "month"):
+    if interval not in ("hour", "day", "week", "month"):
         interval = "day"
+    if math not in ("total", "unique_users"):
+        math = "total"
+    try:
+        filters = normalize_filters(json.loads(properties) if properties else None)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": f"invalid properties: {e}"})
     cache_params = {
         "event": event,
         "date_from": str(date_from),
         "date_to": str(date_to),
         "interval": interval,
     }
+    if filters:
+        cache_params["properties"] = filters
+    if breakdown:
+        cache_params["breakdown"] = breakdown
+    if math != "total":
+        cache_params["math"] = math
     cached = get_cached(effective_project_id, "trend", cache_params)
     if cached is not None:
         return cached
     client = get_clickhouse()
     start = time.perf_counter()
     try:
-        result = run_trend(client, effective_project_id, event, date_from, date_to, interval)
+        result = run_trend(
+            client, effective_project_id, event, date_from, date_to, interval,
+            properties=filters, breakdown=breakdown, math=math,
+        )
         TREND_QUERY_LATENCY.observe(time.perf_counter() - start)
         set_cached(effective_project_id, "trend", cache_params, result)
         return result
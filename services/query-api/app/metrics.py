@@ -24,11 +24,44 @@ FUNNEL_QUERY_LATENCY = Histogram(
     "Funnel query latency in seconds",
     buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
 )
+TREND_QUERY_ROUTE = Counter(
+    "query_trend_route_total",
+    "Trend queries by data source (rollup = at least partly answered from rollup tables)",
+    ["route"],
+)
+CLICKHOUSE_READ_ROWS = Histogram(
+    "query_clickhouse_read_rows",
+    "Rows ClickHouse read per query (after index/projection pruning)",
+    ["query_type"],
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9),
+)
+CLICKHOUSE_READ_BYTES = Histogram(
+    "query_clickhouse_read_bytes",
+    "Bytes ClickHouse read per query",
+    ["query_type"],
+    buckets=(1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11),
+)
+PROPERTY_USAGE_DROPPED = Counter(
+    "query_property_usage_dropped_total",
+    "Trend queries whose property key uses were not recorded (queue_full, redis_error)",
+    ["reason"],
+)
 QUERY_ERRORS = Counter(
     "query_errors_total",
     "Query execution errors",
     ["query_type"],
 )
+# API key validation (Auth API)
+AUTH_CACHE_LOOKUPS = Counter(
+    "query_auth_cache_lookups_total",
+    "API key validation lookups by cache result (hit, negative_hit, coalesced, miss)",
+    ["result"],
+)
+AUTH_VALIDATE_LATENCY = Histogram(
+    "query_auth_validate_duration_seconds",
+    "Auth API validate-key call latency in seconds (cache misses only)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
 
 
 def status_class(status_code: int) -> str:
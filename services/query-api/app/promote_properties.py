@@ -0,0 +1,154 @@
+"""Promote frequently queried property keys to MATERIALIZED columns.
+
+    python -m app.promote_properties            # promote, e.g. hourly from cron
+    python -m app.promote_properties --dry-run  # print the statements only
+    python -m app.promote_properties --report   # promoted keys and scan bytes saved
+
+Ranks property keys by how often trend filters and breakdowns used them over
+``QUERY_PROPERTY_USAGE_WINDOW_DAYS`` (``app.property_usage``, all projects
+together) and adds a ``mat_*`` column for each key with at least
+``QUERY_PROPERTY_PROMOTION_MIN_USES`` uses, up to
+``QUERY_PROPERTY_PROMOTION_MAX_COLUMNS`` promoted columns in total. The column
+is ``MATERIALIZED`` from ``properties`` with the Query API's value rules and
+carries the property key as its comment, which is how query generation finds it
+(``app.properties.refresh_promoted``). Adding the column only changes metadata;
+the ``MATERIALIZE COLUMN`` mutation that follows writes it for existing parts.
+Keys already mapped for all projects (``QUERY_PROPERTY_COLUMNS["*"]``) are skipped.
+Promoted columns are never dropped automatically; ``--report`` shows their usage.
+"""
+import argparse
+import hashlib
+import re
+
+from clickhouse_connect.driver import Client
+
+from app.config import settings
+from app.db import get_clickhouse
+from app.logging_config import configure_logging, get_logger
+from app.properties import PROMOTED_PREFIX, json_value_sql
+from app.property_usage import usage
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def column_name(key: str) -> str:
+    """``mat_<readable key>_<hash>``: a valid identifier, unique per key."""
+    slug = re.sub(r"[^a-z0-9]+", "_", key.lower()).strip("_")[:40]
+    return f"{PROMOTED_PREFIX}{slug}_{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+
+def _promoted_columns(client: Client) -> list[tuple[str, str, int, int]]:
+    """(column, property key, compressed bytes, uncompressed bytes) of the promoted columns."""
+    return [
+        tuple(row)
+        for row in client.query(
+            "SELECT name, comment, data_compressed_bytes, data_uncompressed_bytes FROM system.columns"
+            " WHERE database = {db:String} AND table = 'events'"
+            f" AND default_kind = 'MATERIALIZED' AND startsWith(name, '{PROMOTED_PREFIX}')",
+            parameters={"db": settings.clickhouse_database},
+        ).result_rows
+    ]
+
+
+def promotion_statements(client: Client) -> list[tuple[str, int, list[str]]]:
+    """(key, uses, statements) for each key to promote now, most used first."""
+    promoted = {key for _, key, _, _ in _promoted_columns(client)}
+    mapped = set(settings.property_columns.get("*", {}).values())
+    totals = {key: sum(projects.values()) for key, projects in usage().items()}
+    candidates = sorted(
+        (key for key, uses in totals.items()
+         if uses >= settings.property_promotion_min_uses and key not in promoted and key not in mapped),
+        key=lambda k: -totals[k],
+    )
+    table = f"{settings.clickhouse_database}.events"
+    out = []
+    for key in candidates[:max(0, settings.property_promotion_max_columns - len(promoted))]:
+        column = column_name(key)
+        out.append((key, totals[key], [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} Nullable(String)"
+            f" MATERIALIZED {json_value_sql(_quote(key))} COMMENT {_quote(key)}",
+            f"ALTER TABLE {table} MATERIALIZE COLUMN {column}",
+        ]))
+    return out
+
+
+def report(client: Client) -> list[dict]:
+    """Per promoted key: uses in the window, column size and bytes a full scan no longer reads.
+
+    ``saved_bytes_per_scan`` is the compressed size of the column a filter on
+    the key read before (``properties``, or ``properties_map`` with
+    ``QUERY_PROPERTIES_MAP``) minus the promoted column's. Parts still waiting
+    for ``MATERIALIZE COLUMN`` compute the column from ``properties`` on read
+    (``materializing``), so they save nothing yet.
+    """
+    source = "properties_map" if settings.properties_map else "properties"
+    rows = client.query(
+        "SELECT data_compressed_bytes FROM system.columns"
+        " WHERE database = {db:String} AND table = 'events' AND name = {name:String}",
+        parameters={"db": settings.clickhouse_database, "name": source},
+    ).result_rows
+    source_bytes = int(rows[0][0]) if rows else 0
+    pending = " ".join(
+        row[0] for row in client.query(
+            "SELECT command FROM system.mutations"
+            " WHERE database = {db:String} AND table = 'events' AND NOT is_done",
+            parameters={"db": settings.clickhouse_database},
+        ).result_rows
+    )
+    by_key = usage()
+    out = []
+    for column, key, compressed, uncompressed in _promoted_columns(client):
+        projects = by_key.get(key, {})
+        out.append({
+            "key": key,
+            "column": column,
+            "uses": sum(projects.values()),
+            "projects": len(projects),
+            "compressed_bytes": int(compressed),
+            "uncompressed_bytes": int(uncompressed),
+            "saved_bytes_per_scan": max(0, source_bytes - int(compressed)),
+            "materializing": f"MATERIALIZE COLUMN {column}" in pending,
+        })
+    return sorted(out, key=lambda r: -r["uses"])
+
+
+def _print_report(rows: list[dict]) -> None:
+    print(f"{'key':<32} {'column':<48} {'uses':>8} {'projects':>8} {'column MB':>10} {'saved MB/scan':>14}")
+    for r in rows:
+        print(
+            f"{r['key'][:32]:<32} {r['column']:<48} {r['uses']:>8,} {r['projects']:>8}"
+            f" {r['compressed_bytes'] / 1e6:>10.1f} {r['saved_bytes_per_scan'] / 1e6:>14.1f}"
+            f"{'  (materializing)' if r['materializing'] else ''}"
+        )
+    saved = sum(r["saved_bytes_per_scan"] * r["uses"] for r in rows if not r["materializing"])
+    print(f"{len(rows)} promoted keys; up to {saved / 1e9:.1f} GB not read by their uses in the window (full scans)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.promote_properties",
+        description="Promote frequently queried property keys to MATERIALIZED columns.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without running them")
+    parser.add_argument("--report", action="store_true", help="print promoted keys and scan bytes saved")
+    args = parser.parse_args()
+    configure_logging()
+    log = get_logger()
+    client = get_clickhouse()
+    if args.report:
+        _print_report(report(client))
+        return
+    for key, uses, statements in promotion_statements(client):
+        for statement in statements:
+            if args.dry_run:
+                print(statement + ";")
+            else:
+                client.command(statement)
+        if not args.dry_run:
+            log.info("property_promoted", key=key, column=column_name(key), uses=uses)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Event property filters and breakdowns for analytics.events queries.
+
+A property mapped to a column in ``QUERY_PROPERTY_COLUMNS`` (same JSON as the
+consumer's ``CONSUMER_PROPERTY_COLUMNS``: ``{project_id or "*": {column: key}}``)
+is read from that column; any other property is extracted from the
+``properties`` JSON with the same value rules (strings as-is, other values as
+JSON text, missing or null as NULL). With ``QUERY_PROPERTIES_MAP`` the other
+properties are read from the ``properties_map`` / ``properties_num`` Map columns
+instead of parsing the JSON. Only map a property (or enable the maps) once the
+columns have been filled for the queried range (consumer +
+``app.backfill_property_columns``). Keys promoted to ``MATERIALIZED`` columns
+by ``app.promote_properties`` are read from those columns for every project.
+"""
+import json
+import re
+import time
+from typing import Any
+
+from clickhouse_connect.driver import Client
+
+from app.config import settings
+from app.logging_config import get_logger
+
+OPERATORS = ("exact", "is_not", "is_set", "is_not_set", "gt", "lt")
+MAX_FILTERS = 20
+PROMOTED_PREFIX = "mat_"
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# property key -> promoted column, loaded by refresh_promoted
+_promoted: dict[str, str] = {}
+_promoted_at = float("-inf")
+
+
+def _check_columns() -> None:
+    for mapping in settings.property_columns.values():
+        for column in mapping:
+            if not _IDENTIFIER.match(column):
+                raise ValueError(f"invalid property column name: {column!r}")
+
+
+_check_columns()
+
+
+def refresh_promoted(client: Client) -> None:
+    """Reload the promoted columns (``mat_*``, property key in the column comment) when stale.
+
+    A promoted column is usable as soon as it exists: parts written before it
+    compute it from ``properties`` on read until it is materialized.
+    """
+    global _promoted, _promoted_at
+    if not settings.property_promotion_enabled:
+        return
+    if time.monotonic() - _promoted_at < settings.property_promotion_refresh_seconds:
+        return
+    _promoted_at = time.monotonic()
+    try:
+        rows = client.query(
+            "SELECT name, comment FROM system.columns"
+            " WHERE database = {db:String} AND table = 'events'"
+            f" AND default_kind = 'MATERIALIZED' AND startsWith(name, '{PROMOTED_PREFIX}')",
+            parameters={"db": settings.clickhouse_database},
+        ).result_rows
+    except Exception as e:
+        get_logger().warning("promoted_columns_refresh_failed", error=str(e))
+        return
+    _promoted = {comment: name for name, comment in rows if comment}
+
+
+def property_column(project_id: str, key: str) -> str | None:
+    """Column holding property ``key`` for ``project_id``, if mapped or promoted."""
+    mapping = settings.property_columns.get(project_id, settings.property_columns.get("*", {}))
+    for column, mapped_key in mapping.items():
+        if mapped_key == key:
+            return column
+    if settings.property_promotion_enabled:
+        return _promoted.get(key)
+    return None
+
+
+def property_expr(project_id: str, key: str, param: str) -> tuple[str, dict[str, Any]]:
+    """SQL expression for property ``key`` and the query parameters it uses (named ``param``)."""
+    column = property_column(project_id, key)
+    if column:
+        return column, {}
+    k = f"{{{param}:String}}"
+    if settings.properties_map:
+        return f"if(mapContains(properties_map, {k}), properties_map[{k}], NULL)", {param: key}
+    return json_value_sql(k), {param: key}
+
+
+def json_value_sql(k: str) -> str:
+    """Property ``k`` (a SQL string: parameter or literal) from the ``properties`` JSON, as Nullable(String)."""
+    return (
+        f"if(JSONType(properties, {k}) = 'String', JSONExtractString(properties, {k}),"
+        f" if(JSONType(properties, {k}) = 'Null', NULL, JSONExtractRaw(properties, {k})))"
+    )
+
+
+def numeric_property_expr(project_id: str, key: str, param: str) -> tuple[str, dict[str, Any]]:
+    """Like ``property_expr`` but as Nullable(Float64); non-numeric values are NULL."""
+    column = property_column(project_id, key)
+    if column:
+        return f"toFloat64OrNull({column})", {}
+    k = f"{{{param}:String}}"
+    if settings.properties_map:
+        return f"if(mapContains(properties_num, {k}), properties_num[{k}], NULL)", {param: key}
+    return (
+        f"if(JSONType(properties, {k}) IN ('Int64', 'UInt64', 'Double'), JSONExtractFloat(properties, {k}), NULL)",
+        {param: key},
+    )
+
+
+def normalize_filters(filters: Any) -> list[dict[str, str]]:
+    """Validate ``[{key, value?, operator?}]``; raises ValueError."""
+    if not filters:
+        return []
+    if not isinstance(filters, list) or len(filters) > MAX_FILTERS:
+        raise ValueError(f"properties must be a list of at most {MAX_FILTERS} filters")
+    out = []
+    for f in filters:
+        if not isinstance(f, dict) or not isinstance(f.get("key"), str) or not f["key"]:
+            raise ValueError("each property filter needs a key")
+        operator = f.get("operator") or "exact"
+        if operator not in OPERATORS:
+            raise ValueError(f"operator must be one of {', '.join(OPERATORS)}")
+        value = f.get("value")
+        if operator in ("exact", "is_not") and (value is None or isinstance(value, (dict, list))):
+            raise ValueError(f"operator {operator} needs a scalar value")
+        if operator in ("gt", "lt"):
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"operator {operator} needs a numeric value") from None
+        out.append({"key": f["key"][:400], "operator": operator, "value": _json_text(value)})
+    return out
+
+
+def _json_text(value: Any) -> str:
+    """A filter value as stored for a property: strings as-is, other values as compact JSON."""
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def filters_sql(project_id: str, filters: list[dict[str, str]]) -> tuple[str, dict[str, Any]]:
+    """``AND ...`` conditions for normalized filters, and their parameters."""
+    conditions = []
+    params: dict[str, Any] = {}
+    for i, f in enumerate(filters):
+        operator = f["operator"]
+        if operator in ("gt", "lt"):
+            expr, p = numeric_property_expr(project_id, f["key"], f"prop_key_{i}")
+            params.update(p)
+            conditions.append(f"{expr} {'>' if operator == 'gt' else '<'} {{prop_value_{i}:Float64}}")
+            params[f"prop_value_{i}"] = float(f["value"])
+            continue
+        expr, p = property_expr(project_id, f["key"], f"prop_key_{i}")
+        params.update(p)
+        if operator == "exact":
+            conditions.append(f"{expr} = {{prop_value_{i}:String}}")
+            params[f"prop_value_{i}"] = f["value"]
+        elif operator == "is_not":
+            conditions.append(f"ifNull({expr}, '') != {{prop_value_{i}:String}}")
+            params[f"prop_value_{i}"] = f["value"]
+        elif operator == "is_set":
+            conditions.append(f"{expr} IS NOT NULL")
+        else:
+            conditions.append(f"{expr} IS NULL")
+    return "".join(f" AND {c}" for c in conditions), params
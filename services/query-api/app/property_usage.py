@@ -0,0 +1,130 @@
+"""Which property keys each project filters and breaks down on (Redis).
+
+Every trend query that scans events counts its property keys in a per-day
+sorted set ``property_usage:{YYYYMMDD}`` (members ``["{project_id}","{key}"]``,
+compact JSON, so either may contain any character), kept for ``QUERY_PROPERTY_USAGE_WINDOW_DAYS``. ``app.promote_properties`` reads them
+to pick the keys worth a materialized column.
+
+Queries only queue their keys; a background thread writes them to Redis in
+batches, so a slow or unreachable Redis never delays a query. Uses that do not
+fit the queue (``QUERY_PROPERTY_USAGE_QUEUE_SIZE``) or fail to write are dropped
+(``query_property_usage_dropped_total``).
+"""
+import json
+import queue
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+from app.config import settings
+from app.logging_config import get_logger
+from app.metrics import PROPERTY_USAGE_DROPPED
+
+_redis: redis.Redis | None = None
+_pending: queue.Queue[tuple[str, str, frozenset[str]]] = queue.Queue(maxsize=settings.property_usage_queue_size)
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            socket_timeout=settings.property_usage_redis_timeout_seconds,
+            socket_connect_timeout=settings.property_usage_redis_timeout_seconds,
+        )
+    return _redis
+
+
+def _day_key(day: datetime) -> str:
+    return f"property_usage:{day.strftime('%Y%m%d')}"
+
+
+def _member(project_id: str, key: str) -> str:
+    return json.dumps([project_id, key], separators=(",", ":"), ensure_ascii=False)
+
+
+def _parse_member(member: str) -> tuple[str, str] | None:
+    """``(project_id, key)`` of a sorted set member; None if it is not one."""
+    if not member.startswith("["):
+        # Written as "{project_id}:{key}" by older versions, still within the window
+        project_id, sep, key = member.partition(":")
+        return (project_id, key) if sep else None
+    try:
+        project_id, key = json.loads(member)
+    except ValueError:
+        return None
+    return str(project_id), str(key)
+
+
+def record_usage(project_id: str, keys: list[str]) -> None:
+    """Queue one use of each of ``keys`` by ``project_id``; never blocks or fails the query."""
+    if not keys or not settings.property_promotion_enabled:
+        return
+    _start_writer()
+    try:
+        _pending.put_nowait((_day_key(datetime.now(timezone.utc)), project_id, frozenset(keys)))
+    except queue.Full:
+        PROPERTY_USAGE_DROPPED.labels(reason="queue_full").inc()
+
+
+def _start_writer() -> None:
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_usage, name="property-usage", daemon=True)
+            _writer.start()
+
+
+def _write_usage() -> None:
+    """Write queued uses to Redis, one pipeline per batch of queued queries."""
+    log = get_logger()
+    while True:
+        batch = [_pending.get()]
+        while len(batch) < 1000:
+            try:
+                batch.append(_pending.get_nowait())
+            except queue.Empty:
+                break
+        _write_batch(batch, log)
+
+
+def _write_batch(batch: list[tuple[str, str, frozenset[str]]], log) -> None:
+    counts: Counter = Counter()
+    for day_key, project_id, keys in batch:
+        for key in keys:
+            counts[day_key, _member(project_id, key)] += 1
+    try:
+        pipe = _get_redis().pipeline(transaction=False)
+        for (day_key, member), n in counts.items():
+            pipe.zincrby(day_key, n, member)
+        for day_key in {day_key for day_key, _ in counts}:
+            pipe.expire(day_key, (settings.property_usage_window_days + 1) * 86400)
+        pipe.execute()
+    except redis.RedisError as e:
+        PROPERTY_USAGE_DROPPED.labels(reason="redis_error").inc(len(batch))
+        log.warning("property_usage_record_failed", error=str(e), queries=len(batch))
+
+
+def usage(days: int | None = None) -> dict[str, Counter]:
+    """Uses per property key over the last ``days`` days (default: the usage window), by project."""
+    days = days or settings.property_usage_window_days
+    today = datetime.now(timezone.utc)
+    pipe = _get_redis().pipeline(transaction=False)
+    for i in range(days):
+        pipe.zrange(_day_key(today - timedelta(days=i)), 0, -1, withscores=True)
+    by_key: dict[str, Counter] = {}
+    for members in pipe.execute():
+        for member, score in members:
+            parsed = _parse_member(member)
+            if parsed is None:
+                continue
+            project_id, key = parsed
+            by_key.setdefault(key, Counter())[project_id] += int(score)
+    return by_key
@@ -0,0 +1,104 @@
+"""Trend queries over pre-aggregated rollups of analytics.events.
+
+Materialized views keep hourly and daily rollups per (project_id, event):
+``events_hourly`` / ``events_daily`` hold counts (SummingMergeTree) and
+``events_hourly_users`` / ``events_daily_users`` hold ``uniqState(distinct_id)``
+(AggregatingMergeTree); see ``schemas/ddl/clickhouse_events.sql``.
+
+``plan`` splits a time range into whole days (daily rollups), whole hours at
+the edges (hourly rollups) and partial hours left at either edge (raw events),
+so every part is answered exactly. ``trend_query`` reads all parts in one
+query and combines them per period: counts are summed, unique-user states are
+merged, so a user seen in two parts is counted once.
+"""
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.config import settings
+
+_HOUR = timedelta(hours=1)
+_DAY = timedelta(days=1)
+
+# source -> (table, time column, time parameter format, count, unique users, users table)
+_SOURCES = {
+    "raw": ("events", "timestamp", "%Y-%m-%d %H:%M:%S", "count()", "uniqState(distinct_id)", "events"),
+    "hourly": ("events_hourly", "hour", "%Y-%m-%d %H:%M:%S", "sum(count)", "uniqMergeState(users)", "events_hourly_users"),
+    "daily": ("events_daily", "day", "%Y-%m-%d", "sum(count)", "uniqMergeState(users)", "events_daily_users"),
+}
+_PERIOD = {
+    "hour": "toDateTime(toStartOfHour({col}))",
+    "day": "toDateTime(toStartOfDay({col}))",
+    "week": "toStartOfWeek({col})",
+    "month": "toStartOfMonth({col})",
+}
+
+
+def period_expr(interval: str, column: str) -> str:
+    return _PERIOD[interval].format(col=column)
+
+
+def _floor(ts: datetime, step: timedelta) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if step == _DAY else ts
+
+
+def _ceil(ts: datetime, step: timedelta) -> datetime:
+    floor = _floor(ts, step)
+    return floor if floor == ts else floor + step
+
+
+def plan(start: datetime, end: datetime, interval: str, raw_only: bool = False) -> list[tuple[str, datetime, datetime]]:
+    """Split ``[start, end)`` into ``(source, start, end)`` parts, coarsest source first where it fits."""
+    if raw_only or not settings.rollups_enabled:
+        return [("raw", start, end)]
+    h0, h1 = _ceil(start, _HOUR), _floor(end, _HOUR)
+    if h0 >= h1:
+        return [("raw", start, end)]
+    parts = [("raw", start, h0), ("hourly", h0, h1), ("raw", h1, end)]
+    if interval != "hour":
+        d0, d1 = _ceil(start, _DAY), _floor(end, _DAY)
+        if d0 < d1:
+            parts[1:2] = [("hourly", h0, d0), ("daily", d0, d1), ("hourly", d1, h1)]
+    return [p for p in parts if p[1] < p[2]]
+
+
+def trend_query(
+    parts: list[tuple[str, datetime, datetime]],
+    interval: str,
+    math: str,
+    raw_where: str = "",
+) -> tuple[str, dict[str, Any]]:
+    """SQL returning (period, value) rows for ``parts``, and its range parameters.
+
+    The caller supplies ``project_id`` and ``event``; ``raw_where`` adds conditions
+    (property filters) to raw parts.
+    """
+    selects = []
+    params: dict[str, Any] = {}
+    for i, (source, start, end) in enumerate(parts):
+        table, col, fmt, count_agg, users_agg, users_table = _SOURCES[source]
+        if math == "unique_users":
+            agg, table = users_agg, users_table
+        else:
+            agg = count_agg
+        selects.append(
+            f"SELECT {period_expr(interval, col)} AS period, {agg} AS v"
+            f" FROM {settings.clickhouse_database}.{table}"
+            f" WHERE project_id = {{project_id:String}} AND event = {{event:String}}"
+            f" AND {col} >= {{from_{i}:String}} AND {col} < {{to_{i}:String}}"
+            f"{raw_where if source == 'raw' else ''}"
+            " GROUP BY period"
+        )
+        params[f"from_{i}"] = start.strftime(fmt)
+        params[f"to_{i}"] = end.strftime(fmt)
+    outer = "uniqMerge(v)" if math == "unique_users" else "sum(v)"
+    union = "\n        UNION ALL\n        ".join(selects)
+    q = f"""
+    SELECT period, {outer} AS value
+    FROM (
+        {union}
+    )
+    GROUP BY period
+    ORDER BY period
+    """
+    return q, params
@@ -0,0 +1,132 @@
+"""Benchmark: /capture requests/sec through the FastAPI stack vs the raw ASGI fast path.
+
+In-process mode (default) drives both ASGI apps directly with an in-memory
+producer, so only framework overhead differs. Run from services/capture-api:
+
+    cd services/capture-api && PYTHONPATH=. python ../../tests/bench/bench_capture_asgi.py
+
+HTTP mode compares two running servers started with the same worker count, e.g.
+
+    uvicorn app.main:app --port 8000 --workers 2
+    CAPTURE_FAST_PATH_ENABLED=true uvicorn app.main:app --port 8010 --workers 2
+    PYTHONPATH=. python ../../tests/bench/bench_capture_asgi.py --url http://localhost:8000 --url http://localhost:8010
+"""
+import argparse
+import asyncio
+import json
+import time
+
+_BODY = json.dumps({
+    "batch": [
+        {"event": "$pageview", "distinct_id": f"user_{i}", "properties": {"$current_url": "https://example.com/"}}
+        for i in range(10)
+    ]
+}).encode("utf-8")
+
+
+class _InMemoryProducer:
+    """Accepts records immediately; isolates the HTTP layer from Kafka."""
+
+    async def send(self, topic, value=None, key=None):
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(None)
+        return fut
+
+
+async def _drive(app, seconds: float, concurrency: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/capture",
+        "raw_path": b"/capture",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(_BODY)).encode()),
+            (b"origin", b"http://example.com"),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker() -> None:
+        nonlocal done
+        while time.perf_counter() < deadline:
+            sent_body = False
+            status = 0
+
+            async def receive():
+                nonlocal sent_body
+                if not sent_body:
+                    sent_body = True
+                    return {"type": "http.request", "body": _BODY, "more_body": False}
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+
+            await app(dict(scope), receive, send)
+            if status != 202:
+                raise RuntimeError(f"unexpected status {status}")
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done / (time.perf_counter() - start)
+
+
+async def _in_process(seconds: float, concurrency: int, repeat: int) -> None:
+    from app import main
+    from app.fast_path import CaptureFastPath
+
+    main.producer_holder["producer"] = _InMemoryProducer()
+    fastapi_app = main.app.app if isinstance(main.app, CaptureFastPath) else main.app
+    fast = CaptureFastPath(fastapi_app, {"/capture": main.capture, "/capture/bulk": main.capture_bulk})
+    for label, app in (("FastAPI stack", fastapi_app), ("raw ASGI fast path", fast)):
+        best = max([await _drive(app, seconds, concurrency) for _ in range(repeat)])
+        print(f"{label:<24} {best:>10,.0f} req/s (best of {repeat}, concurrency {concurrency})")
+
+
+async def _http(urls: list[str], seconds: float, concurrency: int) -> None:
+    import httpx
+
+    for url in urls:
+        done = 0
+        deadline = time.perf_counter() + seconds
+        async with httpx.AsyncClient(base_url=url, timeout=10.0) as client:
+            async def worker() -> None:
+                nonlocal done
+                while time.perf_counter() < deadline:
+                    r = await client.post("/capture", content=_BODY, headers={"Content-Type": "application/json"})
+                    r.raise_for_status()
+                    done += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        print(f"{url:<32} {done / (time.perf_counter() - start):>10,.0f} req/s (concurrency {concurrency})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", action="append", help="benchmark running servers instead (repeatable)")
+    args = parser.parse_args()
+    if args.url:
+        asyncio.run(_http(args.url, args.seconds, args.concurrency))
+    else:
+        asyncio.run(_in_process(args.seconds, args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
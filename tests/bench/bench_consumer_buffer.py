@@ -0,0 +1,62 @@
+"""Benchmark: consumer batch buffer cost per 100k events (CPU seconds and peak RSS).
+
+Decodes Kafka message values and fills one EventColumns buffer with all events,
+then prepares the column-oriented insert payload, as a flush would. Peak RSS is
+measured as growth over the process baseline (Linux ru_maxrss). Run from
+services/consumer:
+
+    cd services/consumer && PYTHONPATH=. python ../../tests/bench/bench_consumer_buffer.py
+"""
+import argparse
+import json
+import resource
+import time
+
+from app.clickhouse_client import EventColumns
+from app.envelope import decode_message
+
+
+def _values(n: int) -> list[bytes]:
+    # Same layout as capture-api CaptureEvent.serialized(): compact fields, properties last.
+    templates = []
+    for i in range(1000):
+        head = json.dumps({
+            "event": "$pageview",
+            "distinct_id": f"user_{i}",
+            "timestamp": "2026-01-01T00:00:00.000Z",
+            "uuid": f"0190c3b6-{i:04x}-7000-8000-000000000000",
+            "project_id": "proj_1",
+            "$lib": "web",
+            "$lib_version": "1.2.3",
+            "$device_id": None,
+        }, separators=(",", ":"))
+        props = json.dumps({"$current_url": f"https://example.com/p/{i}", "$browser": "Chrome", "plan": "pro", "n": i})
+        templates.append(f'{head[:-1]},"properties":{props}}}'.encode("utf-8"))
+    return [templates[i % len(templates)] for i in range(n)]
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100_000)
+    args = parser.parse_args()
+    values = _values(args.events)
+    base_rss = _rss_mb()
+    start = time.process_time()
+    buffer = EventColumns()
+    for value in values:
+        for raw in decode_message(value):
+            buffer.append(raw)
+    columns = buffer.columns()
+    cpu = time.process_time() - start
+    per = 100_000 / args.events
+    print(f"events            {len(columns[0]):>10,}")
+    print(f"cpu per 100k      {cpu * per:>10.3f} s")
+    print(f"peak RSS per 100k {(_rss_mb() - base_rss) * per:>10.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark: property-filtered trend on JSON ``properties`` vs Map columns.
+
+Needs a running ClickHouse. Creates ``<database>.bench_properties`` (dropped at the
+end unless ``--keep``) with the events columns plus ``properties_map`` /
+``properties_num``, fills it server-side with synthetic events whose maps are
+built by the backfill expressions, then runs the same filtered daily trend
+through each representation and reports bytes/rows read and median latency.
+Run from services/consumer:
+
+    cd services/consumer && PYTHONPATH=. python ../../tests/bench/bench_property_storage.py --rows 5000000
+"""
+import argparse
+import statistics
+import time
+
+import clickhouse_connect
+
+from app.property_columns import PROPERTIES_MAP_SQL, PROPERTIES_NUM_SQL
+
+_CREATE = """
+CREATE TABLE {table}
+(
+    timestamp DateTime64(3),
+    event String,
+    distinct_id String,
+    project_id String,
+    properties String,
+    properties_map Map(LowCardinality(String), String),
+    properties_num Map(LowCardinality(String), Float64)
+)
+ENGINE = MergeTree()
+ORDER BY (project_id, toDate(timestamp), distinct_id, timestamp)
+"""
+
+# Properties shaped like web SDK events: a few common keys, a URL and a number.
+_FILL = """
+INSERT INTO {table} (timestamp, event, distinct_id, project_id, properties)
+SELECT
+    toDateTime64('2026-01-01 00:00:00', 3) + (number % (86400 * 30)),
+    ['$pageview', '$autocapture', 'signup', 'purchase'][number % 4 + 1],
+    concat('user_', toString(number % 100000)),
+    'proj_1',
+    concat(
+        '{{"$current_url":"https://example.com/p/', toString(number % 5000),
+        '","$browser":"', ['Chrome', 'Firefox', 'Safari'][number % 3 + 1],
+        '","$os":"Mac OS X","utm_source":"', ['google', 'newsletter', 'twitter', 'direct'][number % 4 + 1],
+        '","plan":"', ['free', 'pro', 'team'][number % 3 + 1],
+        '","amount":', toString(number % 200),
+        ',"$screen_width":1440,"$referrer":"https://ref.example.org/a/', toString(number % 977), '"}}'
+    )
+FROM numbers({rows})
+"""
+
+_QUERIES = {
+    "json string": "JSONExtractString(properties, 'utm_source') = 'google'",
+    "map string": "properties_map['utm_source'] = 'google'",
+    "json numeric": "JSONExtractFloat(properties, 'amount') > 150",
+    "map numeric": "properties_num['amount'] > 150",
+}
+
+_TREND = """
+SELECT toStartOfDay(timestamp) AS period, count()
+FROM {table}
+WHERE project_id = 'proj_1' AND event = '$pageview' AND {condition}
+GROUP BY period
+ORDER BY period
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=18123)
+    parser.add_argument("--database", default="analytics")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the bench table")
+    args = parser.parse_args()
+    client = clickhouse_connect.get_client(host=args.host, port=args.port, database=args.database)
+    table = f"{args.database}.bench_properties"
+    client.command(f"DROP TABLE IF EXISTS {table}")
+    client.command(_CREATE.format(table=table))
+    try:
+        client.command(_FILL.format(table=table, rows=args.rows))
+        client.command(
+            f"ALTER TABLE {table} UPDATE properties_map = {PROPERTIES_MAP_SQL}, properties_num = {PROPERTIES_NUM_SQL}"
+            " WHERE 1",
+            settings={"mutations_sync": 1},
+        )
+        client.command(f"OPTIMIZE TABLE {table} FINAL")
+        sizes = client.query(
+            "SELECT name, data_compressed_bytes FROM system.columns"
+            " WHERE database = {db:String} AND table = 'bench_properties'"
+            " AND name IN ('properties', 'properties_map', 'properties_num')",
+            parameters={"db": args.database},
+        ).result_rows
+        print(f"rows {args.rows:,}")
+        for name, size in sizes:
+            print(f"  {name:<16} {size / 1e6:>8.1f} MB compressed")
+        print(f"{'query':<14} {'read MB':>9} {'read rows':>11} {'median ms':>10} {'result':>8}")
+        for name, condition in _QUERIES.items():
+            q = _TREND.format(table=table, condition=condition)
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                result = client.query(q, settings={"wait_end_of_query": 1, "use_query_cache": 0})
+                timings.append(time.perf_counter() - start)
+            summary = result.summary
+            total = sum(row[1] for row in result.result_rows)
+            print(
+                f"{name:<14} {int(summary.get('read_bytes', 0)) / 1e6:>9.1f} {int(summary.get('read_rows', 0)):>11,}"
+                f" {statistics.median(timings) * 1000:>10.1f} {total:>8,}"
+            )
+    finally:
+        if not args.keep:
+            client.command(f"DROP TABLE IF EXISTS {table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,10 @@ Environment:
   CAPTURE_URL: default http://localhost:8000
   QUERY_URL:   default http://localhost:8001
 """
+import gzip
+import json
 import os
 import time
-import pytest
 import httpx
 
 CAPTURE_URL = os.environ.get("CAPTURE_URL", "http://localhost:8000").rstrip("/")
@@ -36,6 +37,26 @@ def test_capture_accepts_event():
     assert r.status_code == 202, r.text
 
 
+def test_capture_bulk_ndjson_gzip():
+    """POST /capture/bulk accepts gzip NDJSON and reports rejected line indices."""
+    lines = [
+        json.dumps({"event": "integration_bulk", "distinct_id": f"bulk_user_{i}", "project_id": "default"})
+        for i in range(3)
+    ]
+    lines.insert(1, "not json")
+    body = gzip.compress("\n".join(lines).encode("utf-8"))
+    with httpx.Client(timeout=10.0) as client:
+        r = client.post(
+            f"{CAPTURE_URL}/capture/bulk",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+        )
+    assert r.status_code == 202, r.text
+    data = r.json()
+    assert data["accepted"] == 3
+    assert data["rejected"] == [1]
+
+
 def test_capture_and_trend_e2e():
     """One event flows Capture -> Kafka -> Consumer -> ClickHouse; trend query returns 200."""
     event_name = "e2e_trend_test"
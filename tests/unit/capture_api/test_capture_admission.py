@@ -0,0 +1,101 @@
+"""Unit tests for admission control (app.admission). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import asyncio
+
+import pytest
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRejected
+from app.config import settings
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_inflight_requests", 2)
+    monkeypatch.setattr(settings, "admission_max_queue", 4)
+    monkeypatch.setattr(settings, "admission_low_priority_queue_fraction", 0.5)
+    monkeypatch.setattr(settings, "admission_queue_timeout_seconds", 1.0)
+    monkeypatch.setattr(settings, "admission_max_producer_inflight", 100)
+    monkeypatch.setattr(settings, "admission_latency_threshold_seconds", 1.0)
+    monkeypatch.setattr(settings, "admission_priority_projects", "vip, other")
+    monkeypatch.setattr(settings, "admission_retry_after_seconds", 3)
+    monkeypatch.setattr(admission, "inflight_records", lambda: 0)
+    monkeypatch.setattr(admission, "recent_produce_latency", lambda: 0.0)
+
+
+async def _try(controller: AdmissionController, project_id, hold: asyncio.Event):
+    """Run one request through the controller; return its outcome."""
+    try:
+        async with controller.slot(project_id):
+            await hold.wait()
+    except AdmissionRejected as e:
+        return e.reason
+    return "done"
+
+
+def _run(make_requests):
+    async def run():
+        controller = AdmissionController()
+        hold = asyncio.Event()
+        tasks = []
+        for project_id in make_requests:
+            tasks.append(asyncio.create_task(_try(controller, project_id, hold)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        hold.set()
+        return await asyncio.gather(*tasks)
+    return asyncio.run(run())
+
+
+def test_requests_queue_for_a_slot():
+    assert _run([None] * 4) == ["done"] * 4
+
+
+def test_normal_priority_is_shed_at_a_fraction_of_the_queue():
+    # 2 in flight, 2 queued (half of the queue), then shed.
+    assert _run([None] * 5) == ["done"] * 4 + ["queue_full"]
+
+
+def test_priority_projects_use_the_whole_queue():
+    assert _run([None] * 4 + ["vip"] * 3) == ["done"] * 4 + ["done", "done", "queue_full"]
+
+
+def test_queue_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "admission_queue_timeout_seconds", 0.001)
+    assert _run([None] * 3) == ["done", "done", "queue_timeout"]
+
+
+def test_producer_backlog_sheds_every_priority(monkeypatch):
+    monkeypatch.setattr(admission, "inflight_records", lambda: 101)
+    assert _run([None, "vip"]) == ["producer_backlog"] * 2
+
+
+def test_produce_latency_sheds_normal_priority_only(monkeypatch):
+    monkeypatch.setattr(admission, "recent_produce_latency", lambda: 1.5)
+    assert _run([None, "vip"]) == ["produce_latency", "done"]
+
+
+def test_rejection_carries_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "inflight_records", lambda: 101)
+
+    async def run():
+        async with AdmissionController().slot(None):
+            pass
+
+    with pytest.raises(AdmissionRejected) as exc:
+        asyncio.run(run())
+    assert exc.value.retry_after == 3
+
+
+def test_slots_are_released_after_errors():
+    async def run():
+        controller = AdmissionController()
+        for _ in range(5):
+            with pytest.raises(RuntimeError):
+                async with controller.slot(None):
+                    raise RuntimeError("handler failed")
+        return controller._inflight, controller._slots.locked()
+
+    assert asyncio.run(run()) == (0, False)
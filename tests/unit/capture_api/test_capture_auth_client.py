@@ -0,0 +1,97 @@
+"""Unit tests for the cached API key client (app.auth_client). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+
+query-api carries the same module; these cases cover both.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import auth_client
+from app.config import settings
+
+
+class _FakeAuthApi:
+    """Stands in for the pooled httpx client; answers each key from a table."""
+
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.calls: list[str] = []
+
+    async def get(self, url, headers=None):
+        key = headers["X-API-Key"]
+        self.calls.append(key)
+        await asyncio.sleep(0.01)
+        response = self.responses[key]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def auth_api(monkeypatch):
+    api = _FakeAuthApi({
+        "good": httpx.Response(200, json={"project_id": "p1"}),
+        "bad": httpx.Response(401, json={"detail": "invalid"}),
+        "down": httpx.ConnectError("refused"),
+        "html": httpx.Response(200, text="<html>bad gateway</html>"),
+        "error": httpx.Response(500, text="oops"),
+    })
+    monkeypatch.setattr(auth_client, "_get_client", lambda: api)
+    monkeypatch.setattr(settings, "auth_cache_ttl_seconds", 60.0)
+    monkeypatch.setattr(settings, "auth_negative_cache_ttl_seconds", 5.0)
+    auth_client._cache.clear()
+    yield api
+    auth_client._cache.clear()
+
+
+def _validate_twice(key):
+    async def run():
+        return await auth_client.validate_api_key(key), await auth_client.validate_api_key(key)
+    return asyncio.run(run())
+
+
+def test_valid_key_is_cached(auth_api):
+    assert _validate_twice("good") == ("p1", "p1")
+    assert auth_api.calls == ["good"]
+
+
+def test_rejected_key_is_negatively_cached(auth_api):
+    assert _validate_twice("bad") == (None, None)
+    assert auth_api.calls == ["bad"]
+
+
+@pytest.mark.parametrize("key", ["down", "html", "error"])
+def test_failures_are_not_cached(auth_api, key):
+    assert _validate_twice(key) == (None, None)
+    assert auth_api.calls == [key, key]
+
+
+def test_concurrent_lookups_share_one_call(auth_api):
+    async def run():
+        return await asyncio.gather(*(auth_client.validate_api_key("good") for _ in range(20)))
+
+    assert asyncio.run(run()) == ["p1"] * 20
+    assert auth_api.calls == ["good"]
+
+
+def test_cache_is_bounded_lru(auth_api, monkeypatch):
+    monkeypatch.setattr(settings, "auth_cache_max_entries", 2)
+    for key in ("a", "b", "c"):
+        auth_client._cache_put(auth_client._key_hash(key), key, 60.0)
+    assert auth_client._cache_get(auth_client._key_hash("a")) is auth_client._MISSING
+    assert auth_client._cache_get(auth_client._key_hash("c")) == "c"
+
+
+def test_expired_entries_are_refetched(auth_api, monkeypatch):
+    monkeypatch.setattr(settings, "auth_cache_ttl_seconds", 0.001)
+
+    async def run():
+        first = await auth_client.validate_api_key("good")
+        await asyncio.sleep(0.01)
+        return first, await auth_client.validate_api_key("good")
+
+    assert asyncio.run(run()) == ("p1", "p1")
+    assert auth_api.calls == ["good", "good"]
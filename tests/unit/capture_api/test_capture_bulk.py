@@ -0,0 +1,111 @@
+"""Unit tests for /capture/bulk body decoding (app.bulk). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import asyncio
+import gzip
+import zlib
+
+import pytest
+import zstandard
+
+from app import bulk
+from app.bulk import _DECOMPRESS_STEP, _ZSTD_INPUT_STEP, BulkDecodeError, _decoder, iter_ndjson_lines
+from app.config import settings
+
+LINES = [b'{"event":"e%d","distinct_id":"u"}' % i for i in range(2000)]
+FIRST = b"\n".join(LINES[:1000]) + b"\n"
+SECOND = b"\n".join(LINES[1000:]) + b"\n"
+COMPRESS = {
+    "gzip": gzip.compress,
+    "deflate": zlib.compress,
+    "zstd": lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+async def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _lines(data: bytes, encoding: str, chunk_size: int = 1000) -> list:
+    async def collect():
+        return [line async for line in iter_ndjson_lines(_chunks(data, chunk_size), encoding)]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("encoding", sorted(COMPRESS))
+@pytest.mark.parametrize("chunk_size", [7, 1000, 1 << 20])
+def test_concatenated_members_are_all_decoded(encoding, chunk_size):
+    body = COMPRESS[encoding](FIRST) + COMPRESS[encoding](SECOND)
+    assert _lines(body, encoding, chunk_size) == LINES
+
+
+@pytest.mark.parametrize("encoding", sorted(COMPRESS))
+def test_truncated_body_is_rejected(encoding):
+    first = COMPRESS[encoding](FIRST)
+    body = first + COMPRESS[encoding](SECOND)
+    for cut in (len(first) // 2, len(first) + 5, len(body) - 1):
+        with pytest.raises(BulkDecodeError, match="truncated"):
+            _lines(body[:cut], encoding)
+
+
+@pytest.mark.parametrize("encoding", sorted(COMPRESS))
+def test_empty_body_has_no_lines(encoding):
+    assert _lines(b"", encoding) == []
+
+
+def test_trailing_garbage_is_rejected():
+    with pytest.raises(BulkDecodeError, match="invalid gzip"):
+        _lines(gzip.compress(FIRST) + b"not gzip", "gzip")
+
+
+def test_unsupported_encoding_is_rejected():
+    with pytest.raises(BulkDecodeError, match="unsupported"):
+        _lines(FIRST, "br")
+
+
+def test_identity_lines_and_missing_final_newline():
+    assert _lines(FIRST + b"\n  \n" + LINES[0], "identity", 13) == LINES[:1000] + [b"", b"  ", LINES[0]]
+
+
+def test_oversized_line_is_reported_as_none(monkeypatch):
+    monkeypatch.setattr(settings, "bulk_max_line_bytes", 64)
+    assert _lines(b"a" * 100 + b"\n" + LINES[0] + b"\n" + b"b" * 100, "identity", 10) == [None, LINES[0], None]
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_decompressed_pieces_are_bounded(encoding):
+    bomb = COMPRESS[encoding](b"x" * (64 << 20))
+    decoder = _decoder(encoding)
+    total = largest = 0
+    for i in range(0, len(bomb), 64 * 1024):
+        for piece in decoder.feed(bomb[i:i + 64 * 1024]):
+            total += len(piece)
+            largest = max(largest, len(piece))
+    decoder.close()
+    assert total == 64 << 20
+    # A zstd block is at most 128 KiB and takes at least 4 bytes of input.
+    limit = _DECOMPRESS_STEP if encoding == "gzip" else _DECOMPRESS_STEP + (_ZSTD_INPUT_STEP // 4 + 1) * 128 * 1024
+    assert largest <= limit
+
+
+def test_decode_error_reports_produced_lines(monkeypatch):
+    produced: list[int] = []
+
+    async def fake_produce_or_spool(producer, spool, payloads):
+        produced.append(len(payloads))
+        return [], []
+
+    monkeypatch.setattr(settings, "bulk_chunk_size", 100)
+    monkeypatch.setattr(settings, "kafka_message_format", "json")
+    monkeypatch.setattr(bulk, "produce_or_spool", fake_produce_or_spool)
+    body = gzip.compress(b"\n".join(LINES[:250]) + b"\n") + gzip.compress(SECOND)[:40]
+
+    async def run():
+        await bulk.ingest_ndjson(None, _chunks(body, 1000), "gzip")
+
+    with pytest.raises(BulkDecodeError, match="truncated") as exc:
+        asyncio.run(run())
+    assert produced == [100, 100]
+    assert (exc.value.accepted, exc.value.next_line) == (200, 200)
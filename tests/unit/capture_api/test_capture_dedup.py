@@ -0,0 +1,112 @@
+"""Unit tests for capture-side deduplication (app.dedup). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import asyncio
+import uuid
+
+from app.config import settings
+from app.dedup import DedupWindow
+from app.models import CaptureEvent
+
+
+def _event(u=None) -> CaptureEvent:
+    return CaptureEvent(event="e", distinct_id="user", uuid=u)
+
+
+def _window() -> DedupWindow:
+    return DedupWindow(window_seconds=600, max_entries=1000)
+
+
+class _FakePipeline:
+    def __init__(self, store: dict):
+        self.store = store
+        self.ops: list[tuple[str, bool]] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None, nx=False):
+        self.ops.append((key, nx))
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        results = []
+        for key, nx in self.ops:
+            if nx and key in self.store:
+                results.append(None)
+            else:
+                self.store[key] = 1
+                results.append(True)
+        return results
+
+
+class _FakeRedis:
+    """The SET [NX] / DEL subset DedupWindow uses."""
+
+    def __init__(self):
+        self.store: dict = {}
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self.store)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+def test_duplicates_in_request_and_after_remember_are_dropped():
+    async def run():
+        window = _window()
+        a, b = uuid.uuid4(), uuid.uuid4()
+        events = [_event(a), _event(b), _event(a), _event()]
+        keep, dropped = await window.filter(events)
+        assert (keep, dropped) == ([0, 1, 3], 1)
+        await window.remember([events[i] for i in keep])
+        assert await window.filter([_event(a), _event(b), _event()]) == ([2], 2)
+
+    asyncio.run(run())
+
+
+def test_in_flight_uuid_is_dropped_until_released():
+    async def run():
+        window = _window()
+        u = uuid.uuid4()
+        first, second = await asyncio.gather(window.filter([_event(u)]), window.filter([_event(u)]))
+        assert [first[0], second[0]] == [[0], []]
+        await window.release([_event(u)])
+        assert (await window.filter([_event(u)]))[0] == [0]
+
+    asyncio.run(run())
+
+
+def test_reservation_of_a_lost_request_expires(monkeypatch):
+    async def run():
+        window = _window()
+        u = uuid.uuid4()
+        assert (await window.filter([_event(u)]))[0] == [0]
+        # Neither remember nor release: the request was cancelled.
+        assert (await window.filter([_event(u)]))[0] == [0]
+
+    monkeypatch.setattr(settings, "dedup_reservation_seconds", 0)
+    asyncio.run(run())
+
+
+def test_redis_reservation_is_shared_by_replicas():
+    async def run():
+        redis = _FakeRedis()
+        a, b = _window(), _window()
+        a._redis = b._redis = redis
+        u = uuid.uuid4()
+        assert (await a.filter([_event(u)]))[0] == [0]
+        assert (await b.filter([_event(u)]))[0] == []
+        # Produce failed on a: the retry on b is accepted.
+        await a.release([_event(u)])
+        assert (await b.filter([_event(u)]))[0] == [0]
+        await b.remember([_event(u)])
+        assert (await a.filter([_event(u)]))[0] == []
+
+    asyncio.run(run())
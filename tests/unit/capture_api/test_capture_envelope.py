@@ -0,0 +1,61 @@
+"""Unit tests for Kafka record encoding (app.envelope). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+
+The consumer side of the envelope format is covered by
+tests/unit/consumer/test_consumer_envelope.py.
+"""
+import json
+
+import msgpack
+
+from app.config import settings
+from app.envelope import ENVELOPE_MAGIC, ENVELOPE_VERSION, encode_payloads
+from app.models import CaptureEvent
+
+
+def _events() -> list[CaptureEvent]:
+    return [
+        CaptureEvent(event=f"e{i}", distinct_id=f"user{i % 2}", properties={"i": i, "s": "x" * 50})
+        for i in range(6)
+    ]
+
+
+def _decode(value: bytes) -> list[dict]:
+    assert value[:3] == ENVELOPE_MAGIC and value[3] == ENVELOPE_VERSION
+    return msgpack.unpackb(value[4:], raw=False)
+
+
+def test_json_format_is_one_record_per_event(monkeypatch):
+    monkeypatch.setattr(settings, "kafka_message_format", "json")
+    events = _events()
+    records, carried = encode_payloads(events)
+    assert carried == [[i] for i in range(6)]
+    for (key, value), ev in zip(records, events):
+        assert key == ev.kafka_key().encode()
+        assert json.loads(value)["event"] == ev.event
+
+
+def test_envelope_round_trip_groups_events_by_key(monkeypatch):
+    monkeypatch.setattr(settings, "kafka_message_format", "envelope")
+    events = _events()
+    records, carried = encode_payloads(events)
+    assert len(records) == 2
+    for (key, value), indices in zip(records, carried):
+        assert {events[i].kafka_key().encode() for i in indices} == {key}
+        assert _decode(value) == [events[i].model_dump(mode="json", by_alias=True) for i in indices]
+    assert sorted(i for indices in carried for i in indices) == list(range(6))
+
+
+def test_envelopes_are_split_at_max_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "kafka_message_format", "envelope")
+    monkeypatch.setattr(settings, "kafka_envelope_max_bytes", 250)
+    events = _events()
+    records, carried = encode_payloads(events)
+    assert len(records) > 2
+    assert all(len(value) <= 250 for _, value in records)
+    decoded = {}
+    for (_, value), indices in zip(records, carried):
+        for i, doc in zip(indices, _decode(value)):
+            decoded[i] = doc["event"]
+    assert decoded == {i: ev.event for i, ev in enumerate(events)}
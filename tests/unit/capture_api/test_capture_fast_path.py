@@ -0,0 +1,96 @@
+"""Unit tests for the raw ASGI capture path (app.fast_path). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+
+Every request is sent both through the FastAPI stack and through CaptureFastPath
+wrapping it; status, body, CORS headers and request metrics must match.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import main
+from app.fast_path import CaptureFastPath
+from app.metrics import REQUESTS_LATENCY, REQUESTS_TOTAL
+
+EVENT = b'{"event":"e","distinct_id":"u"}'
+ORIGIN = {"Origin": "https://app.example.com"}
+
+
+@pytest.fixture(autouse=True)
+def fake_producer(monkeypatch):
+    async def produce_or_spool(producer, spool, payloads):
+        if b'"distinct_id":"boom"' in payloads[0][1]:
+            raise RuntimeError("unexpected")
+        return [], []
+
+    monkeypatch.setattr(main, "produce_or_spool", produce_or_spool)
+    monkeypatch.setitem(main.producer_holder, "producer", object())
+
+
+def _apps():
+    fastapi_app = main.app.app if isinstance(main.app, CaptureFastPath) else main.app
+    fast = CaptureFastPath(fastapi_app, {"/capture": main.capture, "/capture/bulk": main.capture_bulk})
+    return fastapi_app, fast
+
+
+def _send(app, method, path, **kwargs) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(run())
+
+
+def _cors(response: httpx.Response) -> dict:
+    return {k: v for k, v in response.headers.items() if k.startswith("access-control-")}
+
+
+@pytest.mark.parametrize(
+    "method, path, kwargs",
+    [
+        ("POST", "/capture", {"content": EVENT, "headers": ORIGIN}),
+        ("POST", "/capture", {"content": EVENT}),
+        ("POST", "/capture", {"content": b"not json", "headers": ORIGIN}),
+        ("POST", "/capture/bulk", {"content": EVENT + b"\n" + EVENT, "headers": ORIGIN}),
+        (
+            "OPTIONS",
+            "/capture",
+            {"headers": {**ORIGIN, "Access-Control-Request-Method": "POST", "Access-Control-Request-Headers": "x-api-key"}},
+        ),
+    ],
+)
+def test_fast_path_matches_the_fastapi_stack(method, path, kwargs):
+    fastapi_app, fast = _apps()
+    expected = _send(fastapi_app, method, path, **kwargs)
+    actual = _send(fast, method, path, **kwargs)
+    assert actual.status_code == expected.status_code
+    assert actual.content == expected.content
+    assert _cors(actual) == _cors(expected)
+
+
+def test_other_routes_pass_through():
+    _, fast = _apps()
+    assert _send(fast, "GET", "/health").json() == {"status": "ok"}
+    assert _send(fast, "GET", "/capture").status_code == 405
+
+
+def test_request_metrics_match():
+    def counted(app):
+        counter = REQUESTS_TOTAL.labels(method="POST", path="/capture", status_class="2xx")
+        histogram = REQUESTS_LATENCY.labels(method="POST", path="/capture")
+        before = counter._value.get(), histogram._sum.get()
+        _send(app, "POST", "/capture", content=EVENT)
+        return counter._value.get() - before[0], histogram._sum.get() > before[1]
+
+    fastapi_app, fast = _apps()
+    assert counted(fastapi_app) == counted(fast) == (1, True)
+
+
+def test_unhandled_error_is_a_500_with_cors():
+    _, fast = _apps()
+    response = _send(fast, "POST", "/capture", content=b'{"event":"e","distinct_id":"boom"}', headers=ORIGIN)
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Internal Server Error"}
+    assert response.headers["access-control-allow-origin"] == "*"
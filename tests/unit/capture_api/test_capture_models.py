@@ -0,0 +1,73 @@
+"""Unit tests for capture validation and serialization (app.models). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models import CaptureEvent, normalize_body
+
+EVENT = {
+    "event": "$pageview",
+    "distinct_id": "user-1",
+    "timestamp": "2024-05-01T12:00:00Z",
+    "uuid": "00000000-0000-0000-0000-000000000007",
+    "$lib": "web",
+    "properties": {"url": "https://example.com/ü", "n": 1.5, "nested": {"a": [1, None, True]}},
+    "custom": "kept",
+}
+
+
+def _doc(ev: CaptureEvent) -> dict:
+    return json.loads(ev.serialized())
+
+
+@pytest.mark.parametrize("properties", [EVENT["properties"], {}, None])
+def test_serialized_matches_a_full_dump(properties):
+    body = dict(EVENT, properties=properties)
+    [(ev, key)] = normalize_body(body)
+    assert key == "user-1"
+    assert _doc(ev) == json.loads(ev.model_dump_json(by_alias=True, exclude_none=False))
+    assert _doc(ev)["properties"] == properties
+    assert _doc(ev)["$lib"] == "web" and _doc(ev)["custom"] == "kept"
+
+
+def test_properties_are_serialized_once_during_validation(monkeypatch):
+    [(ev, _)] = normalize_body(EVENT)
+    calls = []
+    monkeypatch.setattr(json, "dumps", lambda *a, **k: calls.append(a) or "{}")
+    ev.serialized()
+    assert calls == []
+    assert ev.serialized().endswith(b',"properties":' + ev._properties_json.encode() + b"}")
+
+
+def test_project_override_wins_and_batch_default_fills_gaps():
+    batch = {"project_id": "body", "batch": [dict(EVENT), dict(EVENT, project_id="own")]}
+    assert [_doc(ev)["project_id"] for ev, _ in normalize_body(batch)] == ["body", "own"]
+    assert [_doc(ev)["project_id"] for ev, _ in normalize_body(batch, "key")] == ["key", "key"]
+    assert _doc(normalize_body(dict(EVENT, project_id="own"), "key")[0][0])["project_id"] == "key"
+
+
+@pytest.mark.parametrize(
+    "setting, value, properties, message",
+    [
+        ("properties_max_keys", 2, {"a": 1, "b": 2, "c": 3}, "keys"),
+        ("properties_max_depth", 2, {"a": {"b": {"c": 1}}}, "depth"),
+        ("properties_max_size_bytes", 20, {"a": "x" * 30}, "size"),
+    ],
+)
+def test_property_limits(monkeypatch, setting, value, properties, message):
+    monkeypatch.setattr(settings, setting, value)
+    with pytest.raises(ValidationError, match=message):
+        normalize_body(dict(EVENT, properties=properties))
+
+
+def test_size_limit_counts_utf8_bytes(monkeypatch):
+    # json.dumps escapes non-ASCII, so "ü" counts as the 6 bytes of its \u00fc escape.
+    monkeypatch.setattr(settings, "properties_max_size_bytes", len('{"a": "\\u00fc"}'))
+    normalize_body(dict(EVENT, properties={"a": "ü"}))
+    with pytest.raises(ValidationError):
+        normalize_body(dict(EVENT, properties={"a": "üü"}))
@@ -0,0 +1,82 @@
+"""Unit tests for batch produce (app.kafka_producer). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import asyncio
+
+import pytest
+
+from app import kafka_producer
+from app.config import settings
+
+
+class _FakeProducer:
+    """send() queues a delivery future; send_and_wait() delivers before returning."""
+
+    def __init__(self, fail_send=(), fail_delivery=()):
+        self.fail_send = set(fail_send)
+        self.fail_delivery = set(fail_delivery)
+        self.pending: list[tuple[bytes, asyncio.Future]] = []
+        self.delivered: list[bytes] = []
+        self.send_and_wait_calls = 0
+
+    async def send(self, topic, value=None, key=None):
+        if value in self.fail_send:
+            raise RuntimeError("buffer full")
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((value, fut))
+        asyncio.get_running_loop().call_soon(self._deliver)
+        return fut
+
+    def _deliver(self):
+        while self.pending:
+            value, fut = self.pending.pop(0)
+            if value in self.fail_delivery:
+                fut.set_exception(RuntimeError("delivery failed"))
+            else:
+                self.delivered.append(value)
+                fut.set_result(None)
+
+    async def send_and_wait(self, topic, value=None, key=None):
+        self.send_and_wait_calls += 1
+        fut = await self.send(topic, value=value, key=key)
+        return await fut
+
+
+def _events(n):
+    return [(b"user", b"v%d" % i) for i in range(n)]
+
+
+@pytest.mark.parametrize("pipelined", [True, False])
+def test_all_records_delivered(monkeypatch, pipelined):
+    monkeypatch.setattr(settings, "kafka_pipelined_produce", pipelined)
+    producer = _FakeProducer()
+    assert asyncio.run(kafka_producer.produce_events(producer, _events(5))) == []
+    assert producer.delivered == [b"v0", b"v1", b"v2", b"v3", b"v4"]
+    assert kafka_producer.inflight_records() == 0
+
+
+def test_pipelined_sends_without_waiting_per_record(monkeypatch):
+    monkeypatch.setattr(settings, "kafka_pipelined_produce", True)
+    producer = _FakeProducer()
+    asyncio.run(kafka_producer.produce_events(producer, _events(3)))
+    assert producer.send_and_wait_calls == 0
+
+
+@pytest.mark.parametrize("pipelined", [True, False])
+def test_failed_records_reported_by_index(monkeypatch, pipelined):
+    monkeypatch.setattr(settings, "kafka_pipelined_produce", pipelined)
+    producer = _FakeProducer(fail_send={b"v1"}, fail_delivery={b"v3"})
+    failed = asyncio.run(kafka_producer.produce_events(producer, _events(5)))
+    assert failed == [1, 3]
+    assert producer.delivered == [b"v0", b"v2", b"v4"]
+    assert kafka_producer.inflight_records() == 0
+
+
+def test_request_latency_feeds_the_moving_average(monkeypatch):
+    monkeypatch.setattr(settings, "kafka_pipelined_produce", True)
+    monkeypatch.setattr(kafka_producer, "_latency_ewma", 0.0)
+    asyncio.run(kafka_producer.produce_events(_FakeProducer(), _events(2)))
+    assert kafka_producer.recent_produce_latency() > 0
+    monkeypatch.setattr(kafka_producer, "_latency_updated", 0.0)
+    assert kafka_producer.recent_produce_latency() == 0.0
@@ -0,0 +1,153 @@
+"""Unit tests for rate limiting (app.rate_limit). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+
+The lease logic runs against an in-process bucket with the Lua script's arithmetic.
+The Lua script itself runs only when CAPTURE_TEST_REDIS_URL points at a Redis
+that may be written to (keys ratelimit:unit-test-*).
+"""
+import asyncio
+import math
+import os
+import uuid
+
+import pytest
+
+from app import rate_limit
+from app.config import settings
+
+
+class _FakeBucketScript:
+    """Token bucket with the same refill/debit rule as _TOKEN_BUCKET_LUA, on a manual clock."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.now_ms = 0.0
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.calls: list[int] = []
+
+    async def __call__(self, keys, args):
+        capacity, rate, requested = args
+        self.calls.append(requested)
+        await asyncio.sleep(0.001)
+        if self.fail:
+            raise ConnectionError("redis down")
+        tokens, ts = self.buckets.get(keys[0], (capacity, self.now_ms))
+        tokens = min(capacity, tokens + max(0.0, self.now_ms - ts) * rate)
+        granted = min(requested, math.floor(tokens))
+        tokens -= granted
+        self.buckets[keys[0]] = (tokens, self.now_ms)
+        retry_ms = math.ceil((1 - tokens) / rate) if granted == 0 else 0
+        return [granted, retry_ms]
+
+
+@pytest.fixture
+def redis_backend(monkeypatch):
+    script = _FakeBucketScript()
+    monkeypatch.setattr(settings, "rate_limit_backend", "redis")
+    monkeypatch.setattr(settings, "rate_limit_lease_size", 10)
+    monkeypatch.setattr(settings, "rate_limit_lease_ttl_seconds", 60.0)
+    monkeypatch.setattr(rate_limit, "_script", script)
+    monkeypatch.setattr(rate_limit, "_redis_retry_at", 0.0)
+    rate_limit._leases.clear()
+    yield script
+    rate_limit._leases.clear()
+
+
+def _check_many(key, limit, n):
+    async def run():
+        return [await rate_limit.check_rate_limit(key, limit) for _ in range(n)]
+    return asyncio.run(run())
+
+
+def test_most_requests_are_decided_from_the_local_lease(redis_backend):
+    decisions = _check_many("k", 6000, 25)
+    assert all(allowed for allowed, _ in decisions)
+    assert redis_backend.calls == [10, 10, 10]
+
+
+def test_lease_is_capped_at_one_second_of_rate(redis_backend):
+    _check_many("k", 120, 3)
+    assert redis_backend.calls == [2, 2]
+
+
+def test_exhausted_bucket_limits_with_retry_after(redis_backend):
+    decisions = _check_many("k", 60, 61)
+    assert all(allowed for allowed, _ in decisions[:60])
+    assert decisions[60] == (False, 1)
+    redis_backend.now_ms += 1000
+    assert _check_many("k", 60, 1) == [(True, 0)]
+
+
+def test_keys_have_separate_buckets(redis_backend):
+    _check_many("a", 60, 60)
+    assert _check_many("a", 60, 1)[0][0] is False
+    assert _check_many("b", 60, 1) == [(True, 0)]
+
+
+def test_concurrent_requests_share_one_refill(redis_backend):
+    async def run():
+        return await asyncio.gather(*(rate_limit.check_rate_limit("k", 6000) for _ in range(8)))
+
+    assert all(allowed for allowed, _ in asyncio.run(run()))
+    assert redis_backend.calls == [10]
+
+
+def test_cancelled_request_does_not_cancel_the_shared_refill(redis_backend):
+    async def run():
+        first = asyncio.create_task(rate_limit.check_rate_limit("k", 6000))
+        second = asyncio.create_task(rate_limit.check_rate_limit("k", 6000))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == (True, 0)
+    assert redis_backend.calls == [10]
+
+
+def test_redis_error_fails_open_and_backs_off(redis_backend, monkeypatch):
+    redis_backend.fail = True
+    monkeypatch.setattr(settings, "rate_limit_redis_backoff_seconds", 60.0)
+    decisions = _check_many("k", 60, 5)
+    assert decisions == [(True, 0)] * 5
+    assert len(redis_backend.calls) == 1
+
+
+def test_idle_leases_are_evicted(redis_backend, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_max_local_keys", 2)
+    for key in ("a", "b", "c", "d"):
+        _check_many(key, 6000, 1)
+    # Eviction runs before the new key is added, least recently used first.
+    assert list(rate_limit._leases) == ["b", "c", "d"]
+
+
+def test_memory_backend_fixed_window(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_backend", "memory")
+    rate_limit._limits.clear()
+    decisions = _check_many(f"mem-{uuid.uuid4()}", 3, 4)
+    assert [allowed for allowed, _ in decisions] == [True, True, True, False]
+    assert 1 <= decisions[3][1] <= 60
+
+
+@pytest.mark.skipif(not os.environ.get("CAPTURE_TEST_REDIS_URL"), reason="CAPTURE_TEST_REDIS_URL not set")
+def test_lua_token_bucket_against_redis():
+    import redis.asyncio as aioredis
+
+    async def run():
+        client = aioredis.Redis.from_url(os.environ["CAPTURE_TEST_REDIS_URL"])
+        script = client.register_script(rate_limit._TOKEN_BUCKET_LUA)
+        key = f"ratelimit:unit-test-{uuid.uuid4()}"
+        try:
+            # 60/min: capacity 60, one token per second.
+            grants = [await script(keys=[key], args=[60, 60 / 60000.0, 25]) for _ in range(3)]
+            denied = await script(keys=[key], args=[60, 60 / 60000.0, 1])
+            ttl_ms = await client.pttl(key)
+        finally:
+            await client.delete(key)
+            await client.aclose()
+        return grants, denied, ttl_ms
+
+    grants, denied, ttl_ms = asyncio.run(run())
+    assert [int(g) for g, _ in grants] == [25, 25, 10]
+    assert int(denied[0]) == 0 and 0 < int(denied[1]) <= 1000
+    assert 0 < ttl_ms <= 61000
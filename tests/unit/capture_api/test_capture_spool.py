@@ -0,0 +1,234 @@
+"""Unit tests for the local disk spool (app.spool). Run from services/capture-api:
+
+    cd services/capture-api && python -m pytest ../../tests/unit/capture_api
+"""
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from app import kafka_producer
+from app import spool as spool_module
+from app import spool_replay
+from app.config import settings
+from app.spool import DEAD_LETTER_FILE, DiskSpool, SpoolFull, drain_spool, iter_frames, produce_or_spool
+
+
+def _records(n: int, start: int = 0) -> list[tuple[bytes, bytes]]:
+    return [(b"user", b"event-%d" % i) for i in range(start, start + n)]
+
+
+def _open(path, max_bytes=1 << 20, segment_bytes=1 << 20) -> DiskSpool:
+    spool = DiskSpool(str(path), max_bytes=max_bytes, segment_bytes=segment_bytes)
+    spool.open()
+    return spool
+
+
+def test_read_commit_and_reopen(tmp_path):
+    spool = _open(tmp_path)
+    spool.append(_records(5))
+    records, ends = spool.read_batch(3)
+    assert records == _records(3)
+    assert len(ends) == 3 and ends == sorted(ends)
+    spool.commit(2, ends[1])
+    spool.close()
+
+    spool = _open(tmp_path)
+    assert spool._records == 3
+    records, _ = spool.read_batch(10)
+    assert records == _records(3, start=2)
+    spool.close()
+
+
+def test_segments_roll_and_are_deleted_when_drained(tmp_path):
+    spool = _open(tmp_path, segment_bytes=64)
+    for i in range(6):
+        spool.append(_records(1, start=i))
+    assert len(spool._segments) > 1
+    delivered = []
+    while not spool.empty:
+        records, ends = spool.read_batch(100)
+        if not records:
+            spool.finish_segment()
+            continue
+        delivered += records
+        spool.commit(len(records), ends[-1])
+    spool.release_drained()
+    assert delivered == _records(6)
+    assert spool._segments == [] and spool._bytes == 0
+    assert list(spool.dir.glob("*.seg")) == []
+    spool.close()
+
+
+def test_append_beyond_max_bytes_raises(tmp_path):
+    spool = _open(tmp_path, max_bytes=100)
+    spool.append(_records(2))
+    with pytest.raises(SpoolFull):
+        spool.append(_records(10))
+    assert spool._records == 2
+    spool.close()
+
+
+def test_torn_tail_is_not_counted(tmp_path):
+    spool = _open(tmp_path)
+    spool.append(_records(2))
+    spool.close()
+    segment = next(tmp_path.glob("*/*.seg"))
+    segment.write_bytes(segment.read_bytes() + b"\x00\x00\x00\x04\x00\x00")
+    spool = _open(tmp_path)
+    assert spool._records == 2
+    assert spool.read_batch(10)[0] == _records(2)
+    spool.close()
+
+
+def test_produce_or_spool_keeps_order_behind_spooled_records(tmp_path, monkeypatch):
+    async def produce(producer, payloads):
+        raise AssertionError("must not produce while the spool holds records")
+
+    monkeypatch.setattr(spool_module, "produce_events", produce)
+    spool = _open(tmp_path)
+    spool.append(_records(1))
+    failed, spooled = asyncio.run(produce_or_spool(object(), spool, _records(2, start=1)))
+    assert (failed, spooled) == ([], [0, 1])
+    assert spool.read_batch(10)[0] == _records(3)
+    spool.close()
+
+
+def _drain(spool: DiskSpool, run_seconds: float) -> None:
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(drain_spool(spool, lambda: object(), stop))
+        await asyncio.sleep(run_seconds)
+        stop.set()
+        await task
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def fast_drain(monkeypatch):
+    monkeypatch.setattr(settings, "spool_retry_backoff_seconds", 0.001)
+    monkeypatch.setattr(settings, "spool_retry_backoff_max_seconds", 0.001)
+    monkeypatch.setattr(settings, "spool_drain_idle_seconds", 0.01)
+    monkeypatch.setattr(settings, "spool_drain_batch", 10)
+    monkeypatch.setattr(settings, "spool_max_attempts", 3)
+    monkeypatch.setattr(spool_module, "producer_healthy", _healthy(True))
+
+
+def _healthy(result: bool):
+    async def probe(producer):
+        return result
+    return probe
+
+
+def test_drain_commits_delivered_prefix_and_dead_letters_a_stuck_record(tmp_path, monkeypatch, fast_drain):
+    values = [value for _, value in _records(25)]
+    values[12] = b"poison"
+    delivered = []
+
+    async def produce(producer, records):
+        failed = []
+        for i, (_, value) in enumerate(records):
+            if value == b"poison":
+                failed.append(i)
+            else:
+                delivered.append(value)
+        return failed
+
+    monkeypatch.setattr(spool_module, "produce_events", produce)
+    spool = _open(tmp_path)
+    spool.append([(b"user", value) for value in values])
+    _drain(spool, 0.3)
+    assert spool.empty
+    assert set(delivered) == set(values) - {b"poison"}
+    # The records before the stuck one were committed and not sent again.
+    assert all(delivered.count(value) == 1 for value in values[:12])
+    assert list(iter_frames(spool.dir / DEAD_LETTER_FILE)) == [(b"user", b"poison")]
+    spool.close()
+
+    # The dead-letter file is not mistaken for a segment on restart.
+    spool = _open(tmp_path)
+    assert spool.empty and spool._segments == []
+    spool.append(_records(1))
+    assert spool.read_batch(10)[0] == _records(1)
+    spool.close()
+
+
+async def _fail_all(producer, records):
+    return list(range(len(records)))
+
+
+@pytest.mark.parametrize("n_records", [25, 1])
+def test_outage_dead_letters_nothing(tmp_path, monkeypatch, fast_drain, n_records):
+    monkeypatch.setattr(spool_module, "produce_events", _fail_all)
+    monkeypatch.setattr(spool_module, "producer_healthy", _healthy(False))
+    spool = _open(tmp_path)
+    spool.append(_records(n_records))
+    _drain(spool, 0.2)
+    assert spool._records == n_records
+    assert not (spool.dir / DEAD_LETTER_FILE).exists()
+    spool.close()
+
+
+def test_lone_record_is_dead_lettered_when_kafka_is_healthy(tmp_path, monkeypatch, fast_drain):
+    monkeypatch.setattr(spool_module, "produce_events", _fail_all)
+    spool = _open(tmp_path)
+    spool.append(_records(1))
+    _drain(spool, 0.2)
+    assert spool.empty
+    assert list(iter_frames(spool.dir / DEAD_LETTER_FILE)) == _records(1)
+    spool.close()
+
+
+def test_replay_produces_dead_letters_and_keeps_failures(tmp_path, monkeypatch):
+    spool = _open(tmp_path)
+    spool.append(_records(3))
+    records, ends = spool.read_batch(3)
+    for record, end in zip(records, ends):
+        spool.dead_letter(record, end)
+    spool.close()
+    sent = []
+
+    async def produce(producer, records):
+        sent.extend(records)
+        return [i for i, (_, value) in enumerate(records) if value == b"event-1"]
+
+    monkeypatch.setattr(spool_replay, "produce_events", produce)
+    monkeypatch.setattr(spool_replay, "get_producer", lambda: contextlib.nullcontext(object()))
+
+    assert asyncio.run(spool_replay.replay(tmp_path, dry_run=True)) == {"files": 1, "replayed": 3, "failed": 0}
+    assert asyncio.run(spool_replay.replay(tmp_path, dry_run=False)) == {"files": 1, "replayed": 2, "failed": 1}
+    assert sent == _records(3)
+    assert not list(tmp_path.glob(f"*/{DEAD_LETTER_FILE}"))
+    (left,) = tmp_path.glob("*/dead-letter-*.replay")
+    assert list(iter_frames(left)) == _records(1, start=1)
+
+
+class _FakeCluster:
+    def __init__(self, partitions, available):
+        self.partitions, self.available = partitions, available
+
+    def partitions_for_topic(self, topic):
+        return self.partitions
+
+    def available_partitions_for_topic(self, topic):
+        return self.available
+
+
+def _probe(updated, partitions, available) -> bool:
+    async def force_metadata_update():
+        if isinstance(updated, Exception):
+            raise updated
+        return updated
+
+    client = SimpleNamespace(force_metadata_update=force_metadata_update, cluster=_FakeCluster(partitions, available))
+    return asyncio.run(kafka_producer.producer_healthy(SimpleNamespace(client=client)))
+
+
+def test_producer_health_probe():
+    assert _probe(True, {0, 1}, {0, 1}) is True
+    assert _probe(True, {0, 1}, {0}) is False  # a partition without a leader
+    assert _probe(False, {0, 1}, {0, 1}) is False
+    assert _probe(True, None, set()) is False  # topic unknown
+    assert _probe(ConnectionError("down"), {0}, {0}) is False
@@ -0,0 +1,114 @@
+"""Unit tests for batch sizing (app.batch_control). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import batch_control
+from app.batch_control import _UPDATE_SECONDS, BatchController
+from app.config import settings
+
+_now = [0.0]
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    _now[0] = 1000.0
+    monkeypatch.setattr(batch_control, "time", SimpleNamespace(monotonic=lambda: _now[0]))
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(settings, "adaptive_batching", True)
+    monkeypatch.setattr(settings, "batch_size", 1000)
+    monkeypatch.setattr(settings, "batch_interval_seconds", 5.0)
+    monkeypatch.setattr(settings, "batch_size_min", 100)
+    monkeypatch.setattr(settings, "batch_size_max", 20000)
+    monkeypatch.setattr(settings, "batch_interval_min_seconds", 0.5)
+    monkeypatch.setattr(settings, "batch_interval_max_seconds", 10.0)
+    monkeypatch.setattr(settings, "target_inserts_per_second", 1.0)
+    monkeypatch.setattr(settings, "max_inflight_batches", 2)
+
+
+def _step(control: BatchController, events_per_second: float, lag: int = 0) -> None:
+    control.observe_consumed(int(events_per_second * _UPDATE_SECONDS))
+    _now[0] += _UPDATE_SECONDS
+    control.update(lag)
+
+
+def test_static_values_without_adaptive_batching(monkeypatch):
+    monkeypatch.setattr(settings, "adaptive_batching", False)
+    monkeypatch.setattr(settings, "batch_size", 1234)
+    control = BatchController()
+    _step(control, 100_000, lag=10**9)
+    assert (control.batch_size, control.interval_seconds) == (1234, settings.batch_interval_seconds)
+
+
+def test_no_update_before_the_step_interval(adaptive):
+    control = BatchController()
+    control.observe_consumed(10**6)
+    control.update(0)
+    assert control.batch_size == 1000
+
+
+def test_size_follows_rate_halfway_per_step(adaptive):
+    control = BatchController()
+    _step(control, 5000)
+    assert control.batch_size == 3000
+    for _ in range(20):
+        _step(control, 5000)
+    assert control.batch_size == pytest.approx(5000, abs=2)
+    assert control.interval_seconds == pytest.approx(1.0, rel=0.01)
+
+
+def test_low_traffic_makes_fewer_larger_inserts(adaptive):
+    control = BatchController()
+    for _ in range(20):
+        _step(control, 10)
+    assert control.batch_size == 100
+    assert control.interval_seconds == pytest.approx(10.0, rel=0.01)
+
+
+def test_lag_moves_size_towards_the_maximum(adaptive):
+    control = BatchController()
+    _step(control, 5000, lag=10**6)
+    assert control.batch_size == (1000 + 20000) // 2
+
+
+def test_slow_inserts_scale_the_size_up(adaptive):
+    fast, slow = BatchController(), BatchController()
+    slow.observe_insert(1000, 4.0)
+    for _ in range(20):
+        _step(fast, 5000)
+        _step(slow, 5000)
+    # 4 s inserts with 2 in flight sustain 0.5 inserts/s at most: batches double.
+    assert slow.batch_size == pytest.approx(2 * fast.batch_size, rel=0.01)
+
+
+def test_insert_latency_is_an_ewma(adaptive):
+    control = BatchController()
+    control.observe_insert(100, 1.0)
+    control.observe_insert(100, 3.0)
+    assert control._insert_latency == pytest.approx(2.0)
+
+
+def test_flush_size_scales_with_partitions_per_flush(adaptive):
+    single, spread = BatchController(), BatchController()
+    for _ in range(20):
+        spread.observe_flush(4)
+        _step(single, 5000)
+        _step(spread, 5000)
+    # Four inserts per flush: four times the rows per flush, each insert the same size,
+    # and at least four target periods between time-based flushes.
+    assert spread.batch_size == pytest.approx(4 * single.batch_size, rel=0.01)
+    assert spread.interval_seconds == pytest.approx(4.0, rel=0.01)
+
+
+def test_per_insert_bounds_apply_before_scaling_by_partitions(adaptive):
+    control = BatchController()
+    for _ in range(30):
+        control.observe_flush(3)
+        _step(control, 5000, lag=10**6)
+    assert control.batch_size == pytest.approx(3 * settings.batch_size_max, rel=0.01)
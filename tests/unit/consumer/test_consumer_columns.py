@@ -0,0 +1,92 @@
+"""Unit tests for the columnar batch buffer (app.clickhouse_client). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+
+from app.clickhouse_client import EVENT_COLUMNS, EventColumns, insert_batch
+from app.config import settings
+
+UUID_1 = "00000000-0000-0000-0000-000000000001"
+EVENTS = [
+    {
+        "event": "$pageview",
+        "distinct_id": "u1",
+        "project_id": "p1",
+        "timestamp": "2024-05-01T12:00:00Z",
+        "uuid": UUID_1,
+        "$lib": "web",
+        "$lib_version": "1.0",
+        "$device_id": "d1",
+        "properties": {"url": "/ü", "n": 1},
+    },
+    {"event": "click", "distinct_id": "u2", "uuid": "not-a-uuid", "lib": "ios", "properties": None},
+]
+
+
+class _FakeClient:
+    def __init__(self):
+        self.inserts = []
+
+    def insert(self, table, data, column_names=None, column_oriented=False, settings=None):
+        self.inserts.append((table, data, column_names, column_oriented, settings))
+
+
+def _buffer(events=EVENTS) -> EventColumns:
+    batch = EventColumns()
+    for raw in events:
+        batch.append(raw)
+    return batch
+
+
+def test_events_become_column_values():
+    batch = _buffer()
+    assert len(batch) == 2
+    assert batch.column_names()[: len(EVENT_COLUMNS)] == list(EVENT_COLUMNS)
+    assert batch.timestamp[0] == datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    assert batch.uuid == [UUID(UUID_1), None]
+    assert batch.event == ["$pageview", "click"]
+    assert batch.project_id == ["p1", "default"]
+    assert [json.loads(p) for p in batch.properties] == [{"url": "/ü", "n": 1}, {}]
+    assert batch.lib == ["web", "ios"]
+    assert batch.lib_version == ["1.0", None]
+    assert batch.device_id == ["d1", None]
+    assert all(len(column) == 2 for column in batch.columns())
+
+
+def test_long_values_are_truncated_and_bad_timestamps_default_to_now():
+    batch = _buffer([{"event": "e" * 5000, "distinct_id": "d", "project_id": "p" * 300, "timestamp": "yesterday"}])
+    assert len(batch.event[0]) == 4096
+    assert len(batch.project_id[0]) == 256
+    assert abs((datetime.utcnow() - batch.timestamp[0]).total_seconds()) < 60
+
+
+def test_to_events_rebuilds_capture_payloads():
+    [first, second] = _buffer().to_events()
+    assert first == {
+        "event": "$pageview",
+        "distinct_id": "u1",
+        "project_id": "p1",
+        "timestamp": "2024-05-01T12:00:00+00:00",
+        "uuid": UUID_1,
+        "$lib": "web",
+        "$lib_version": "1.0",
+        "$device_id": "d1",
+        "properties": {"url": "/ü", "n": 1},
+    }
+    assert "uuid" not in second and second["$lib"] == "ios" and second["properties"] == {}
+
+
+def test_insert_is_column_oriented_with_the_dedup_token():
+    client = _FakeClient()
+    batch = _buffer()
+    insert_batch(client, batch, dedup_token="t-1")
+    insert_batch(client, EventColumns())
+    [(table, data, names, column_oriented, insert_settings)] = client.inserts
+    assert table == settings.clickhouse_table
+    assert column_oriented is True
+    assert names == batch.column_names()
+    assert data == batch.columns()
+    assert insert_settings == {"insert_deduplication_token": "t-1"}
@@ -0,0 +1,176 @@
+"""Unit tests for DLQ publishing and replay (app.dlq, app.dlq_replay). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import argparse
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from aiokafka import TopicPartition
+
+from app import dlq_replay
+from app.config import settings
+from app.dlq import send_to_dlq
+from app.dlq_replay import Replayer, _parse_time
+
+
+class _FakeProducer:
+    """send() queues a delivery future; deliveries complete only after every send."""
+
+    def __init__(self, fail_values=()):
+        self.fail_values = set(fail_values)
+        self.sent: list[tuple[str, bytes, bytes]] = []
+        self.futures: list[asyncio.Future] = []
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, value, key))
+        fut = asyncio.get_running_loop().create_future()
+        self.futures.append(fut)
+        if len(self.sent) == 1:
+            asyncio.get_running_loop().call_soon(self._deliver)
+        return fut
+
+    def _deliver(self):
+        for (_, value, _), fut in zip(self.sent, self.futures):
+            if json.loads(value).get("raw", {}).get("event") in self.fail_values:
+                fut.set_exception(RuntimeError("delivery failed"))
+            else:
+                fut.set_result(None)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+def _raw(i: int) -> dict:
+    return {"event": f"e{i}", "distinct_id": f"u{i}", "properties": {"i": i}}
+
+
+def test_dlq_batch_is_sent_before_waiting():
+    producer = _FakeProducer()
+    asyncio.run(send_to_dlq(producer, [_raw(0), _raw(1), {"event": "x"}], "insert_failed", "boom"))
+    assert [topic for topic, _, _ in producer.sent] == [settings.dlq_topic] * 3
+    assert [key for _, _, key in producer.sent] == [b"u0", b"u1", b"unknown"]
+    doc = json.loads(producer.sent[0][1])
+    assert doc["raw"] == _raw(0)
+    assert (doc["error_kind"], doc["error_message"]) == ("insert_failed", "boom")
+    assert doc["dlq_ts"].endswith("Z")
+
+
+def test_dlq_delivery_error_is_raised_after_all_sends():
+    producer = _FakeProducer(fail_values={"e1"})
+    with pytest.raises(RuntimeError, match="delivery failed"):
+        asyncio.run(send_to_dlq(producer, [_raw(0), _raw(1), _raw(2)], "insert_failed", "boom"))
+    assert len(producer.sent) == 3
+
+
+def test_empty_dlq_batch_sends_nothing():
+    producer = _FakeProducer()
+    asyncio.run(send_to_dlq(producer, [], "insert_failed", "boom"))
+    assert producer.sent == []
+
+
+def _args(**overrides) -> argparse.Namespace:
+    args = dict(
+        error_kind=None, since=None, until=None, target="kafka", rate=0.0,
+        group_id="g", dry_run=False, metrics_port=0,
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def _dlq_value(raw, error_kind="insert_failed", ts="2026-01-02T00:00:00Z") -> bytes:
+    return json.dumps({"raw": raw, "error_kind": error_kind, "error_message": "x", "dlq_ts": ts}).encode()
+
+
+def test_select_filters_by_kind_and_time():
+    replayer = Replayer(_args(
+        error_kind=["insert_failed"],
+        since=_parse_time("2026-01-01T00:00:00Z"),
+        until=_parse_time("2026-01-03T00:00:00"),
+    ))
+    assert replayer._select(_dlq_value(_raw(0))) == _raw(0)
+    assert replayer._select(_dlq_value(_raw(0), error_kind="parse_error")) is None
+    assert replayer._select(_dlq_value(_raw(0), ts="2025-12-31T23:59:59Z")) is None
+    assert replayer._select(_dlq_value(_raw(0), ts="2026-01-03T00:00:00Z")) is None
+    assert replayer._select(b"not json") is None
+    assert replayer._select(_dlq_value({"event": "e"})) is None
+    assert replayer.counts == {"replayed": 0, "filtered": 3, "skipped": 2}
+
+
+class _FakeConsumer:
+    """One partition of the DLQ topic holding ``values``, read once from the start."""
+
+    def __init__(self, values):
+        self.values = values
+        self.tp = TopicPartition(settings.dlq_topic, 0)
+        self.pos = 0
+        self.commits: list[dict] = []
+        self.listener = None
+
+    def subscribe(self, topics, listener=None):
+        self.listener = listener
+
+    async def start(self):
+        await self.listener.on_partitions_assigned({self.tp})
+
+    async def stop(self):
+        pass
+
+    async def end_offsets(self, tps):
+        return {tp: len(self.values) for tp in tps}
+
+    async def getmany(self, timeout_ms=0, max_records=None):
+        batch = self.values[self.pos:self.pos + max_records]
+        messages = [SimpleNamespace(offset=self.pos + i, value=v) for i, v in enumerate(batch)]
+        self.pos += len(batch)
+        return {self.tp: messages} if messages else {}
+
+    def assignment(self):
+        return {self.tp}
+
+    async def position(self, tp):
+        return self.pos
+
+    async def commit(self, offsets):
+        self.commits.append(dict(offsets))
+
+
+def _replay(monkeypatch, values, **overrides):
+    consumer = _FakeConsumer(values)
+    producer = _FakeProducer()
+    monkeypatch.setattr(dlq_replay, "AIOKafkaConsumer", lambda **kwargs: consumer)
+    monkeypatch.setattr(dlq_replay, "AIOKafkaProducer", lambda **kwargs: producer)
+    monkeypatch.setattr(settings, "batch_size", 2)
+    counts = asyncio.run(Replayer(_args(**overrides)).run())
+    return counts, consumer, producer
+
+
+def test_replay_reinjects_raw_events_and_commits_progress(monkeypatch):
+    values = [_dlq_value(_raw(0)), b"garbage", _dlq_value(_raw(1)), _dlq_value(_raw(2))]
+    counts, consumer, producer = _replay(monkeypatch, values)
+    assert counts == {"replayed": 3, "filtered": 0, "skipped": 1}
+    assert [(topic, json.loads(value)) for topic, value, _ in producer.sent] == [
+        (settings.kafka_topic, _raw(i)) for i in range(3)
+    ]
+    assert consumer.commits[-1] == {consumer.tp: 4}
+
+
+def test_dry_run_counts_without_writing_or_committing(monkeypatch):
+    counts, consumer, producer = _replay(monkeypatch, [_dlq_value(_raw(0)), _dlq_value(_raw(1))], dry_run=True)
+    assert counts["replayed"] == 2
+    assert producer.sent == [] and consumer.commits == []
+
+
+def test_clickhouse_target_inserts_directly(monkeypatch):
+    inserted = []
+    monkeypatch.setattr(dlq_replay, "get_client", lambda: object())
+    monkeypatch.setattr(dlq_replay, "insert_batch", lambda client, columns: inserted.append(list(columns.event)))
+    counts, _, producer = _replay(monkeypatch, [_dlq_value(_raw(i)) for i in range(3)], target="clickhouse")
+    assert counts["replayed"] == 3
+    assert inserted == [["e0", "e1"], ["e2"]]
+    assert producer.sent == []
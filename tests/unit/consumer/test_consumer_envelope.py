@@ -0,0 +1,106 @@
+"""Unit tests for Kafka message decoding (app.envelope). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import json
+
+import msgpack
+import pytest
+
+from app.config import settings
+from app.envelope import MessageDecodeError, RawJSON, _decode_lazy, decode_message, full_event
+
+HEAD = '{"event":"$pageview","distinct_id":"u1","project_id":"p"'
+
+
+def _envelope(events, version=1) -> bytes:
+    return b"AEV" + bytes([version]) + msgpack.packb(events, use_bin_type=True)
+
+
+def test_envelope_round_trip():
+    events = [
+        {"event": "a", "distinct_id": "u1", "$lib": "web", "properties": {"n": 1, "nested": {"x": [1, 2]}}},
+        {"event": "b", "distinct_id": "u1", "uuid": None, "properties": None},
+    ]
+    assert decode_message(_envelope(events)) == events
+
+
+def test_envelope_skips_non_map_items():
+    assert decode_message(_envelope([{"event": "a"}, 5, "x"])) == [{"event": "a"}]
+
+
+@pytest.mark.parametrize(
+    "value, error",
+    [
+        (_envelope([{"event": "a"}], version=2), "unsupported envelope version"),
+        (b"AEV", "unsupported envelope version"),
+        (b"AEV\x01\xc1", "invalid envelope"),
+        (_envelope({"event": "a"}), "not an array"),
+    ],
+)
+def test_bad_envelopes_raise(value, error):
+    with pytest.raises(MessageDecodeError, match=error):
+        decode_message(value)
+
+
+@pytest.mark.parametrize(
+    "properties",
+    [
+        '{}',
+        '{"a":1,"b":"x"}',
+        '{"a":{"b":{"c":[1,{"d":2}]}}}',
+        '{"s":"} { \\" }","t":"{"}',
+        '{"properties":{"a":1}}',
+    ],
+)
+def test_trailing_properties_are_passed_through(properties):
+    value = f'{HEAD},"properties":{properties}}}'.encode()
+    doc = _decode_lazy(value)
+    assert isinstance(doc["properties"], RawJSON)
+    assert doc["properties"] == properties
+    assert full_event(doc) == json.loads(value)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        # A member after properties.
+        f'{HEAD},"properties":{{"a":1}},"x":5}}',
+        f'{HEAD},"properties":{{"a":1}},"extra":{{"b":2}}}}',
+        # "properties" as a key nested in another member.
+        '{"event":"e","meta":{"x":1,"properties":{"a":1}}}',
+        '{"event":"e","meta":{"x":1,"properties":{"a":1}},"properties":{"b":2}}',
+        # "properties" inside a string, and non-object properties.
+        '{"event":"e","note":"x,\\"properties\\":{\\"a\\":1}"}',
+        f'{HEAD},"properties":null}}',
+        f'{HEAD},"properties":[{{"a":1}}]}}',
+    ],
+)
+def test_other_layouts_fall_back_to_full_parse(value, monkeypatch):
+    data = value.encode()
+    assert _decode_lazy(data) is None
+    monkeypatch.setattr(settings, "lazy_decode", True)
+    assert [full_event(d) for d in decode_message(data)] == [json.loads(data)]
+
+
+@pytest.mark.parametrize("properties", ['{"a":tru,,}', '{"a":1} {"b":2}', '{"a":"\\x"}', '{"a":1}}{'])
+def test_invalid_properties_are_not_passed_through(properties, monkeypatch):
+    data = f'{HEAD},"properties":{properties}}}'.encode()
+    assert _decode_lazy(data) is None
+    monkeypatch.setattr(settings, "lazy_decode", True)
+    with pytest.raises(MessageDecodeError, match="invalid JSON"):
+        decode_message(data)
+
+
+def test_lazy_decode_off_parses_everything(monkeypatch):
+    monkeypatch.setattr(settings, "lazy_decode", False)
+    value = f'{HEAD},"properties":{{"a":1}}}}'.encode()
+    [doc] = decode_message(value)
+    assert doc["properties"] == {"a": 1} and not isinstance(doc["properties"], RawJSON)
+
+
+def test_invalid_json_raises():
+    with pytest.raises(MessageDecodeError, match="invalid JSON"):
+        decode_message(b'{"event":')
+    assert decode_message(b"") == []
+    assert decode_message(b"[1, 2]") == []
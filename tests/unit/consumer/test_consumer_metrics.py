@@ -0,0 +1,43 @@
+"""Unit tests for consumer readiness (app.metrics). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from app.config import settings
+from app.metrics import readiness
+
+
+def _registry(lag: dict[int, int], assigned: int) -> CollectorRegistry:
+    registry = CollectorRegistry()
+    gauge = Gauge("consumer_partition_lag", "lag", ["topic", "partition"], registry=registry)
+    for partition, value in lag.items():
+        gauge.labels(topic="events", partition=str(partition)).set(value)
+    Gauge("consumer_assigned_partitions", "assigned", registry=registry).set(assigned)
+    return registry
+
+
+@pytest.fixture(autouse=True)
+def max_lag(monkeypatch):
+    monkeypatch.setattr(settings, "ready_max_lag", 100)
+
+
+def test_ready_within_max_lag():
+    ready, body = readiness(_registry({0: 40, 1: 60, 2: 0}, assigned=3))
+    assert ready
+    assert body == {"status": "ready", "assigned_partitions": 3, "lag": 100, "partitions": {"events/0": 40, "events/1": 60}}
+
+
+def test_not_ready_over_max_lag():
+    ready, body = readiness(_registry({0: 40, 1: 61}, assigned=2))
+    assert not ready and body["status"] == "not ready" and body["lag"] == 101
+
+
+def test_ready_without_partitions():
+    assert readiness(_registry({}, assigned=0))[0]
+
+
+def test_max_lag_zero_disables_the_check(monkeypatch):
+    monkeypatch.setattr(settings, "ready_max_lag", 0)
+    assert readiness(_registry({0: 10**9}, assigned=1))[0]
@@ -0,0 +1,102 @@
+"""Unit tests for extracted property columns (app.property_columns). Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import json
+
+import pytest
+
+from app import clickhouse_client
+from app import property_columns as property_columns_module
+from app.backfill_property_columns import _column_expr
+from app.property_columns import PROPERTIES_MAP_SQL, PROPERTIES_NUM_SQL, PropertyColumns, extract_sql
+
+CONFIG = {"*": {"utm_source": "utm_source", "current_url": "$current_url"}, "proj_1": {"utm_source": "source"}}
+PROPS = {"utm_source": "google", "$current_url": "/a", "source": "ads", "n": 1}
+
+
+def test_columns_are_the_union_of_all_mappings():
+    assert PropertyColumns(CONFIG).columns == ("current_url", "utm_source")
+
+
+@pytest.mark.parametrize("properties", [PROPS, json.dumps(PROPS)])
+def test_project_mapping_overrides_the_default(properties):
+    columns = PropertyColumns(CONFIG)
+    assert columns.extract("other", properties) == ["/a", "google"]
+    assert columns.extract("proj_1", properties) == [None, "ads"]
+
+
+def test_values_follow_the_storage_rules():
+    columns = PropertyColumns({"*": {"a": "a", "b": "b", "c": "c", "d": "d"}})
+    props = {"a": "x", "b": {"k": ["ü", 1.5]}, "c": None, "d": True}
+    assert columns.extract("p", props) == ["x", '{"k":["ü",1.5]}', None, "true"]
+
+
+def test_text_without_a_mapped_key_is_not_parsed(monkeypatch):
+    columns = PropertyColumns(CONFIG)
+    monkeypatch.setattr(property_columns_module.json, "loads", lambda s: pytest.fail("parsed"))
+    assert columns.extract("other", '{"n":1}') == [None, None]
+
+
+@pytest.mark.parametrize(
+    "key",
+    ["ü", 'say "hi"', "back\\slash", "tab\there", "a/b"],
+)
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_keys_written_escaped_are_still_found(key, ensure_ascii):
+    columns = PropertyColumns({"*": {"col": key}})
+    text = json.dumps({key: "v"}, ensure_ascii=ensure_ascii)
+    assert columns.extract("p", text) == ["v"]
+    assert columns.extract("p", text.replace("/", "\\/")) == ["v"]
+
+
+def test_invalid_or_non_object_properties_give_nulls():
+    columns = PropertyColumns(CONFIG)
+    assert columns.extract("other", '{"utm_source": ') == [None, None]
+    assert columns.extract("other", '["utm_source"]') == [None, None]
+    assert columns.extract("other", None) == [None, None]
+
+
+@pytest.mark.parametrize("column", ["bad-name", "1col", "properties_map"])
+def test_invalid_column_names_are_rejected(column):
+    with pytest.raises(ValueError, match="invalid property column name"):
+        PropertyColumns({"*": {column: "k"}})
+
+
+def test_extract_sql_quotes_the_key():
+    sql = extract_sql("it's \\ here")
+    assert "'it\\'s \\\\ here'" in sql
+    assert sql.startswith("if(JSONType(properties, ")
+
+
+def test_maps_hold_every_property_with_numbers_in_properties_num():
+    columns = PropertyColumns(CONFIG, maps=True)
+    assert columns.columns == ("current_url", "utm_source", "properties_map", "properties_num")
+    props = {"utm_source": "google", "n": 2, "f": 0.5, "flag": True, "obj": {"a": [1]}, "gone": None}
+    for properties in (props, json.dumps(props)):
+        *mapped, strings, numbers = columns.extract("other", properties)
+        assert mapped == [None, "google"]
+        assert strings == {"utm_source": "google", "n": "2", "f": "0.5", "flag": "true", "obj": '{"a":[1]}'}
+        assert numbers == {"n": 2.0, "f": 0.5}
+
+
+def test_maps_are_empty_for_invalid_properties():
+    columns = PropertyColumns({}, maps=True)
+    assert columns.columns == ("properties_map", "properties_num")
+    assert columns.extract("p", "{bad") == [{}, {}]
+    assert columns.extract("p", "[1]") == [{}, {}]
+
+
+def test_maps_are_buffered_and_inserted_with_the_batch(monkeypatch):
+    monkeypatch.setattr(clickhouse_client, "property_columns", PropertyColumns({}, maps=True))
+    batch = clickhouse_client.EventColumns()
+    batch.append({"event": "e", "distinct_id": "d", "properties": '{"n":1,"s":"x"}'})
+    assert batch.column_names()[-2:] == ["properties_map", "properties_num"]
+    assert batch.columns()[-2:] == [[{"n": "1", "s": "x"}], [{"n": 1.0}]]
+
+
+def test_backfill_builds_the_maps_from_properties():
+    assert _column_expr("properties_map") == PROPERTIES_MAP_SQL
+    assert _column_expr("properties_num") == PROPERTIES_NUM_SQL
+    assert "JSONExtractKeysAndValuesRaw(properties)" in PROPERTIES_MAP_SQL
+    assert "JSONExtractFloat(kv.2)" in PROPERTIES_NUM_SQL
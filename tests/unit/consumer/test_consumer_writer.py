@@ -0,0 +1,353 @@
+"""Unit tests for the batch writer (app.writer) and failure classification (app.circuit).
+
+ClickHouse and Kafka are replaced by in-process fakes. Run from services/consumer:
+
+    cd services/consumer && python -m pytest ../../tests/unit/consumer
+"""
+import asyncio
+import time
+
+import pytest
+from aiokafka import TopicPartition
+from aiokafka.structs import ConsumerRecord, OffsetAndMetadata
+from clickhouse_connect.driver.exceptions import DatabaseError, OperationalError
+from prometheus_client import REGISTRY
+
+from app import writer as writer_module
+from app.batch_control import BatchController
+from app.circuit import is_unavailable
+from app.config import settings
+from app.logging_config import get_logger
+from app.writer import BatchWriter, _dedup_token, _parse_cuts
+
+TP = TopicPartition("events", 3)
+EVENT = {"event": "$pageview", "distinct_id": "u1", "project_id": "p", "properties": {"n": 1}}
+
+
+class _FakeConsumer:
+    def __init__(self):
+        self.commits: list[dict] = []
+
+    def assignment(self):
+        return {TP}
+
+    async def commit(self, offsets):
+        self.commits.append(offsets)
+
+    async def committed(self, tp):
+        return None
+
+    async def beginning_offsets(self, partitions):
+        return {tp: 0 for tp in partitions}
+
+    def highwater(self, tp):
+        return 100
+
+    def pause(self, *partitions):
+        self.paused_partitions = set(partitions)
+
+    def resume(self, *partitions):
+        self.paused_partitions -= set(partitions)
+
+    def paused(self):
+        return set(getattr(self, "paused_partitions", ()))
+
+
+class _FakeAdmin:
+    def __init__(self, offsets):
+        self.offsets = offsets
+
+    async def list_consumer_group_offsets(self, group_id, partitions=None):
+        return self.offsets
+
+    async def close(self):
+        pass
+
+
+class _FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, value))
+        return asyncio.sleep(0)
+
+
+class _RecordingControl(BatchController):
+    def __init__(self):
+        super().__init__()
+        self.inserts: list[tuple[int, float]] = []
+        self.flushes: list[int] = []
+
+    def observe_flush(self, partitions):
+        self.flushes.append(partitions)
+        super().observe_flush(partitions)
+
+    def observe_insert(self, rows, seconds):
+        self.inserts.append((rows, seconds))
+        super().observe_insert(rows, seconds)
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "insert_retry_count", 3)
+    monkeypatch.setattr(settings, "insert_retry_backoff_seconds", 0.001)
+    monkeypatch.setattr(settings, "clickhouse_breaker_failure_threshold", 100)
+    monkeypatch.setattr(settings, "insert_deduplication", True)
+
+
+def _writer(consumer=None, producer=None, control=None) -> BatchWriter:
+    return BatchWriter(consumer or _FakeConsumer(), producer or _FakeProducer(), control or BatchController(), get_logger())
+
+
+def _message(offset: int) -> ConsumerRecord:
+    return ConsumerRecord(TP.topic, TP.partition, offset, 1_700_000_000_000, 0, None, b"", None, 0, 0, [])
+
+
+def _consume(writer: BatchWriter, offsets) -> list[bool]:
+    cuts = []
+    for offset in offsets:
+        writer.buffer_for(TP).append(EVENT)
+        cuts.append(writer.track(TP, _message(offset)))
+    return cuts
+
+
+@pytest.mark.parametrize(
+    "exc, unavailable",
+    [
+        (ConnectionResetError("reset"), True),
+        (TimeoutError(), True),
+        (OperationalError("Error HTTPConnectionPool: Max retries exceeded"), True),
+        (DatabaseError("Received ClickHouse exception, code: 241, server response: Memory limit exceeded"), True),
+        (DatabaseError("HTTPDriver for http://ch:8123 received ClickHouse error code 252, Code: 252. Too many parts"), True),
+        (DatabaseError("Received ClickHouse exception, code: 53, server response: Type mismatch"), False),
+        (DatabaseError("Code: 60. Table analytics.events does not exist"), False),
+        (DatabaseError("HTTP status 503 Service Unavailable"), True),
+        (ValueError("bad value"), False),
+    ],
+)
+def test_is_unavailable(exc, unavailable):
+    assert is_unavailable(exc) is unavailable
+
+
+def test_dedup_token_is_deterministic_per_partition_and_range():
+    token = _dedup_token(TP, 10, 20)
+    assert token == _dedup_token(TopicPartition("events", 3), 10, 20)
+    assert len({token, _dedup_token(TP, 10, 21), _dedup_token(TP, 11, 20), _dedup_token(TopicPartition("events", 4), 10, 20)}) == 4
+
+
+@pytest.mark.parametrize(
+    "metadata, committed, cuts",
+    [
+        ("cuts:15,30", 10, [15, 30]),
+        ("cuts:30,15,5", 10, [15, 30]),
+        ("cuts:15", 15, []),
+        ("cuts:", 0, []),
+        ("cuts:1,x", 0, []),
+        ("", 0, []),
+        (None, 0, []),
+        ("something else", 0, []),
+    ],
+)
+def test_parse_cuts(metadata, committed, cuts):
+    assert list(_parse_cuts(metadata, committed)) == cuts
+
+
+def test_insert_latency_is_the_successful_attempt_only(monkeypatch, fast_retries):
+    attempts = []
+
+    def insert(batch, token):
+        attempts.append(token)
+        if len(attempts) == 1:
+            time.sleep(0.2)
+            raise ConnectionResetError("reset")
+        time.sleep(0.01)
+
+    monkeypatch.setattr(writer_module, "_insert_in_thread", insert)
+
+    async def run():
+        control = _RecordingControl()
+        writer = _writer(control=control)
+        _consume(writer, range(5))
+        await writer.flush()
+        await writer.drain()
+        await writer.close()
+        return control.inserts, writer
+
+    inserts, writer = asyncio.run(run())
+    assert len(attempts) == 2 and attempts[0] == attempts[1] == _dedup_token(TP, 0, 5)
+    [(rows, seconds)] = inserts
+    assert rows == 5 and seconds < 0.1
+    assert writer.committed[TP] == 5
+
+
+def test_rejected_batch_is_dead_lettered_without_touching_the_breaker(monkeypatch, fast_retries):
+    def insert(batch, token):
+        raise DatabaseError("Received ClickHouse exception, code: 53, server response: Type mismatch")
+
+    monkeypatch.setattr(writer_module, "_insert_in_thread", insert)
+    producer = _FakeProducer()
+
+    async def run():
+        control = _RecordingControl()
+        writer = _writer(producer=producer, control=control)
+        _consume(writer, range(3))
+        await writer.flush()
+        await writer.drain()
+        failures = writer.breaker._failures
+        await writer.close()
+        return control.inserts, failures, writer
+
+    inserts, failures, writer = asyncio.run(run())
+    assert inserts == [] and failures == 0
+    assert len(producer.sent) == 3 and all(topic == settings.dlq_topic for topic, _ in producer.sent)
+    assert b"insert rejected by ClickHouse" in producer.sent[0][1]
+    assert writer.committed[TP] == 3
+
+
+def test_flush_inserts_one_batch_per_partition_and_reports_the_count(monkeypatch, fast_retries):
+    other = TopicPartition("events", 4)
+    tokens = []
+    monkeypatch.setattr(writer_module, "_insert_in_thread", lambda batch, token: tokens.append((token, len(batch))))
+
+    async def run():
+        control = _RecordingControl()
+        writer = _writer(control=control)
+        _consume(writer, range(3))
+        for offset in range(7, 9):
+            writer.buffer_for(other).append(EVENT)
+            writer.track(other, _message(offset))
+        await writer.flush()
+        _consume(writer, range(3, 4))
+        await writer.flush()
+        await writer.drain()
+        await writer.close()
+        return control.flushes
+
+    assert asyncio.run(run()) == [2, 1]
+    assert sorted(tokens) == sorted([(_dedup_token(TP, 0, 3), 3), (_dedup_token(other, 7, 9), 2), (_dedup_token(TP, 3, 4), 1)])
+
+
+def test_replayed_partition_is_cut_at_the_recorded_batch_ends(monkeypatch, fast_retries):
+    tokens = []
+    monkeypatch.setattr(writer_module, "_insert_in_thread", lambda batch, token: tokens.append(token))
+
+    async def first_owner():
+        consumer = _FakeConsumer()
+        writer = _writer(consumer=consumer)
+        _consume(writer, range(10, 15))
+        await writer.flush()
+        _consume(writer, range(15, 30))
+        await writer.flush()
+        await writer.drain()
+        await writer.close()
+        return consumer.commits
+
+    commits = asyncio.run(first_owner())
+    original = list(tokens)
+    assert original == [_dedup_token(TP, 10, 15), _dedup_token(TP, 15, 30)]
+    # The commit before the second insert recorded both batch ends.
+    offset, metadata = commits[1][TP]
+    assert (offset, metadata) == (10, "cuts:15,30")
+
+    async def new_owner():
+        # Crashed after inserting, before the final commit: re-read from offset 10.
+        writer = _writer()
+        writer._admin = _FakeAdmin({TP: OffsetAndMetadata(offset, metadata)})
+        await writer.load_committed({TP})
+        cut_at = []
+        for n in range(10, 40):
+            if _consume(writer, [n]) == [True]:
+                # As the consumer loop does: flush the partition at a recorded cut.
+                cut_at.append(n)
+                await writer.flush([TP])
+        await writer.drain()
+        await writer.close()
+        return cut_at
+
+    tokens.clear()
+    assert asyncio.run(new_owner()) == [14, 29]
+    assert tokens == original + [_dedup_token(TP, 30, 40)]
+
+
+def test_outage_opens_the_breaker_pauses_and_retries_after_recovery(monkeypatch, fast_retries):
+    monkeypatch.setattr(settings, "clickhouse_breaker_enabled", True)
+    monkeypatch.setattr(settings, "clickhouse_breaker_failure_threshold", 2)
+    monkeypatch.setattr(settings, "clickhouse_breaker_probe_interval_seconds", 0.01)
+    attempts, probes = [], []
+
+    def insert(batch, token):
+        attempts.append(token)
+        if len(attempts) <= 2:
+            raise ConnectionResetError("reset")
+
+    def probe():
+        probes.append(1)
+        if len(probes) == 1:
+            raise ConnectionResetError("still down")
+
+    monkeypatch.setattr(writer_module, "_insert_in_thread", insert)
+    monkeypatch.setattr(writer_module, "_probe_in_thread", probe)
+    consumer, producer = _FakeConsumer(), _FakeProducer()
+
+    async def run():
+        writer = _writer(consumer=consumer, producer=producer)
+        _consume(writer, range(3))
+        await writer.flush()
+        while not writer.breaker.is_open:
+            await asyncio.sleep(0.001)
+        writer.apply_backpressure()
+        paused_while_open = consumer.paused()
+        await writer.breaker.wait_closed()
+        await writer.drain()
+        writer.apply_backpressure()
+        await writer.close()
+        return paused_while_open, writer
+
+    paused_while_open, writer = asyncio.run(run())
+    assert paused_while_open == {TP} and consumer.paused() == set()
+    assert len(attempts) == 3 and len(probes) == 2
+    assert producer.sent == []
+    assert writer.committed[TP] == 3
+
+def _lag() -> float:
+    return REGISTRY.get_sample_value("consumer_partition_lag", {"topic": TP.topic, "partition": str(TP.partition)})
+
+
+def test_lag_counts_from_log_start_until_the_first_commit(monkeypatch, fast_retries):
+    monkeypatch.setattr(writer_module, "_insert_in_thread", lambda batch, token: None)
+
+    async def run():
+        writer = _writer()
+        await writer.load_committed({TP})
+        writer.update_lag()
+        before = _lag()
+        _consume(writer, range(30))
+        await writer.flush()
+        await writer.drain()
+        writer.update_lag()
+        await writer.close()
+        return before, _lag()
+
+    assert asyncio.run(run()) == (100, 70)
+
+
+def test_end_to_end_latency_is_observed_per_message(monkeypatch, fast_retries):
+    monkeypatch.setattr(writer_module, "_insert_in_thread", lambda batch, token: None)
+
+    async def run():
+        writer = _writer()
+        _consume(writer, range(4))
+        await writer.flush()
+        await writer.drain()
+        await writer.close()
+
+    def sample(suffix):
+        return REGISTRY.get_sample_value(f"consumer_end_to_end_latency_seconds_{suffix}") or 0.0
+
+    before = sample("count"), sample("sum")
+    # Measured from the Kafka record timestamp (2023-11-14 in _message).
+    min_age = time.time() - 1_700_000_000
+    asyncio.run(run())
+    assert sample("count") - before[0] == 4
+    assert sample("sum") - before[1] >= 4 * min_age
@@ -0,0 +1,113 @@
+"""Unit tests for property filters (app.properties). Run from services/query-api:
+
+    cd services/query-api && python -m pytest ../../tests/unit/query_api
+"""
+import pytest
+
+from app import properties
+from app.config import settings
+from app.properties import filters_sql, normalize_filters, numeric_property_expr, property_expr
+
+
+@pytest.fixture(autouse=True)
+def mapping(monkeypatch):
+    monkeypatch.setattr(settings, "property_columns", {"*": {"utm_source": "utm_source"}, "proj_1": {}})
+    monkeypatch.setattr(settings, "properties_map", False)
+    monkeypatch.setattr(settings, "property_promotion_enabled", False)
+
+
+@pytest.mark.parametrize(
+    "value, text",
+    [
+        ("google", "google"),
+        (5, "5"),
+        (1.5, "1.5"),
+        (True, "true"),
+        (False, "false"),
+        ("ü", "ü"),
+    ],
+)
+def test_filter_values_are_serialized_like_stored_values(value, text):
+    [f] = normalize_filters([{"key": "k", "value": value}])
+    assert f == {"key": "k", "operator": "exact", "value": text}
+
+
+def test_value_is_optional_for_set_operators():
+    assert normalize_filters([{"key": "k", "operator": "is_set"}])[0]["value"] == ""
+
+
+@pytest.mark.parametrize(
+    "filters, message",
+    [
+        ("nope", "at most"),
+        ([{"key": "k"}] * 21, "at most"),
+        ([{"value": "v"}], "needs a key"),
+        ([{"key": "k", "operator": "like", "value": "v"}], "operator must be one of"),
+        ([{"key": "k", "value": None}], "needs a scalar value"),
+        ([{"key": "k", "operator": "is_not", "value": ["v"]}], "needs a scalar value"),
+        ([{"key": "k", "operator": "gt", "value": "x"}], "needs a numeric value"),
+        ([{"key": "k", "operator": "lt", "value": True}], "needs a numeric value"),
+    ],
+)
+def test_invalid_filters_are_rejected(filters, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_filters(filters)
+
+
+def test_mapped_property_reads_its_column():
+    assert property_expr("p", "utm_source", "k0") == ("utm_source", {})
+    # proj_1 has its own (empty) mapping, so "*" does not apply.
+    expr, params = property_expr("proj_1", "utm_source", "k0")
+    assert expr.startswith("if(JSONType(properties, {k0:String})") and params == {"k0": "utm_source"}
+
+
+def test_promoted_column_is_read_for_every_project(monkeypatch):
+    monkeypatch.setattr(settings, "property_promotion_enabled", True)
+    monkeypatch.setattr(properties, "_promoted", {"plan": "mat_plan"})
+    assert property_expr("proj_1", "plan", "k0") == ("mat_plan", {})
+
+
+def test_filters_sql_builds_parameterized_conditions():
+    filters = normalize_filters([
+        {"key": "utm_source", "value": "google"},
+        {"key": "plan", "operator": "is_not", "value": 2},
+        {"key": "n", "operator": "gt", "value": "1.5"},
+        {"key": "x", "operator": "is_not_set"},
+    ])
+    sql, params = filters_sql("p", filters)
+    assert sql.startswith(" AND utm_source = {prop_value_0:String} AND ifNull(if(JSONType(properties, {prop_key_1:String})")
+    assert " IN ('Int64', 'UInt64', 'Double'), JSONExtractFloat(properties, {prop_key_2:String}), NULL) > {prop_value_2:Float64}" in sql
+    assert sql.endswith("JSONExtractRaw(properties, {prop_key_3:String}))) IS NULL")
+    assert params == {
+        "prop_value_0": "google",
+        "prop_key_1": "plan",
+        "prop_value_1": "2",
+        "prop_key_2": "n",
+        "prop_value_2": 1.5,
+        "prop_key_3": "x",
+    }
+
+
+def test_map_columns_replace_json_extraction(monkeypatch):
+    monkeypatch.setattr(settings, "properties_map", True)
+    assert property_expr("p", "plan", "k0") == (
+        "if(mapContains(properties_map, {k0:String}), properties_map[{k0:String}], NULL)",
+        {"k0": "plan"},
+    )
+    assert numeric_property_expr("p", "n", "k1") == (
+        "if(mapContains(properties_num, {k1:String}), properties_num[{k1:String}], NULL)",
+        {"k1": "n"},
+    )
+    # Mapped columns still take precedence.
+    assert property_expr("p", "utm_source", "k0") == ("utm_source", {})
+    assert numeric_property_expr("p", "utm_source", "k0") == ("toFloat64OrNull(utm_source)", {})
+
+
+def test_filters_read_only_the_map_columns(monkeypatch):
+    monkeypatch.setattr(settings, "properties_map", True)
+    filters = normalize_filters([{"key": "plan", "value": True}, {"key": "n", "operator": "lt", "value": 3}])
+    sql, params = filters_sql("p", filters)
+    assert "JSONExtract" not in sql and "JSONType" not in sql
+    assert "properties_map[{prop_key_0:String}], NULL) = {prop_value_0:String}" in sql
+    assert "properties_num[{prop_key_1:String}], NULL) < {prop_value_1:Float64}" in sql
+    assert params == {"prop_key_0": "plan", "prop_value_0": "true", "prop_key_1": "n", "prop_value_1": 3.0}
@@ -0,0 +1,107 @@
+"""Unit tests for property usage counting (app.property_usage). Run from services/query-api:
+
+    cd services/query-api && python -m pytest ../../tests/unit/query_api
+"""
+import queue
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+import redis
+from prometheus_client import REGISTRY
+
+from app import property_usage
+from app.config import settings
+from app.logging_config import get_logger
+from app.property_usage import _day_key, _write_batch, record_usage, usage
+
+
+class _FakeRedis:
+    """Sorted sets in memory; pipeline commands run on execute()."""
+
+    def __init__(self, fail=False):
+        self.sets: dict[str, Counter] = {}
+        self.expires: dict[str, int] = {}
+        self.fail = fail
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, r: _FakeRedis):
+        self.r = r
+        self.ops = []
+
+    def zincrby(self, name, amount, member):
+        self.ops.append(lambda: self.r.sets.setdefault(name, Counter()).update({member: amount}))
+
+    def expire(self, name, seconds):
+        self.ops.append(lambda: self.r.expires.__setitem__(name, seconds))
+
+    def zrange(self, name, start, end, withscores=False):
+        self.ops.append(lambda: [(m, float(s)) for m, s in self.r.sets.get(name, Counter()).items()])
+
+    def execute(self):
+        if self.r.fail:
+            raise redis.ConnectionError("down")
+        return [op() for op in self.ops]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = _FakeRedis()
+    monkeypatch.setattr(property_usage, "_redis", r)
+    return r
+
+
+def _today() -> str:
+    return _day_key(datetime.now(timezone.utc))
+
+
+def test_ids_and_keys_with_any_characters_round_trip(fake_redis):
+    day = _today()
+    _write_batch(
+        [
+            (day, "org:1", frozenset({"utm:source", "$current_url"})),
+            (day, "org:1", frozenset({"utm:source"})),
+            (day, "p2", frozenset({"utm:source", '"quoted"'})),
+        ],
+        get_logger(),
+    )
+    assert usage(days=1) == {
+        "utm:source": Counter({"org:1": 2, "p2": 1}),
+        "$current_url": Counter({"org:1": 1}),
+        '"quoted"': Counter({"p2": 1}),
+    }
+    assert list(fake_redis.expires) == [day]
+
+
+def test_members_written_by_older_versions_are_still_counted(fake_redis):
+    fake_redis.sets[_today()] = Counter({"p1:plan": 3, '["p2","plan"]': 2, "no-separator": 1, "[broken": 1})
+    assert usage(days=1) == {"plan": Counter({"p1": 3, "p2": 2})}
+
+
+def test_redis_errors_drop_the_batch(fake_redis):
+    fake_redis.fail = True
+    counter = ("query_property_usage_dropped_total", {"reason": "redis_error"})
+    before = REGISTRY.get_sample_value(*counter) or 0.0
+    _write_batch([(_today(), "p", frozenset({"k"})), (_today(), "p", frozenset({"k"}))], get_logger())
+    assert REGISTRY.get_sample_value(*counter) - before == 2
+
+
+def test_record_usage_only_queues_and_drops_when_full(monkeypatch):
+    pending: queue.Queue = queue.Queue(maxsize=1)
+    monkeypatch.setattr(property_usage, "_pending", pending)
+    monkeypatch.setattr(property_usage, "_start_writer", lambda: None)
+    monkeypatch.setattr(settings, "property_promotion_enabled", False)
+    record_usage("p", ["k"])
+    assert pending.empty()
+
+    monkeypatch.setattr(settings, "property_promotion_enabled", True)
+    counter = ("query_property_usage_dropped_total", {"reason": "queue_full"})
+    before = REGISTRY.get_sample_value(*counter) or 0.0
+    record_usage("p", ["k", "k2"])
+    record_usage("p", ["k"])
+    assert pending.get_nowait() == (_today(), "p", frozenset({"k", "k2"}))
+    assert REGISTRY.get_sample_value(*counter) - before == 1
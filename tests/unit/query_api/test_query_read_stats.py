@@ -0,0 +1,98 @@
+"""Unit tests for per-query read stats (app.db.run_query) and the event projection DDL. Run from services/query-api:
+
+    cd services/query-api && python -m pytest ../../tests/unit/query_api
+"""
+import re
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+from structlog.testing import capture_logs
+
+from app.config import settings
+from app.db import run_query
+from app.insights import run_trend
+
+DDL = Path(__file__).resolve().parents[3] / "schemas" / "ddl"
+
+
+class _FakeClient:
+    def __init__(self, summary=None, rows=()):
+        self.summary = summary
+        self.rows = list(rows)
+        self.queries: list[tuple[str, dict, dict | None]] = []
+
+    def query(self, query, parameters=None, settings=None):
+        self.queries.append((query, parameters, settings))
+        return SimpleNamespace(result_rows=self.rows, summary=self.summary)
+
+
+@pytest.fixture(autouse=True)
+def read_stats(monkeypatch):
+    monkeypatch.setattr(settings, "read_stats_enabled", True)
+
+
+def _observed(query_type: str) -> tuple[float, float]:
+    labels = {"query_type": query_type}
+    return (
+        REGISTRY.get_sample_value("query_clickhouse_read_rows_sum", labels) or 0.0,
+        REGISTRY.get_sample_value("query_clickhouse_read_bytes_sum", labels) or 0.0,
+    )
+
+
+def test_read_stats_are_observed_and_logged():
+    client = _FakeClient(summary={"read_rows": "1200", "read_bytes": "48000"}, rows=[(1,), (2,)])
+    before = _observed("unit_stats")
+    with capture_logs() as logs:
+        run_query(client, "unit_stats", "SELECT 1", {"project_id": "p", "event": "$pageview"})
+    assert client.queries[0][2] == {"wait_end_of_query": 1}
+    after = _observed("unit_stats")
+    assert (after[0] - before[0], after[1] - before[1]) == (1200, 48000)
+    [line] = logs
+    assert line["event"] == "clickhouse_query"
+    assert {k: line[k] for k in ("query_type", "project_id", "analytics_event", "read_rows", "read_bytes", "result_rows")} == {
+        "query_type": "unit_stats",
+        "project_id": "p",
+        "analytics_event": "$pageview",
+        "read_rows": 1200,
+        "read_bytes": 48000,
+        "result_rows": 2,
+    }
+
+
+def test_missing_summary_counts_zero():
+    with capture_logs() as logs:
+        run_query(_FakeClient(summary=None), "unit_empty", "SELECT 1", {})
+    assert (logs[0]["read_rows"], logs[0]["project_id"], logs[0]["analytics_event"]) == (0, None, None)
+
+
+def test_disabled_sends_the_query_unchanged(monkeypatch):
+    monkeypatch.setattr(settings, "read_stats_enabled", False)
+    client = _FakeClient()
+    with capture_logs() as logs:
+        run_query(client, "unit_off", "SELECT 1", {"project_id": "p"})
+    assert client.queries == [("SELECT 1", {"project_id": "p"}, None)] and logs == []
+
+
+def test_trend_logs_its_project_and_event():
+    client = _FakeClient(summary={"read_rows": 10, "read_bytes": 100})
+    with capture_logs() as logs:
+        run_trend(client, "proj", "signup", date(2026, 1, 1), date(2026, 1, 2))
+    assert [(line["query_type"], line["project_id"], line["analytics_event"]) for line in logs] == [("trend", "proj", "signup")]
+
+
+def _normalized(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql)
+
+
+def test_migration_matches_the_table_definition():
+    table = _normalized((DDL / "clickhouse_events.sql").read_text())
+    migration = _normalized((DDL / "clickhouse_events_migrate_event_projection.sql").read_text())
+    assert "INDEX event_idx event TYPE bloom_filter(0.01) GRANULARITY 4" in table
+    assert "ADD INDEX IF NOT EXISTS event_idx event TYPE bloom_filter(0.01) GRANULARITY 4" in migration
+    projection = "PROJECTION events_by_event ( SELECT project_id, event, timestamp, distinct_id ORDER BY project_id, event, timestamp )"
+    assert projection in table
+    assert "ADD " + projection.replace("PROJECTION", "PROJECTION IF NOT EXISTS") in migration
+    assert "MATERIALIZE INDEX event_idx" in migration and "MATERIALIZE PROJECTION events_by_event" in migration
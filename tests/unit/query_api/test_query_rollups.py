@@ -0,0 +1,119 @@
+"""Unit tests for trend planning over rollups (app.rollups). Run from services/query-api:
+
+    cd services/query-api && python -m pytest ../../tests/unit/query_api
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.rollups import plan, trend_query
+
+START = datetime(2026, 1, 1, 10, 30)
+END = datetime(2026, 1, 4, 5, 15)
+
+
+def _covers(parts, start, end) -> bool:
+    """Parts are contiguous, non-empty and span exactly [start, end)."""
+    return (
+        parts[0][1] == start
+        and parts[-1][2] == end
+        and all(a[2] == b[1] for a, b in zip(parts, parts[1:]))
+        and all(p[1] < p[2] for p in parts)
+    )
+
+
+def _aligned(source: str, ts: datetime) -> bool:
+    if source == "daily":
+        return ts == ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if source == "hourly":
+        return ts == ts.replace(minute=0, second=0, microsecond=0)
+    return True
+
+
+@pytest.fixture(autouse=True)
+def rollups_on(monkeypatch):
+    monkeypatch.setattr(settings, "rollups_enabled", True)
+
+
+def test_day_interval_uses_days_then_hours_then_raw_edges():
+    assert plan(START, END, "day") == [
+        ("raw", START, datetime(2026, 1, 1, 11)),
+        ("hourly", datetime(2026, 1, 1, 11), datetime(2026, 1, 2)),
+        ("daily", datetime(2026, 1, 2), datetime(2026, 1, 4)),
+        ("hourly", datetime(2026, 1, 4), datetime(2026, 1, 4, 5)),
+        ("raw", datetime(2026, 1, 4, 5), END),
+    ]
+
+
+def test_hour_interval_never_uses_daily_rollups():
+    assert plan(START, END, "hour") == [
+        ("raw", START, datetime(2026, 1, 1, 11)),
+        ("hourly", datetime(2026, 1, 1, 11), datetime(2026, 1, 4, 5)),
+        ("raw", datetime(2026, 1, 4, 5), END),
+    ]
+
+
+def test_aligned_range_has_no_raw_parts():
+    assert plan(datetime(2026, 1, 1), datetime(2026, 1, 8), "week") == [
+        ("daily", datetime(2026, 1, 1), datetime(2026, 1, 8)),
+    ]
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (datetime(2026, 1, 1, 10, 5), datetime(2026, 1, 1, 10, 55)),
+        (datetime(2026, 1, 1, 10, 5), datetime(2026, 1, 1, 11, 55)),
+    ],
+)
+def test_ranges_without_a_whole_hour_are_raw(start, end):
+    assert plan(start, end, "day") == [("raw", start, end)]
+
+
+def test_filters_or_disabled_rollups_read_raw_events(monkeypatch):
+    assert plan(START, END, "day", raw_only=True) == [("raw", START, END)]
+    monkeypatch.setattr(settings, "rollups_enabled", False)
+    assert plan(START, END, "day") == [("raw", START, END)]
+
+
+@pytest.mark.parametrize("interval", ["hour", "day", "week", "month"])
+def test_random_ranges_are_split_exactly(interval):
+    rng = random.Random(interval)
+    base = datetime(2026, 1, 1)
+    for _ in range(500):
+        start = base + timedelta(seconds=rng.randrange(0, 40 * 86400))
+        end = start + timedelta(seconds=rng.randrange(1, 20 * 86400))
+        parts = plan(start, end, interval)
+        assert _covers(parts, start, end)
+        for source, part_start, part_end in parts:
+            assert _aligned(source, part_start) and _aligned(source, part_end)
+            assert not (interval == "hour" and source == "daily")
+
+
+def test_trend_query_reads_each_part_with_its_own_range():
+    parts = plan(START, END, "day")
+    q, params = trend_query(parts, "day", "total", raw_where=" AND x = 1")
+    assert params == {
+        "from_0": "2026-01-01 10:30:00", "to_0": "2026-01-01 11:00:00",
+        "from_1": "2026-01-01 11:00:00", "to_1": "2026-01-02 00:00:00",
+        "from_2": "2026-01-02", "to_2": "2026-01-04",
+        "from_3": "2026-01-04 00:00:00", "to_3": "2026-01-04 05:00:00",
+        "from_4": "2026-01-04 05:00:00", "to_4": "2026-01-04 05:15:00",
+    }
+    selects = q.split("UNION ALL")
+    assert len(selects) == 5
+    assert [".events " in s for s in selects] == [True, False, False, False, True]
+    assert [" AND x = 1" in s for s in selects] == [True, False, False, False, True]
+    assert "events_daily " in selects[2] and "sum(count)" in selects[2]
+    assert "sum(v) AS value" in q
+
+
+def test_unique_users_merge_states_across_parts():
+    q, _ = trend_query(plan(START, END, "day"), "day", "unique_users")
+    selects = q.split("UNION ALL")
+    assert "uniqState(distinct_id)" in selects[0] and ".events " in selects[0]
+    assert "events_hourly_users" in selects[1] and "uniqMergeState(users)" in selects[1]
+    assert "events_daily_users" in selects[2]
+    assert "uniqMerge(v) AS value" in q